@@ -0,0 +1,171 @@
+"""
+Class score analytics on NumPy.
+
+ClassAnalytics loads one class/term once, from the cached ClassScoreMatrix
+plus the class's student ids, into a students x records float matrix with
+NaN where no score was entered. Every statistic is then computed for all
+records (or subjects) at once, column-wise, instead of looping over
+StudentRecords in views and template filters.
+"""
+import warnings
+
+import numpy as np
+
+from .models import PASS_MARK, Student
+from .service import ClassScoreMatrix
+
+HISTOGRAM_BINS = ((0, 25), (25, 50), (50, 75), (75, 100))
+
+
+def describe_columns(scores, totals):
+    """
+    Statistics for each column of `scores` (2-D, NaN = missing), each out
+    of the matching entry of `totals`. Returns one dict per column; the
+    score statistics are None for a column with nothing entered.
+    """
+    scores = np.asarray(scores, dtype=float)
+    totals = np.asarray(totals, dtype=float)
+    entered = ~np.isnan(scores)
+    counts = entered.sum(axis=0)
+
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        # all-NaN columns: "Mean of empty slice" etc.; they come out as NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(scores, axis=0)
+        median = np.nanmedian(scores, axis=0)
+        std = np.nanstd(scores, axis=0)
+        low = np.nanmin(scores, axis=0) if scores.size else mean
+        high = np.nanmax(scores, axis=0) if scores.size else mean
+        p25, p75, p90 = np.nanpercentile(scores, [25, 75, 90], axis=0) if scores.size else (mean, mean, mean)
+        percent = np.where(totals > 0, scores / totals * 100, np.nan)
+
+    passed = (percent >= PASS_MARK).sum(axis=0)
+    failed = (percent < PASS_MARK).sum(axis=0)
+    below_average = (scores < mean).sum(axis=0)
+    histogram = [
+        ((percent >= lo) & ((percent < hi) if hi < 100 else (percent <= hi))).sum(axis=0)
+        for lo, hi in HISTOGRAM_BINS
+    ]
+
+    def value(array, i, digits=2):
+        return None if np.isnan(array[i]) else round(float(array[i]), digits)
+
+    columns = []
+    for i in range(scores.shape[1]):
+        n = int(counts[i])
+        columns.append({
+            'entered': n,
+            'missing': scores.shape[0] - n,
+            'total_score': float(totals[i]),
+            'mean': value(mean, i),
+            'median': value(median, i),
+            'std': value(std, i),
+            'min': value(low, i),
+            'max': value(high, i),
+            'p25': value(p25, i),
+            'p75': value(p75, i),
+            'p90': value(p90, i),
+            'mean_percent': round(float(mean[i]) / totals[i] * 100, 1) if n and totals[i] else None,
+            'passed': int(passed[i]),
+            'failed': int(failed[i]),
+            'pass_rate': round(int(passed[i]) / n * 100, 1) if n else None,
+            'fail_rate': round(int(failed[i]) / n * 100, 1) if n else None,
+            'below_average': int(below_average[i]),
+            'histogram': [
+                {'label': f"{lo}-{hi}%", 'count': int(counts_in_bin[i]),
+                 'share': round(int(counts_in_bin[i]) / n * 100, 1) if n else 0}
+                for (lo, hi), counts_in_bin in zip(HISTOGRAM_BINS, histogram)
+            ],
+        })
+    return columns
+
+
+def describe(scores, total):
+    """describe_columns for a single list of scores out of `total`."""
+    column = np.asarray(scores, dtype=float).reshape(-1, 1)
+    return describe_columns(column, [total])[0]
+
+
+class ClassAnalytics:
+    """
+    A class/term as a NumPy matrix: one row per student in the class, one
+    column per record shown in reports (ClassScoreMatrix's records).
+    """
+
+    def __init__(self, student_ids, subjects, records, scores):
+        self.student_ids = student_ids      # row order
+        self.subjects = subjects            # [(subject_teacher_id, name), ...]
+        self.records = records              # column order: dicts from ClassScoreMatrix, plus 'subject_id'
+        self.scores = scores                # students x records, NaN = not entered
+        self.totals = np.array([rec['total_score'] for rec in records], dtype=float)
+
+    @classmethod
+    def load(cls, class_obj, term):
+        """One query for the student ids; the scores come from the cached ClassScoreMatrix."""
+        matrix = ClassScoreMatrix.load(class_obj, term)
+        student_ids = list(
+            Student.objects.filter(class_name=class_obj).order_by('id').values_list('id', flat=True)
+        )
+        records = [
+            dict(rec, subject_id=st_id)
+            for st_id, _ in matrix.subjects
+            for rec in matrix.records.get(st_id, [])
+        ]
+
+        rows = {student_id: i for i, student_id in enumerate(student_ids)}
+        columns = {rec['id']: j for j, rec in enumerate(records)}
+        scores = np.full((len(student_ids), len(records)), np.nan)
+        for (student_id, record_id), score in matrix.scores.items():
+            if student_id in rows and record_id in columns:
+                scores[rows[student_id], columns[record_id]] = score
+        return cls(student_ids, matrix.subjects, records, scores)
+
+    def record_stats(self):
+        """describe_columns for every record, with the record's own fields merged in."""
+        subject_names = dict(self.subjects)
+        return [
+            dict(stats, record=rec, subject=subject_names.get(rec['subject_id']))
+            for rec, stats in zip(self.records, describe_columns(self.scores, self.totals))
+        ]
+
+    def subject_totals(self):
+        """
+        (students x subjects obtained, obtainable per subject): each
+        student's sum over the subject's records counted in totals, missing
+        scores as 0. NaN for a student with no score at all in the subject.
+        """
+        subject_ids = [st_id for st_id, _ in self.subjects]
+        column_of = {st_id: k for k, st_id in enumerate(subject_ids)}
+        membership = np.zeros((len(self.records), len(subject_ids)))
+        counted = np.zeros_like(membership)
+        for j, rec in enumerate(self.records):
+            k = column_of[rec['subject_id']]
+            membership[j, k] = 1
+            counted[j, k] = 1 if rec['include_in_total'] else 0
+
+        entered = ~np.isnan(self.scores)
+        obtained = np.nan_to_num(self.scores) @ counted
+        obtained[(entered @ membership) == 0] = np.nan
+        return obtained, self.totals @ counted
+
+    def subject_stats(self):
+        """describe_columns over each student's subject total."""
+        obtained, obtainable = self.subject_totals()
+        return [
+            dict(stats, subject=name, subject_teacher_id=st_id)
+            for (st_id, name), stats in zip(self.subjects, describe_columns(obtained, obtainable))
+        ]
+
+    def overall_percentages(self):
+        """
+        Each student's percentage over every counted record of the term,
+        missing scores as 0 (as on the report card); NaN for a student with
+        no scores this term.
+        """
+        obtained, obtainable = self.subject_totals()
+        total = obtainable.sum()
+        percent = np.full(len(self.student_ids), np.nan)
+        if total:
+            scored = ~np.isnan(self.scores).all(axis=1)
+            percent[scored] = np.nansum(obtained[scored], axis=1) / total * 100
+        return percent
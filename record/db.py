@@ -0,0 +1,36 @@
+"""Database helpers shared by the bulk write paths."""
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+
+def is_busy_error(error):
+    message = str(error).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def retry_on_busy(func):
+    """
+    Retry `func` when SQLite reports the database as locked, with jittered
+    exponential backoff (50ms, 100ms, 200ms... capped at 2s), up to
+    DB_BUSY_RETRIES extra attempts.
+
+    Only the outermost write is retried: inside someone else's
+    transaction.atomic() block the error is re-raised, because the whole
+    enclosing transaction has to be rolled back and re-run, not one step
+    of it. `func` must be safe to run again (the bulk upserts are).
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'DB_BUSY_RETRIES', 5)
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == retries or not is_busy_error(e) or connection.in_atomic_block:
+                    raise
+                time.sleep(min(2.0, 0.05 * 2 ** attempt) * (0.5 + random.random()))
+    return wrapper
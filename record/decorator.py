@@ -1,3 +1,10 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
 from django.http import HttpResponse
 from django.shortcuts import redirect
 from .models import User
@@ -23,14 +30,143 @@ def _redirect_to_login(request):
     return redirect(login_url)
 
 
+class TokenCache:
+    """
+    Verified auth tokens -> a snapshot of the user's row, so a request whose
+    token was checked a moment ago (HTMX fires several partials per click)
+    skips both the User query and the HMAC check.
+
+    Entries live for AUTH_TOKEN_CACHE_TTL seconds (0 turns the cache off)
+    and never past the token's own expiry. By default they're held in
+    process memory, at most AUTH_TOKEN_CACHE_MAX_ENTRIES of them: each set
+    drops expired entries from the least recently used end, then the least
+    recently used ones until the cache fits. With AUTH_TOKEN_CACHE_SHARED = True they go in the
+    Django cache instead, so every worker sees an invalidation at once
+    (an in-process entry in another worker can otherwise be up to one TTL
+    stale). Saving or deleting a User drops their entries (signals.py), as
+    does logging out.
+    """
+
+    _local = OrderedDict()  # token key -> (expires_at, field values, user id), least recently used first
+    _by_user = {}           # user id -> {token key, ...}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def ttl():
+        return getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 30)
+
+    @staticmethod
+    def max_entries():
+        return getattr(settings, 'AUTH_TOKEN_CACHE_MAX_ENTRIES', 10000)
+
+    @staticmethod
+    def shared():
+        return getattr(settings, 'AUTH_TOKEN_CACHE_SHARED', False)
+
+    @staticmethod
+    def key(token):
+        # Never keep raw tokens around as cache keys.
+        return "auth-token:" + hashlib.sha256(token.encode()).hexdigest()
+
+    @staticmethod
+    def _user_index_key(user_id):
+        return f"auth-token-user:{user_id}"
+
+    @classmethod
+    def get(cls, token):
+        """A fresh User instance for a recently verified token, or None."""
+        if cls.ttl() <= 0:
+            return None
+        key = cls.key(token)
+        if cls.shared():
+            entry = cache.get(key)
+        else:
+            with cls._lock:
+                entry = cls._local.get(key)
+                if entry is not None:
+                    cls._local.move_to_end(key)
+        if entry is None:
+            return None
+        expires_at, values = entry[:2]
+        if expires_at <= time.time():
+            cls._forget(key)
+            return None
+        # A new instance per request: views that change request.user can't
+        # leak into other requests through the cache.
+        return User.from_db('default', [f.attname for f in User._meta.concrete_fields], values)
+
+    @classmethod
+    def set(cls, token, user, token_expires_at):
+        ttl = cls.ttl()
+        if ttl <= 0:
+            return
+        expires_at = min(time.time() + ttl, token_expires_at)
+        values = [getattr(user, f.attname) for f in User._meta.concrete_fields]
+        key = cls.key(token)
+        if cls.shared():
+            index_key = cls._user_index_key(user.id)
+            cache.set(key, (expires_at, values), ttl)
+            cache.set(index_key, (cache.get(index_key) or set()) | {key}, ttl)
+        else:
+            with cls._lock:
+                cls._local[key] = (expires_at, values, user.id)
+                cls._local.move_to_end(key)
+                cls._by_user.setdefault(user.id, set()).add(key)
+                now = time.time()
+                while cls._local:
+                    oldest, (oldest_expires_at, _, _) = next(iter(cls._local.items()))
+                    if len(cls._local) <= cls.max_entries() and oldest_expires_at > now:
+                        break
+                    cls._drop(oldest)
+
+    @classmethod
+    def _drop(cls, key):
+        # Caller holds _lock.
+        entry = cls._local.pop(key, None)
+        if entry is not None:
+            keys = cls._by_user.get(entry[2])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del cls._by_user[entry[2]]
+
+    @classmethod
+    def _forget(cls, key):
+        if cls.shared():
+            cache.delete(key)
+        else:
+            with cls._lock:
+                cls._drop(key)
+
+    @classmethod
+    def invalidate_token(cls, token):
+        cls._forget(cls.key(token))
+
+    @classmethod
+    def invalidate_user(cls, user_id):
+        """Drop every cached token of this user (their row or secret_key changed)."""
+        index_key = cls._user_index_key(user_id)
+        keys = cache.get(index_key) or set()
+        if keys:
+            cache.delete_many(list(keys) + [index_key])
+        with cls._lock:
+            for key in cls._by_user.pop(user_id, set()):
+                cls._local.pop(key, None)
+
+
 def login_require(view_func):
     def wrapper(request, *args, **kwargs):
         auth_token = request.COOKIES.get("auth_token")
         if not auth_token:
             return _redirect_to_login(request)
 
+        user = TokenCache.get(auth_token)
+        if user is not None:
+            request.user = user
+            return view_func(request, *args, **kwargs)
+
         try:
-            # Unsigned later in verify_token
+            # Unsigned later in token_expiry
             parts = auth_token.split(":")
             user_id = parts[0]  # Works now since token = "1234:uuid:signature"
         except:
@@ -38,11 +174,30 @@ def login_require(view_func):
 
         try:
             user = User.objects.get(id=user_id)
-            if user.verify_token(auth_token):
-                request.user = user
-                return view_func(request, *args, **kwargs)
-        except User.DoesNotExist:
+        except (User.DoesNotExist, ValueError):
             return _redirect_to_login(request)
 
+        expires_at = user.token_expiry(auth_token)
+        if expires_at is not None:
+            TokenCache.set(auth_token, user, expires_at)
+            request.user = user
+            return view_func(request, *args, **kwargs)
+
         return _redirect_to_login(request)
     return wrapper
+
+
+def query_budget(max_queries):
+    """
+    Declare how many queries a view may make per request, counting the
+    User lookup when the auth token isn't cached. QueryStatsMiddleware logs
+    a warning when a live request goes over; QueryBudgetTests (tests.py)
+    fails when a view goes over on its synthetic school.
+
+    Put it above @login_require, which doesn't copy attributes onto its
+    wrapper.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
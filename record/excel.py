@@ -1,10 +1,162 @@
+import tempfile
+
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.utils import get_column_letter
-from openpyxl.styles import Font, Alignment, Border, Side
-from django.http import HttpResponse
+from openpyxl.styles import Font, Alignment, Border, Side, NamedStyle
+from django.http import HttpResponse, FileResponse
+from django.shortcuts import get_object_or_404
 from .models import Subject, Class, Record, StudentRecord, Student
-from .report import Report
+from .report_engine import ReportEngine
+from .service import ClassScoreMatrix, ReportCardService
+from .decorator import login_require, query_budget
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+_thin = Side(style='thin')
+_border = Border(left=_thin, right=_thin, top=_thin, bottom=_thin)
+
+# Registered once per workbook and referenced by name from every cell, so
+# the file carries three shared styles instead of a Font/Border/Alignment
+# per cell.
+REPORT_STYLES = (
+    NamedStyle(name='report_header', font=Font(bold=True), border=_border,
+               alignment=Alignment(wrap_text=True, horizontal='center', vertical='center')),
+    NamedStyle(name='report_score', border=_border,
+               alignment=Alignment(horizontal='center', vertical='center')),
+    NamedStyle(name='report_name', border=_border),
+)
+
+
+def new_report_workbook():
+    """A write-only workbook with the shared report styles registered."""
+    wb = Workbook(write_only=True)
+    for style in REPORT_STYLES:
+        wb.add_named_style(style)
+    return wb
+
+
+def styled_cell(ws, value, style):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.style = style
+    return cell
+
+
+def workbook_response(wb, filename):
+    """
+    Save the workbook to a temporary file and stream it back in chunks.
+    Write-only sheets already spool their rows to disk as they're
+    appended, so the finished file never has to sit in worker memory.
+    """
+    tmp = tempfile.TemporaryFile()
+    wb.save(tmp)
+    tmp.seek(0)
+    return FileResponse(tmp, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+def _term_columns(header_data, terms):
+    """Column span of each term block: its records plus the two totals columns."""
+    term_columns = {}
+    for term_name in terms:
+        term_records = header_data.get('term_headers', {}).get(term_name, [])
+        term_columns[term_name] = {
+            'record_count': len(term_records),
+            'totals_count': 2 if header_data.get('term_totals') else 0,
+        }
+    return term_columns
+
+
+def _write_header(ws, header_data, terms, term_columns, total_columns):
+    """Append both header rows and merge the group headings across them."""
+    row1 = [None] * total_columns
+    row2 = [None] * total_columns
+    merges = []
+
+    row1[0] = "S/N"
+    merges.append((1, 1, 2, 1))
+    row1[1] = "Student"
+    merges.append((1, 2, 2, 2))
+
+    col = 3
+    for term_name in terms:
+        term_info = term_columns[term_name]
+        if term_info['record_count'] > 0:
+            row1[col - 1] = term_name
+            if term_info['record_count'] > 1:
+                merges.append((1, col, 1, col + term_info['record_count'] - 1))
+            for rec in header_data.get('term_headers', {}).get(term_name, []):
+                row2[col - 1] = f"{rec['type']} {rec['number']}"
+                col += 1
+
+        if header_data.get('term_totals') and term_info['totals_count'] > 0:
+            row1[col - 1] = f"{term_name} Totals"
+            merges.append((1, col, 1, col + term_info['totals_count'] - 1))
+            row2[col - 1] = "Test Total"
+            row2[col] = "Term Total"
+            col += term_info['totals_count']
+
+    row1[col - 1] = "Total Score"
+    merges.append((1, col, 2, col))
+    row1[col] = "Percentage"
+    merges.append((1, col + 1, 2, col + 1))
+
+    for row in (row1, row2):
+        ws.append([styled_cell(ws, value, 'report_header') for value in row])
+    for start_row, start_col, end_row, end_col in merges:
+        ws.merged_cells.add(
+            f"{get_column_letter(start_col)}{start_row}:{get_column_letter(end_col)}{end_row}"
+        )
+
+
+def _student_row(ws, idx, student, terms, header_data):
+    cells = [
+        styled_cell(ws, idx, 'report_score'),
+        styled_cell(ws, f"{student.get('name','')} ({student.get('class_name','')})", 'report_name'),
+    ]
+    for term_name in terms:
+        for rec in student.get('record_by_term', {}).get(term_name, []):
+            score_value = rec['score'] if rec.get('score') not in ('-', None) else None
+            cells.append(styled_cell(ws, score_value, 'report_score'))
+
+        if header_data.get('term_totals') and 'term_totals' in student:
+            term_data = student['term_totals'].get(term_name, {})
+            cells.append(styled_cell(ws, term_data.get('test_total', 0), 'report_score'))
+            cells.append(styled_cell(ws, term_data.get('total_score', 0), 'report_score'))
+
+    cells.append(styled_cell(ws, student.get('total_score', 0), 'report_score'))
+    cells.append(styled_cell(ws, f"{student.get('percentage', 0)}%", 'report_score'))
+    return cells
+
 
+@ReportEngine.output('excel')
+def report_workbook(engine):
+    """The subject report as a write-only workbook: one sheet, two header rows."""
+    if not engine.rows:
+        raise ValueError("No data available for export")
+    header_data, terms = engine.header, engine.terms
+
+    # columns 1=S/N, 2=Student, then the term blocks, then Total + Percentage
+    term_columns  = _term_columns(header_data, terms)
+    total_columns = 2 + sum(t['record_count'] + t['totals_count'] for t in term_columns.values()) + 2
+
+    wb = new_report_workbook()
+    ws = wb.create_sheet("Student Report")
+
+    # Widths and frozen panes must be set before the first row is written
+    ws.column_dimensions['A'].width = 8
+    ws.column_dimensions['B'].width = 25
+    for col_num in range(3, total_columns + 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = 12
+    ws.freeze_panes = 'C3'
+
+    _write_header(ws, header_data, terms, term_columns, total_columns)
+    for idx, student in enumerate(engine.rows, start=1):
+        ws.append(_student_row(ws, idx, student, terms, header_data))
+    return wb
+
+
+@query_budget(5)
+@login_require
 def export_report_excel(request):
     subject_id = request.GET.get('subject')
     class_name = request.GET.get('class')
@@ -13,179 +165,138 @@ def export_report_excel(request):
     sort_order = request.GET.get('sort', 'asc')
 
     try:
-        # ── Get report data (returns a dict, not a tuple) ──────────────────
-        result = Report.generate_report(subject_id, class_name, batch, term, sort_order)
-
-        if not result.get('success'):
-            raise ValueError(result.get('error', 'Report generation failed'))
-
-        total_report  = result.get('total_report')
-        subject_model = result.get('subject')
-        terms         = result.get('terms') or []
-        term          = result.get('term')   # may be None for "All"
-
-        if not total_report or len(total_report) < 2:
-            raise ValueError("No data available for export")
-
-        # First item is the header structure, rest are student rows
-        header_data   = total_report[0]
-        students_data = total_report[1:]
-
-        # ── Build workbook ──────────────────────────────────────────────────
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Student Report"
-
-        bold_font        = Font(bold=True)
-        center_alignment = Alignment(horizontal='center', vertical='center')
-        wrap_alignment   = Alignment(wrap_text=True, horizontal='center', vertical='center')
-        border = Border(
-            left=Side(style='thin'), right=Side(style='thin'),
-            top=Side(style='thin'),  bottom=Side(style='thin')
-        )
+        engine = ReportEngine(subject_id, class_name, batch, term, sort_order, user=request.user)
+        wb = engine.render('excel')
 
-        # ── Calculate column structure ──────────────────────────────────────
-        col_position = 3  # columns 1=S/N, 2=Student, then terms start at 3
-
-        term_columns = {}
-        for term_name in terms:
-            term_records  = header_data.get('term_headers', {}).get(term_name, [])
-            record_count  = len(term_records)
-            totals_count  = 2 if header_data.get('term_totals') else 0
-
-            term_columns[term_name] = {
-                'start_col':   col_position,
-                'record_count': record_count,
-                'totals_count': totals_count,
-                'total_cols':   record_count + totals_count,
-            }
-            col_position += record_count + totals_count
-
-        # +2 for Total Score and Percentage at the end
-        total_columns = col_position + 1
-
-        # ── Header Row 1: Term group headers ───────────────────────────────
-        row = 1
-        col = 1
-
-        ws.cell(row=row, column=col, value="S/N")
-        ws.merge_cells(start_row=row, start_column=col, end_row=row+1, end_column=col)
-        col += 1
-
-        ws.cell(row=row, column=col, value="Student")
-        ws.merge_cells(start_row=row, start_column=col, end_row=row+1, end_column=col)
-        col += 1
-
-        for term_name in terms:
-            term_info = term_columns[term_name]
-            if term_info['record_count'] > 0:
-                ws.cell(row=row, column=col, value=term_name)
-                span = term_info['record_count']
-                if span > 1:
-                    ws.merge_cells(start_row=row, start_column=col,
-                                   end_row=row, end_column=col + span - 1)
-                col += span
-
-            if header_data.get('term_totals') and term_info['totals_count'] > 0:
-                ws.cell(row=row, column=col, value=f"{term_name} Totals")
-                if term_info['totals_count'] > 1:
-                    ws.merge_cells(start_row=row, start_column=col,
-                                   end_row=row, end_column=col + term_info['totals_count'] - 1)
-                col += term_info['totals_count']
-
-        ws.cell(row=row, column=col, value="Total Score")
-        ws.merge_cells(start_row=row, start_column=col, end_row=row+1, end_column=col)
-        col += 1
-
-        ws.cell(row=row, column=col, value="Percentage")
-        ws.merge_cells(start_row=row, start_column=col, end_row=row+1, end_column=col)
-
-        # ── Header Row 2: Individual assessment sub-headers ─────────────────
-        row = 2
-        col = 3
-
-        for term_name in terms:
-            term_records = header_data.get('term_headers', {}).get(term_name, [])
-            for rec in term_records:
-                ws.cell(row=row, column=col, value=f"{rec['type']} {rec['number']}")
-                col += 1
+        batch_text   = batch if batch and batch != "All" else "All_Batches"
+        term_text    = engine.term or "All_Terms"
+        subject_name = engine.subject.name if engine.subject else "Report"
+        filename     = f"{class_name}_{batch_text}_{subject_name}_{term_text}_Report.xlsx"
 
-            if header_data.get('term_totals'):
-                ws.cell(row=row, column=col, value="Test Total");  col += 1
-                ws.cell(row=row, column=col, value="Term Total");  col += 1
-
-        # ── Style both header rows ──────────────────────────────────────────
-        for row_num in [1, 2]:
-            for col_num in range(1, total_columns + 1):
-                cell = ws.cell(row=row_num, column=col_num)
-                cell.font      = bold_font
-                cell.alignment = wrap_alignment
-                cell.border    = border
-
-        # ── Data rows ──────────────────────────────────────────────────────
-        for idx, student in enumerate(students_data, start=1):
-            row += 1
-            col  = 1
-
-            # S/N
-            cell = ws.cell(row=row, column=col, value=idx)
-            cell.alignment = center_alignment
-            cell.border    = border
-            col += 1
-
-            # Student name + batch
-            cell = ws.cell(row=row, column=col,
-                           value=f"{student.get('name','')} ({student.get('class_name','')})")
-            cell.border = border
-            col += 1
-
-            # Scores per term
-            for term_name in terms:
-                term_records = student.get('record_by_term', {}).get(term_name, [])
-                for rec in term_records:
-                    score_value = rec['score'] if rec.get('score') not in ('-', None) else None
-                    cell = ws.cell(row=row, column=col, value=score_value)
-                    cell.alignment = center_alignment
-                    cell.border    = border
-                    col += 1
-
-                if header_data.get('term_totals') and 'term_totals' in student:
-                    term_data = student['term_totals'].get(term_name, {})
-                    cell = ws.cell(row=row, column=col, value=term_data.get('test_total', 0))
-                    cell.alignment = center_alignment; cell.border = border; col += 1
-
-                    cell = ws.cell(row=row, column=col, value=term_data.get('total_score', 0))
-                    cell.alignment = center_alignment; cell.border = border; col += 1
-
-            # Total score
-            cell = ws.cell(row=row, column=col, value=student.get('total_score', 0))
-            cell.alignment = center_alignment; cell.border = border; col += 1
-
-            # Percentage
-            cell = ws.cell(row=row, column=col, value=f"{student.get('percentage', 0)}%")
-            cell.alignment = center_alignment; cell.border = border
-
-        # ── Column widths ───────────────────────────────────────────────────
-        ws.column_dimensions['A'].width = 8
-        ws.column_dimensions['B'].width = 25
-        for col_num in range(3, total_columns + 1):
-            ws.column_dimensions[get_column_letter(col_num)].width = 12
+        return workbook_response(wb, filename)
 
-        # ── Freeze S/N + Student columns and both header rows ───────────────
-        ws.freeze_panes = 'C3'
+    except ValueError as e:
+        # Invalid input or nothing to export; anything else is a server error.
+        return HttpResponse(f"Error generating Excel report: {str(e)}", status=400)
 
-        # ── Build response ──────────────────────────────────────────────────
-        response = HttpResponse(
-            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
-        batch_text   = batch if batch and batch != "All" else "All_Batches"
-        term_text    = term  if term  else "All_Terms"
-        subject_name = subject_model.name if subject_model else "Report"
-        filename     = f"{class_name}_{batch_text}_{subject_name}_{term_text}_Report.xlsx"
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
 
-        wb.save(response)
-        return response
+# ═══════════════════════════════════════════════════════════════
+# Class broadsheet
+# ═══════════════════════════════════════════════════════════════
+
+_INVALID_TITLE_CHARS = str.maketrans({c: ' ' for c in '[]:*?/\\'})
+
+
+def _sheet_title(name, used):
+    """Excel sheet names: max 31 chars, no []:*?/\\, unique within the workbook."""
+    base = (name.translate(_INVALID_TITLE_CHARS).strip() or "Subject")[:31]
+    title, n = base, 2
+    while title.lower() in used:
+        suffix = f" ({n})"
+        title = base[:31 - len(suffix)] + suffix
+        n += 1
+    used.add(title.lower())
+    return title
+
 
-    except Exception as e:
-        return HttpResponse(f"Error generating Excel report: {str(e)}", status=500)
+def _percent(obtained, obtainable):
+    return round(obtained / obtainable * 100, 1) if obtainable else 0
+
+
+def build_broadsheet(class_obj, term, students):
+    """
+    The whole class/term broadsheet as a write-only workbook: a summary
+    sheet (every subject's total per student, grand total, percentage and
+    class position) followed by one sheet per subject with each record's
+    score, CA/exam split, remark and subject position.
+
+    Everything comes from one pass over the class's ClassScoreMatrix, so
+    the number of queries doesn't grow with the number of subjects.
+    """
+    matrix = ClassScoreMatrix.load(class_obj, term)
+    breakdown = {student.id: matrix.subjects_data(student.id) for student in students}
+
+    def obtainable(st_id):
+        return sum(rec['total_score'] for rec in matrix.records.get(st_id, []) if rec['include_in_total'])
+
+    total_available = sum(obtainable(st_id) for st_id, _ in matrix.subjects)
+    overall = ReportCardService.rank_totals(
+        [(sid, sum(subject['obtained'] for subject in data)) for sid, data in breakdown.items()],
+        total_available,
+    )
+    by_subject = [
+        ReportCardService.rank_totals(
+            [(sid, data[i]['obtained']) for sid, data in breakdown.items()], obtainable(st_id)
+        )
+        for i, (st_id, _) in enumerate(matrix.subjects)
+    ]
+
+    wb = new_report_workbook()
+    used_titles = set()
+
+    # ── Summary ─────────────────────────────────────────────────────────
+    ws = wb.create_sheet(_sheet_title("Summary", used_titles))
+    header = (["S/N", "Student", "Adm. No"] + [name for _, name in matrix.subjects]
+              + [f"Total (/{total_available})", "Percentage", "Position"])
+    ws.column_dimensions['A'].width = 6
+    ws.column_dimensions['B'].width = 28
+    for col_num in range(3, len(header) + 1):
+        ws.column_dimensions[get_column_letter(col_num)].width = 12
+    ws.freeze_panes = 'C2'
+    ws.append([styled_cell(ws, value, 'report_header') for value in header])
+
+    for idx, student in enumerate(students, start=1):
+        pdata = overall[student.id]
+        ws.append(
+            [styled_cell(ws, idx, 'report_score'),
+             styled_cell(ws, student.name, 'report_name'),
+             styled_cell(ws, student.admission_number, 'report_score')]
+            + [styled_cell(ws, subject['obtained'], 'report_score') for subject in breakdown[student.id]]
+            + [styled_cell(ws, pdata['total_score'], 'report_score'),
+               styled_cell(ws, f"{_percent(pdata['total_score'], total_available)}%", 'report_score'),
+               styled_cell(ws, pdata['position'], 'report_score')]
+        )
+
+    # ── One sheet per subject ───────────────────────────────────────────
+    for i, (st_id, subject_name) in enumerate(matrix.subjects):
+        records = matrix.records.get(st_id, [])
+        ws = wb.create_sheet(_sheet_title(subject_name, used_titles))
+        header = (["S/N", "Student"]
+                  + [f"{rec['record_type']} {rec['record_number'] or ''}".strip() + f" (/{rec['total_score']})"
+                     for rec in records]
+                  + ["CA", "Exam", "Total", "Percentage", "Remark", "Position"])
+        ws.column_dimensions['A'].width = 6
+        ws.column_dimensions['B'].width = 28
+        for col_num in range(3, len(header) + 1):
+            ws.column_dimensions[get_column_letter(col_num)].width = 12
+        ws.freeze_panes = 'C2'
+        ws.append([styled_cell(ws, value, 'report_header') for value in header])
+
+        for idx, student in enumerate(students, start=1):
+            subject = breakdown[student.id][i]
+            ws.append(
+                [styled_cell(ws, idx, 'report_score'),
+                 styled_cell(ws, student.name, 'report_name')]
+                + [styled_cell(ws, matrix.score(student.id, rec['id'], None), 'report_score') for rec in records]
+                + [styled_cell(ws, subject['cont_assess'], 'report_score'),
+                   styled_cell(ws, subject['exam'], 'report_score'),
+                   styled_cell(ws, subject['obtained'], 'report_score'),
+                   styled_cell(ws, f"{_percent(subject['obtained'], subject['obtainable'])}%", 'report_score'),
+                   styled_cell(ws, subject['remark'], 'report_score'),
+                   styled_cell(ws, by_subject[i][student.id]['position'], 'report_score')]
+            )
+
+    return wb
+
+
+@query_budget(6)
+@login_require
+def export_class_broadsheet(request, class_id):
+    """Download the class broadsheet for ?term= (defaults to the user's active term)."""
+    class_obj = get_object_or_404(Class, id=class_id, user=request.user)
+    term = request.GET.get('term') or request.user.active_term or "First Term"
+    students = list(Student.objects.filter(class_name=class_obj).order_by('name'))
+
+    wb = build_broadsheet(class_obj, term, students)
+    filename = f"{class_obj.name}_{class_obj.batch}_{term.replace(' ', '_')}_Broadsheet.xlsx"
+    return workbook_response(wb, filename)
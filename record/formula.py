@@ -0,0 +1,279 @@
+"""
+Formula engine for Record.logic.
+
+A logic string such as "@Test:1 + @Test:2" or "avg(@1, @2, @3) * 0.7" is
+parsed once into a small AST, its @references are pulled out into a list,
+and the AST is compiled into a tree of Python closures. Evaluating a
+formula for a student is then just calling that closure with the
+referenced scores — no string substitution or eval() per student.
+
+Reference forms (the trailing number is always the record_number):
+
+    @1                          same term, subject and record type
+    @Test:1                     same term and subject
+    @First Term:Test:1          another term (also written @FirstTerm:Test:1)
+    @First Term:1               another term, same record type
+    @Second Term:Mathematics:Test:1
+                                another subject in the same class
+
+Operators: + - * / with the usual precedence, unary minus, parentheses,
+and the functions avg, sum, min, max and round.
+"""
+from collections import namedtuple
+from functools import lru_cache
+import re
+
+from django.core.exceptions import ValidationError
+
+from .models import TERM_CHOICES
+
+
+class FormulaError(ValidationError):
+    """A logic string that can't be parsed, resolved or evaluated."""
+
+
+Reference = namedtuple("Reference", ["term", "subject", "record_type", "number"])
+
+TERMS = {title.replace(" ", "").lower(): title for title, _ in TERM_CHOICES}
+
+FUNCTIONS = {
+    "avg": lambda *args: sum(args) / len(args),
+    "sum": lambda *args: sum(args),
+    "min": min,
+    "max": max,
+    "round": lambda value, digits=0: round(value, int(digits)),
+}
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+(?:\.\d+)?|\.\d+)
+      | @(?P<ref>[A-Za-z0-9 _.&]+(?::[A-Za-z0-9 _.&]+)*)
+      | (?P<name>[A-Za-z_]\w*)
+      | (?P<op>[-+*/(),])
+    )""", re.VERBOSE)
+
+
+def _tokenize(source):
+    tokens = []
+    pos = 0
+    source = source.rstrip()
+    while pos < len(source):
+        match = _TOKEN_RE.match(source, pos)
+        if not match:
+            raise FormulaError(f"Unexpected character '{source[pos:].strip()[:1]}' in logic: {source}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        pos = match.end()
+    tokens.append(("end", None))
+    return tokens
+
+
+def parse_reference(text):
+    """'First Term:Test:1' -> Reference('First Term', None, 'Test', 1)."""
+    parts = [part.strip() for part in text.split(":")]
+    try:
+        number = int(parts.pop())
+    except ValueError:
+        raise FormulaError(f"Reference @{text} must end with a record number")
+
+    term = None
+    if parts and parts[0].replace(" ", "").lower() in TERMS:
+        term = TERMS[parts.pop(0).replace(" ", "").lower()]
+
+    if len(parts) == 0:
+        return Reference(term, None, None, number)
+    if len(parts) == 1:
+        return Reference(term, None, parts[0], number)
+    if len(parts) == 2:
+        return Reference(term, parts[0], parts[1], number)
+    raise FormulaError(f"Invalid reference format: @{text}")
+
+
+class _Parser:
+    """Recursive-descent parser producing a JSON-friendly nested-list AST."""
+
+    def __init__(self, source):
+        self.source = source
+        self.tokens = _tokenize(source)
+        self.pos = 0
+        self.references = []
+
+    def parse(self):
+        node = self.expression()
+        if self.peek() != ("end", None):
+            self.fail()
+        return node
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def expect(self, op):
+        if self.take() != ("op", op):
+            self.fail(f"expected '{op}'")
+
+    def fail(self, detail=None):
+        kind, value = self.tokens[min(self.pos, len(self.tokens) - 1)]
+        found = "end of formula" if kind == "end" else f"'{value.strip()}'"
+        raise FormulaError(f"Unexpected {found} in logic: {self.source}" + (f" ({detail})" if detail else ""))
+
+    def expression(self):
+        node = self.term()
+        while self.peek() in (("op", "+"), ("op", "-")):
+            op = "add" if self.take()[1] == "+" else "sub"
+            node = [op, node, self.term()]
+        return node
+
+    def term(self):
+        node = self.unary()
+        while self.peek() in (("op", "*"), ("op", "/")):
+            op = "mul" if self.take()[1] == "*" else "div"
+            node = [op, node, self.unary()]
+        return node
+
+    def unary(self):
+        if self.peek() == ("op", "-"):
+            self.take()
+            return ["neg", self.unary()]
+        if self.peek() == ("op", "+"):
+            self.take()
+            return self.unary()
+        return self.atom()
+
+    def atom(self):
+        kind, value = self.take()
+        if kind == "number":
+            return ["num", float(value)]
+        if kind == "ref":
+            reference = parse_reference(value)
+            if reference not in self.references:
+                self.references.append(reference)
+            return ["ref", self.references.index(reference)]
+        if kind == "name":
+            name = value.lower()
+            if name not in FUNCTIONS:
+                raise FormulaError(f"Unknown function '{value}' in logic: {self.source}")
+            self.expect("(")
+            args = [self.expression()]
+            while self.peek() == ("op", ","):
+                self.take()
+                args.append(self.expression())
+            self.expect(")")
+            return ["call", name, args]
+        if (kind, value) == ("op", "("):
+            node = self.expression()
+            self.expect(")")
+            return node
+        self.pos -= 1
+        self.fail()
+
+
+def _divide(a, b):
+    # A zero denominator (e.g. an empty weight) scores 0 rather than failing the whole class.
+    return a / b if b else 0
+
+
+_BINARY = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mul": lambda a, b: a * b,
+    "div": _divide,
+}
+
+
+def _compile(node):
+    """AST -> closure taking the list of referenced scores."""
+    kind = node[0]
+    if kind == "num":
+        value = node[1]
+        return lambda scores: value
+    if kind == "ref":
+        index = node[1]
+        return lambda scores: scores[index]
+    if kind == "neg":
+        operand = _compile(node[1])
+        return lambda scores: -operand(scores)
+    if kind in _BINARY:
+        op, left, right = _BINARY[kind], _compile(node[1]), _compile(node[2])
+        return lambda scores: op(left(scores), right(scores))
+    if kind == "call":
+        function = FUNCTIONS[node[1]]
+        args = [_compile(arg) for arg in node[2]]
+        return lambda scores: function(*(arg(scores) for arg in args))
+    raise FormulaError(f"Unknown formula node: {kind}")
+
+
+def _compile_columns(node):
+    """
+    AST -> closure over whole columns: `columns` holds one list of scores
+    per reference (one entry per student) and every node returns a list
+    of `size` values, so a class is evaluated in one pass per node.
+    """
+    kind = node[0]
+    if kind == "num":
+        value = node[1]
+        return lambda columns, size: [value] * size
+    if kind == "ref":
+        index = node[1]
+        return lambda columns, size: columns[index]
+    if kind == "neg":
+        operand = _compile_columns(node[1])
+        return lambda columns, size: [-value for value in operand(columns, size)]
+    if kind in _BINARY:
+        op, left, right = _BINARY[kind], _compile_columns(node[1]), _compile_columns(node[2])
+        return lambda columns, size: list(map(op, left(columns, size), right(columns, size)))
+    if kind == "call":
+        function = FUNCTIONS[node[1]]
+        args = [_compile_columns(arg) for arg in node[2]]
+        return lambda columns, size: list(map(function, *(arg(columns, size) for arg in args)))
+    raise FormulaError(f"Unknown formula node: {kind}")
+
+
+class Formula:
+    """A parsed, compiled logic string."""
+
+    def __init__(self, source, ast, references):
+        self.source = source
+        self.ast = ast
+        self.references = [Reference(*ref) for ref in references]
+        self._fn = _compile(ast)
+        self._columns_fn = _compile_columns(ast)
+
+    def evaluate(self, scores):
+        """
+        `scores` holds one value per entry in self.references, in order.
+        Returns the result rounded to a whole score.
+        """
+        try:
+            return int(round(self._fn(scores)))
+        except (TypeError, ValueError, OverflowError) as e:
+            raise FormulaError(f"Could not evaluate logic {self.source}: {e}")
+
+    def evaluate_columns(self, columns, size):
+        """
+        Vectorised evaluate(): `columns[i]` is the list of every student's
+        score on reference i. Returns one whole score per student.
+        """
+        if not size:
+            return []
+        try:
+            return [int(round(value)) for value in self._columns_fn(columns, size)]
+        except (TypeError, ValueError, OverflowError) as e:
+            raise FormulaError(f"Could not evaluate logic {self.source}: {e}")
+
+    def to_json(self):
+        return {"source": self.source, "ast": self.ast, "refs": [list(ref) for ref in self.references]}
+
+
+@lru_cache(maxsize=512)
+def compile_formula(source):
+    """Parse and compile a logic string. Cached, so each distinct formula is parsed once per process."""
+    if not source or not source.strip():
+        raise FormulaError("Logic is empty")
+    parser = _Parser(source.strip())
+    ast = parser.parse()
+    return Formula(source.strip(), ast, parser.references)
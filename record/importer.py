@@ -0,0 +1,212 @@
+"""
+Score import from the spreadsheets teachers already keep.
+
+A sheet is read for one subject/class/term (a SubjectTeacher plus a term).
+The header row names the student columns ("Name"/"Student" and/or
+"Admission Number"/"Adm. No") and one column per record, written the way
+the exports write them: "Test 1", "Exam 1", "Test 1 (/10)". Every other
+row is a student.
+
+Rows are streamed (openpyxl read-only mode for .xlsx, csv for .csv), so
+the file itself is never held in memory; only the parsed scores are.
+Everything is validated and diffed against the stored scores before
+anything is written, and the changes go in as one batched upsert.
+"""
+import csv
+import io
+import re
+import zipfile
+
+from django.core.exceptions import ValidationError
+from openpyxl import load_workbook
+from openpyxl.utils.exceptions import InvalidFileException
+
+from .models import Record, Student, StudentRecord
+from .service import StudentRecordService
+
+NAME_HEADERS = {"name", "student", "student name", "full name"}
+ADMISSION_HEADERS = {"admission number", "admission no", "adm no", "adm. no", "admission_number", "adm"}
+
+_RECORD_HEADER_RE = re.compile(r"^\s*([A-Za-z]+)\s*#?\s*(\d+)\s*(?:\(\s*/?\s*\d+\s*\))?\s*$")
+
+
+def _normalise(value):
+    return " ".join(str(value).split()).lower() if value is not None else ""
+
+
+def iter_rows(file, filename):
+    """
+    Yield each row of an .xlsx or .csv file as a tuple of cell values.
+    A file that can't be read as its extension says raises ValidationError.
+    """
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        try:
+            for row in csv.reader(text):
+                yield tuple(row)
+        except UnicodeDecodeError:
+            raise ValidationError("The .csv file isn't UTF-8 text; save it as \"CSV UTF-8\" and upload it again")
+        except csv.Error as e:
+            raise ValidationError(f"The .csv file can't be read: {e}")
+        finally:
+            text.detach()
+    elif name.endswith((".xlsx", ".xlsm")):
+        try:
+            wb = load_workbook(file, read_only=True, data_only=True)
+        except (zipfile.BadZipFile, InvalidFileException, KeyError):
+            # KeyError: a zip archive without the parts of a workbook.
+            raise ValidationError("The .xlsx file is damaged or isn't an Excel workbook")
+        try:
+            for row in wb.worksheets[0].iter_rows(values_only=True):
+                yield row
+        finally:
+            wb.close()
+    else:
+        raise ValidationError("Upload an .xlsx or .csv file")
+
+
+def _cell_text(value):
+    """Spreadsheet cell -> score text; 8.0 from Excel becomes '8'."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+class ScoreImport:
+    """
+    One import of a sheet into a subject teacher's records for a term.
+
+    run() returns a report dict:
+        created / updated     lists of {'student', 'record', 'old', 'new'}
+        unchanged             number of cells that already matched
+        errors                list of {'row', 'column', 'value', 'message'}
+        unmatched_students    list of {'row', 'name', 'admission_number'}
+        unmatched_columns     header texts that matched no record
+        computed_columns      headers of logic records (never imported)
+        dry_run               True if nothing was written
+    """
+
+    def __init__(self, subject_teacher, term, user):
+        self.subject_teacher = subject_teacher
+        self.class_obj = subject_teacher.class_name
+        self.term = term
+        self.user = user
+
+    def _records_by_header(self):
+        records = Record.objects.filter(
+            subject=self.subject_teacher, class_name=self.class_obj, title=self.term
+        )
+        return {(rec.record_type.lower(), rec.record_number): rec for rec in records}
+
+    def _map_header(self, header):
+        """Header row -> (name column, admission column, {column: record}) plus what didn't match."""
+        records = self._records_by_header()
+        name_col = admission_col = None
+        columns, unmatched, computed = {}, [], []
+
+        for col, value in enumerate(header):
+            text = _normalise(value)
+            if not text:
+                continue
+            if text in NAME_HEADERS and name_col is None:
+                name_col = col
+                continue
+            if text in ADMISSION_HEADERS and admission_col is None:
+                admission_col = col
+                continue
+            if text in {"s/n", "sn", "no", "no."}:
+                continue
+
+            match = _RECORD_HEADER_RE.match(text)
+            rec = records.get((match.group(1), int(match.group(2)))) if match else None
+            if rec is None:
+                unmatched.append(str(value).strip())
+            elif rec.logic:
+                computed.append(str(value).strip())
+            else:
+                columns[col] = rec
+
+        if name_col is None and admission_col is None:
+            raise ValidationError("The first row needs a 'Name' or 'Admission Number' column")
+        if not columns:
+            raise ValidationError(f"No column matches a record of {self.subject_teacher} for {self.term}")
+        return name_col, admission_col, columns, unmatched, computed
+
+    def _student_lookup(self):
+        by_name, by_admission = {}, {}
+        for student in Student.objects.filter(class_name=self.class_obj):
+            by_name[_normalise(student.name)] = student
+            if student.admission_number is not None:
+                by_admission[str(student.admission_number)] = student
+        return by_name, by_admission
+
+    def run(self, rows, dry_run=True):
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            raise ValidationError("The file is empty")
+        name_col, admission_col, columns, unmatched_columns, computed_columns = self._map_header(header)
+
+        by_name, by_admission = self._student_lookup()
+        records = list(columns.values())
+        existing = dict(
+            ((student_id, record_id), score)
+            for student_id, record_id, score in StudentRecord.objects.filter(record__in=records)
+            .values_list('student_id', 'record_id', 'score')
+        )
+
+        scores, seen = {}, {}
+        report = {
+            'created': [], 'updated': [], 'unchanged': 0, 'errors': [],
+            'unmatched_students': [], 'unmatched_columns': unmatched_columns,
+            'computed_columns': computed_columns, 'dry_run': dry_run,
+        }
+
+        for row_number, row in enumerate(rows, start=2):
+            if not any(_cell_text(value) for value in row):
+                continue
+            name = _cell_text(row[name_col]) if name_col is not None and name_col < len(row) else ""
+            admission = _cell_text(row[admission_col]) if admission_col is not None and admission_col < len(row) else ""
+
+            student = by_admission.get(admission) if admission else None
+            if student is None and name:
+                student = by_name.get(_normalise(name))
+            if student is None:
+                report['unmatched_students'].append(
+                    {'row': row_number, 'name': name, 'admission_number': admission}
+                )
+                continue
+            if student.id in seen:
+                report['errors'].append({
+                    'row': row_number, 'column': '', 'value': name or admission,
+                    'message': f"{student.name} already appears on row {seen[student.id]}",
+                })
+                continue
+            seen[student.id] = row_number
+
+            for col, rec in columns.items():
+                raw = _cell_text(row[col]) if col < len(row) else ""
+                if raw == "":
+                    continue
+                score, error = StudentRecordService.parse_score(rec, raw)
+                if error:
+                    report['errors'].append({
+                        'row': row_number, 'column': str(header[col]).strip(), 'value': raw,
+                        'message': f"{student.name}: {error}",
+                    })
+                    continue
+
+                old = existing.get((student.id, rec.id))
+                if old == score:
+                    report['unchanged'] += 1
+                    continue
+                scores[(student.id, rec.id)] = score
+                change = {'student': student, 'record': rec, 'old': old, 'new': score}
+                report['updated' if old is not None else 'created'].append(change)
+
+        if not dry_run:
+            StudentRecordService.upsert_scores(self.user, records, scores)
+        return report
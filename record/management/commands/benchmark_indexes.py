@@ -0,0 +1,128 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Sum
+from record.models import Class, Record, Student, StudentRecord, SubjectTeacher
+from record.synthetic import generate_school
+
+# The indexes added for the report / score-entry query patterns (migration 0011).
+INDEXED_MODELS = (Record, StudentRecord, Student)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def hot_queries(class_obj, term):
+    """
+    (label, queryset, run) for the queries the indexes were chosen for.
+    `queryset` is what gets EXPLAINed, `run` is what gets timed.
+    """
+    teacher = SubjectTeacher.objects.filter(class_name=class_obj).first()
+    record = Record.objects.filter(class_name=class_obj, title=term).first()
+    student_ids = list(Student.objects.filter(class_name=class_obj).values_list('id', flat=True))
+    record_ids = list(Record.objects.filter(class_name=class_obj, title=term).values_list('id', flat=True)[:3])
+
+    positions_records = Record.objects.filter(
+        class_name=class_obj, title=term, subject__isnull=False, include_in_total=True, show_in_report=True
+    )
+    matrix_scores = StudentRecord.objects.filter(
+        record__class_name=class_obj, record__title=term, record__show_in_report=True
+    ).values_list('student_id', 'record_id', 'score')
+    class_students = Student.objects.filter(class_name=class_obj).order_by('name')
+    next_number = Record.objects.filter(
+        subject=teacher, class_name=class_obj, title=term, record_type="Test"
+    )
+    record_column = StudentRecord.objects.filter(record=record).values_list('student_id', 'score')
+    logic_inputs = StudentRecord.objects.filter(
+        student_id__in=student_ids, record_id__in=record_ids
+    ).values_list('id', 'student_id', 'record_id', 'score')
+
+    return [
+        ("positions: total available", positions_records,
+         lambda: positions_records.aggregate(total=Sum('total_score'))),
+        ("score matrix for class/term", matrix_scores, lambda: list(matrix_scores.all())),
+        ("class students by name", class_students, lambda: list(class_students.all())),
+        ("_next_record_number", next_number, lambda: next_number.aggregate(Max('record_number'))),
+        ("one record's scores", record_column, lambda: list(record_column.all())),
+        ("logic evaluation inputs", logic_inputs, lambda: list(logic_inputs.all())),
+    ]
+
+
+class Command(BaseCommand):
+    help = ("Show query plans and timings for the hot report/entry queries with and without "
+            "the composite indexes (dropped inside a transaction that is rolled back).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate', action='store_true',
+                            help="Create a synthetic school first (see record/synthetic.py); "
+                                 "it is deleted again afterwards.")
+        parser.add_argument('--classes', type=int, default=20)
+        parser.add_argument('--students', type=int, default=60, help="Students per class.")
+        parser.add_argument('--subjects', type=int, default=12, help="Subjects per class.")
+        parser.add_argument('--class-id', type=int, help="Class to run the queries against.")
+        parser.add_argument('--term', default="First Term")
+        parser.add_argument('--repeat', type=int, default=50, help="Timed runs per query.")
+
+    def handle(self, *args, **options):
+        for option in ('classes', 'students', 'subjects', 'repeat'):
+            if options[option] < 1:
+                raise CommandError(f"--{option} must be at least 1")
+        if not options['generate']:
+            self.benchmark(Class.objects.all(), options)
+            return
+
+        started = time.perf_counter()
+        user = generate_school(options['classes'], options['students'], options['subjects'], seed=1)
+        self.stdout.write(f"Generated {StudentRecord.objects.filter(user=user).count()} scores "
+                          f"in {time.perf_counter() - started:.1f}s")
+        try:
+            self.benchmark(Class.objects.filter(user=user), options)
+        finally:
+            user.delete()
+
+    def benchmark(self, classes, options):
+        if options['class_id']:
+            class_obj = classes.filter(id=options['class_id']).first()
+        else:
+            class_obj = classes.filter(student__isnull=False).order_by('-id').first()
+        if class_obj is None:
+            raise CommandError("No class with students to benchmark; use --generate")
+
+        self.stdout.write(f"Class {class_obj} ({class_obj.id}), {options['term']}; "
+                          f"{StudentRecord.objects.count()} scores in the table\n")
+
+        with_indexes = self.measure(class_obj, options['term'], options['repeat'])
+
+        # Collect the DROP INDEX statements without running them, then run
+        # them inside a transaction that's always rolled back.
+        with connection.schema_editor(collect_sql=True) as editor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    editor.remove_index(model, index)
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                for sql in editor.collected_sql:
+                    cursor.execute(sql)
+                without_indexes = self.measure(class_obj, options['term'], options['repeat'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        for label, plan, seconds in with_indexes:
+            _, old_plan, old_seconds = next(row for row in without_indexes if row[0] == label)
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(f"  without: {old_seconds * 1000:8.3f} ms   {old_plan}")
+            self.stdout.write(f"  with:    {seconds * 1000:8.3f} ms   {plan}")
+
+    def measure(self, class_obj, term, repeat):
+        results = []
+        for label, queryset, run in hot_queries(class_obj, term):
+            plan = " | ".join(line.strip() for line in queryset.explain().splitlines())
+            run()  # warm the page cache
+            started = time.perf_counter()
+            for _ in range(repeat):
+                run()
+            results.append((label, plan, (time.perf_counter() - started) / repeat))
+        return results
@@ -0,0 +1,187 @@
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from record.models import Class, Record, Student, StudentRecord, SubjectTeacher, User
+from record.report import Report
+from record.service import ClassScoreMatrix, HistoryBuffer, ReportCardService, ReportService
+from record.synthetic import generate_school
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Time the report builders, report card, Excel export and bulk entry views on synthetic "
+            "data, recording wall time and query counts to JSON for comparison across commits.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="Benchmark this (synthetic) teacher's data instead of "
+                                                "generating a school, which is deleted again afterwards.")
+        parser.add_argument('--classes', type=int, default=6)
+        parser.add_argument('--students', type=int, default=60, help="Students per class.")
+        parser.add_argument('--subjects', type=int, default=12, help="Subjects per class.")
+        parser.add_argument('--logic', action='store_true', help="Include computed CA records.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per benchmark.")
+        parser.add_argument('--output', default=str(Path(tempfile.gettempdir()) / "benchmark-results.json"))
+        parser.add_argument('--compare', help="A previous results file to print deltas against.")
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError(f"No user {options['username']}")
+            self.benchmark(user, options)
+            return
+
+        user = generate_school(options['classes'], options['students'], options['subjects'],
+                               terms=["First Term"], seed=1, with_logic=options['logic'])
+        try:
+            self.benchmark(user, options)
+        finally:
+            # Write the queued page views first, so they go with the user.
+            HistoryBuffer.flush()
+            user.delete()
+
+    def benchmark(self, user, options):
+        class_obj = Class.objects.filter(user=user, student__isnull=False).order_by('id').first()
+        if class_obj is None:
+            raise CommandError(f"{user.username} has no class with students")
+        term = "First Term"
+        user.active_term = term
+        user.save(update_fields=['active_term'])
+        teacher = SubjectTeacher.objects.filter(class_name=class_obj).select_related('subject').first()
+        subject = teacher.subject
+        student = Student.objects.filter(class_name=class_obj).order_by('name').first()
+        students = list(Student.objects.filter(class_name=class_obj).values_list('id', flat=True))
+        manual = list(Record.objects.filter(subject=teacher, title=term, logic__isnull=True).order_by('id'))
+
+        client = Client()
+        client.cookies['auth_token'] = user.generate_token()
+
+        def post_column():
+            record = manual[0]
+            return client.post(reverse('bulk-score-entry', args=[record.id]), {
+                f"score_{sid}": str(random.randint(0, record.total_score)) for sid in students
+            })
+
+        def post_grid():
+            return client.post(reverse('bulk-multi-score-entry', args=[teacher.id]), {
+                f"score_{sid}_{rec.id}": str(random.randint(0, rec.total_score))
+                for sid in students for rec in manual
+            })
+
+        def report_card_cold():
+            ClassScoreMatrix.invalidate(class_obj.id)
+            return ReportCardService.build_report_card_context(student, term, class_obj.session)
+
+        def check_response(response):
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+            return response
+
+        def check_result(result):
+            if isinstance(result, dict) and result.get('success') is False:
+                raise RuntimeError(result.get('error'))
+            return result
+
+        benchmarks = {
+            "ReportService.generate_report": lambda: check_result(ReportService.generate_report(
+                subject.id, class_obj.name, class_obj.batch, term, user=user)),
+            "Report.generate_report": lambda: check_result(Report.generate_report(
+                subject.id, class_obj.name, class_obj.batch, term, "asc", user=user)),
+            "ReportCardService.build_report_card_context (cold)": report_card_cold,
+            "ReportCardService.build_report_card_context (cached matrix)": lambda: (
+                ReportCardService.build_report_card_context(student, term, class_obj.session)),
+            "export_report_excel": lambda: check_response(client.get(
+                reverse('export_report_excel'),
+                {'subject': subject.id, 'class': class_obj.name, 'batch': class_obj.batch, 'term': term})),
+            "bulk_score_entry_view POST": lambda: check_response(post_column()),
+            "bulk_multi_record_score_view POST": lambda: check_response(post_grid()),
+        }
+
+        results = {}
+        for name, run in benchmarks.items():
+            results[name] = self.measure(run, options['repeat'])
+            line = results[name]
+            if line['ok']:
+                self.stdout.write(f"{name:<62} {line['wall_ms_mean']:9.1f} ms  {line['queries']:5d} queries")
+            else:
+                self.stdout.write(self.style.WARNING(f"{name:<62} failed: {line['error']}"))
+
+        output = {
+            'meta': {
+                'commit': _git_commit(),
+                'timestamp': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'username': user.username,
+                'class_id': class_obj.id,
+                'scale': {
+                    'students_in_class': len(students),
+                    'subjects_in_class': SubjectTeacher.objects.filter(class_name=class_obj).count(),
+                    'records_in_class': Record.objects.filter(class_name=class_obj).count(),
+                    'scores_total': StudentRecord.objects.count(),
+                },
+                'repeat': options['repeat'],
+            },
+            'results': results,
+        }
+        Path(options['output']).write_text(json.dumps(output, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+        if options['compare']:
+            self.compare(json.loads(Path(options['compare']).read_text()), output)
+
+    def measure(self, run, repeat):
+        timings = []
+        queries = 0
+        try:
+            run()  # warm-up, and surfaces errors before timing
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    run()
+                    timings.append(time.perf_counter() - started)
+                queries = len(captured.captured_queries)
+        except Exception as e:
+            return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+        return {
+            'ok': True,
+            'wall_ms_mean': round(sum(timings) / len(timings) * 1000, 3),
+            'wall_ms_min': round(min(timings) * 1000, 3),
+            'queries': queries,
+        }
+
+    def compare(self, before, after):
+        self.stdout.write(f"\nvs {before['meta'].get('commit')} ({before['meta'].get('timestamp')}):")
+        for name, now in after['results'].items():
+            then = before['results'].get(name)
+            if not (then and then.get('ok') and now.get('ok')):
+                self.stdout.write(f"  {name:<62} {'n/a' if not then else ('now ok' if now.get('ok') else 'failing')}")
+                continue
+            change = (now['wall_ms_mean'] - then['wall_ms_mean']) / then['wall_ms_mean'] * 100 if then['wall_ms_mean'] else 0
+            self.stdout.write(f"  {name:<62} {then['wall_ms_mean']:9.1f} -> {now['wall_ms_mean']:9.1f} ms "
+                              f"({change:+.0f}%)  queries {then['queries']} -> {now['queries']}")
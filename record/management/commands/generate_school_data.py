@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from record.models import CLASSES, TERM_CHOICES, School, Record, Student, StudentRecord
+from record.synthetic import RECORD_LAYOUT, generate_school
+
+
+class Command(BaseCommand):
+    help = ("Generate realistic synthetic schools for benchmarking: teachers, JSS1-SS3 classes "
+            "per batch, students, subjects, records per term, scores and computed records.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schools', type=int, default=1)
+        parser.add_argument('--teachers', type=int, default=1, help="Teachers per school.")
+        parser.add_argument('--levels', nargs='+', default=[name for name, _ in CLASSES],
+                            help="Class levels each teacher gets (default JSS1-SS3).")
+        parser.add_argument('--batches', type=int, default=2, help="Batches (A, B, ...) per level.")
+        parser.add_argument('--students', type=int, default=40, help="Students per class.")
+        parser.add_argument('--subjects', type=int, default=10, help="Subjects per class.")
+        parser.add_argument('--terms', type=int, default=3, choices=[1, 2, 3])
+        parser.add_argument('--records', type=int, default=len(RECORD_LAYOUT),
+                            help="Records per subject per term: tests sharing 30 marks plus a 70-mark exam.")
+        parser.add_argument('--fill', type=float, default=1.0,
+                            help="Share of student/record cells that have a score (0-1).")
+        parser.add_argument('--logic', action='store_true',
+                            help="Add a computed CA record (the sum of the tests) per subject and term.")
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        for option in ('schools', 'teachers', 'students', 'subjects'):
+            if options[option] < 1:
+                raise CommandError(f"--{option} must be at least 1")
+        unknown = [level for level in options['levels'] if level not in dict(CLASSES)]
+        if unknown:
+            raise CommandError(f"Unknown --levels {', '.join(unknown)}; choose from "
+                               f"{', '.join(name for name, _ in CLASSES)}")
+        if not 0 <= options['fill'] <= 1:
+            raise CommandError("--fill must be between 0 and 1")
+        if not 1 <= options['batches'] <= 4:
+            raise CommandError("--batches must be between 1 and 4")
+        if options['records'] < 1:
+            raise CommandError("--records must be at least 1")
+        if options['logic'] and options['records'] < 2:
+            raise CommandError("--logic needs at least one test per term (--records 2 or more)")
+        class_specs = [(level, batch) for level in options['levels'] for batch in "ABCD"[:options['batches']]]
+        terms = [title for title, _ in TERM_CHOICES][:options['terms']]
+
+        started = time.perf_counter()
+        users = []
+        for s in range(options['schools']):
+            school = School.objects.create(name=f"Synthetic School {s + 1}")
+            for t in range(options['teachers']):
+                seed = None if options['seed'] is None else options['seed'] + s * 1000 + t
+                users.append(generate_school(
+                    students_per_class=options['students'], subjects_per_class=options['subjects'],
+                    terms=terms, fill=options['fill'], seed=seed, class_specs=class_specs,
+                    school=school, with_logic=options['logic'], records_per_term=options['records'],
+                ))
+                self.stdout.write(f"  {school.name}: {users[-1].username}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(users)} teachers, {len(users) * len(class_specs)} classes, "
+            f"{Student.objects.filter(user__in=users).count()} students, "
+            f"{Record.objects.filter(user__in=users).count()} records and "
+            f"{StudentRecord.objects.filter(user__in=users).count()} scores "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
@@ -0,0 +1,49 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from record.importer import ScoreImport, iter_rows
+from record.models import SubjectTeacher
+
+
+class Command(BaseCommand):
+    help = "Import a subject's scores for a term from an .xlsx or .csv file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="The .xlsx or .csv file to import.")
+        parser.add_argument('--subject-teacher', type=int, required=True, dest='subject_teacher_id',
+                            help="Id of the SubjectTeacher (subject in a class) the scores belong to.")
+        parser.add_argument('--term', default="First Term", help="Term of the records, e.g. 'First Term'.")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report what would change without writing anything.")
+
+    def handle(self, *args, **options):
+        try:
+            subject_teacher = SubjectTeacher.objects.select_related('class_name').get(
+                id=options['subject_teacher_id']
+            )
+        except SubjectTeacher.DoesNotExist:
+            raise CommandError(f"SubjectTeacher {options['subject_teacher_id']} not found")
+
+        importer = ScoreImport(subject_teacher, options['term'], subject_teacher.user)
+        try:
+            with open(options['path'], 'rb') as f:
+                report = importer.run(iter_rows(f, options['path']), dry_run=options['dry_run'])
+        except (OSError, ValidationError) as e:
+            raise CommandError('; '.join(e.messages) if isinstance(e, ValidationError) else str(e))
+
+        for change in report['updated']:
+            self.stdout.write(f"  {change['student'].name} {change['record'].record_type} "
+                              f"{change['record'].record_number}: {change['old']} -> {change['new']}")
+        for error in report['errors']:
+            self.stderr.write(f"  row {error['row']} {error['column']}: {error['message']}")
+        for student in report['unmatched_students']:
+            self.stderr.write(f"  row {student['row']}: no student "
+                              f"'{student['name'] or student['admission_number']}' in {subject_teacher.class_name}")
+        if report['unmatched_columns']:
+            self.stderr.write(f"  ignored columns: {', '.join(report['unmatched_columns'])}")
+
+        verb = "Would create" if report['dry_run'] else "Created"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {len(report['created'])}, "
+            f"{'would update' if report['dry_run'] else 'updated'} {len(report['updated'])}, "
+            f"{report['unchanged']} unchanged, {len(report['errors'])} errors."
+        ))
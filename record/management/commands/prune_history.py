@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from record.service import HistoryService, HistoryBuffer
+
+
+class Command(BaseCommand):
+    help = ("Apply the History retention policy (HISTORY_KEEP_DAYS, HISTORY_KEEP_PER_USER) "
+            "and collapse duplicate entries.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=int, action='append', dest='user_ids',
+                            help="Only prune this user's history (repeatable).")
+        parser.add_argument('--no-compact', action='store_true',
+                            help="Skip merging duplicate (user, title, url) rows.")
+
+    def handle(self, *args, **options):
+        HistoryBuffer.flush()
+        compacted = 0 if options['no_compact'] else HistoryService.compact()
+        pruned = HistoryService.prune(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {compacted} duplicate and {pruned} expired history rows "
+            f"(keeping {getattr(settings, 'HISTORY_KEEP_PER_USER', 200)} per user, "
+            f"{getattr(settings, 'HISTORY_KEEP_DAYS', 90)} days)."
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from record.models import Record
+
+
+class Command(BaseCommand):
+    help = "Recompute each Record's running score aggregates from StudentRecord and fix any that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--class-id', type=int, action='append', dest='class_ids',
+            help="Only rebuild this class's records (repeatable). Default: every record.",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Report drifted records without fixing them.")
+
+    def handle(self, *args, **options):
+        records = Record.objects.all()
+        if options['class_ids']:
+            records = records.filter(class_name_id__in=options['class_ids'])
+        stale = Record.rebuild_score_stats(records, dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f"{stale} of {records.count()} records have drifted.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {stale} of {records.count()} records."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from record.models import ScoreRollup
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the ScoreRollup analytics table from the records' score aggregates. "
+            "Safe to run periodically; run rebuild_record_stats first if those may have drifted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--class-id', type=int, action='append', dest='class_ids',
+            help="Only rebuild this class (repeatable). Default: every class.",
+        )
+
+    def handle(self, *args, **options):
+        count = ScoreRollup.rebuild(class_ids=options['class_ids'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} score rollup rows."))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand, CommandError
+from record.search import SearchIndex, enabled
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index (students, records, classes, subjects, topics) from scratch."
+
+    def handle(self, *args, **options):
+        if not enabled():
+            raise CommandError("The search index needs SQLite (FTS5); this database uses icontains search.")
+        count = SearchIndex.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} objects."))
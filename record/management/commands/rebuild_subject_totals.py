@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from record.models import SubjectTermTotal
+
+
+class Command(BaseCommand):
+    help = "Rebuild the SubjectTermTotal summary table from StudentRecord scores."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--class-id', type=int, action='append', dest='class_ids',
+            help="Only rebuild this class (repeatable). Default: every class.",
+        )
+
+    def handle(self, *args, **options):
+        count = SubjectTermTotal.rebuild(class_ids=options['class_ids'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} subject total rows."))
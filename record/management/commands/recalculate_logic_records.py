@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from record.models import Record
+
+
+class Command(BaseCommand):
+    help = "Re-evaluate every computed (logic) record for its whole class."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--class-id', type=int, action='append', dest='class_ids',
+                            help="Only records in this class (repeatable).")
+        parser.add_argument('--term', help="Only records for this term, e.g. 'First Term'.")
+        parser.add_argument('--no-create', action='store_true',
+                            help="Only update existing scores; don't create missing ones.")
+
+    def handle(self, *args, **options):
+        records = Record.objects.exclude(logic__isnull=True).exclude(logic='').order_by('id')
+        if options['class_ids']:
+            records = records.filter(class_name_id__in=options['class_ids'])
+        if options['term']:
+            records = records.filter(title=options['term'])
+
+        created = updated = 0
+        for record in records:
+            try:
+                result = record.evaluate_logic_for_class(create_missing=not options['no_create'])
+            except Exception as e:
+                self.stderr.write(f"{record}: {e}")
+                continue
+            created += result['created']
+            updated += result['updated']
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Evaluated {records.count()} records: {created} scores created, {updated} updated."
+        ))
@@ -0,0 +1,68 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('record.queries')
+
+
+class QueryStats:
+    """execute_wrapper that counts queries and adds up the time spent in SQL."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def view_query_budget(request):
+    """The @query_budget declared on the view that served this request, if any."""
+    match = getattr(request, 'resolver_match', None)
+    return getattr(getattr(match, 'func', None), 'query_budget', None)
+
+
+class QueryStatsMiddleware:
+    """
+    Count the queries each request makes and the time spent running them.
+
+    With DEBUG on they come back as X-Query-Count / X-Query-Time-Ms headers
+    (plus X-Query-Budget when the view declares one); otherwise each request
+    gets a log line on the 'record.queries' logger. A request that goes over
+    its view's @query_budget is logged as a warning either way.
+
+    Queries made while a StreamingHttpResponse body is iterated (the class
+    report cards stream theirs) run after this returns, so they aren't
+    counted here; QueryBudgetTests consumes the stream and counts them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+
+        sql_ms = stats.seconds * 1000
+        budget = view_query_budget(request)
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(stats.count)
+            response['X-Query-Time-Ms'] = f"{sql_ms:.1f}"
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+        else:
+            logger.info("%s %s %s queries=%d sql_ms=%.1f", request.method, request.path,
+                        response.status_code, stats.count, sql_ms)
+
+        if budget is not None and stats.count > budget:
+            logger.warning("%s %s made %d queries, over its budget of %d", request.method,
+                           request.path, stats.count, budget)
+        return response
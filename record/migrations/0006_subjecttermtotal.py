@@ -0,0 +1,75 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_subject_totals(apps, schema_editor):
+    """Populate the new table from existing scores (same sums as SubjectTermTotal.rebuild)."""
+    Class = apps.get_model('record', 'Class')
+    Record = apps.get_model('record', 'Record')
+    StudentRecord = apps.get_model('record', 'StudentRecord')
+    SubjectTermTotal = apps.get_model('record', 'SubjectTermTotal')
+
+    records = Record.objects.filter(subject__isnull=False, class_name__isnull=False)
+    obtainable = {
+        (row['subject_id'], row['class_name_id'], row['title']): row['total']
+        for row in records.filter(show_in_report=True, include_in_total=True)
+        .values('subject_id', 'class_name_id', 'title')
+        .annotate(total=Sum('total_score')).order_by()
+    }
+    sessions = dict(Class.objects.values_list('id', 'session'))
+
+    shown = Q(record__show_in_report=True)
+    counted = shown & Q(record__include_in_total=True)
+    exam = Q(record__record_type="Exam")
+    rows = []
+    for sums in (
+        StudentRecord.objects.filter(record__in=records)
+        .values('student_id', 'record__subject_id', 'record__class_name_id', 'record__title')
+        .annotate(
+            obtained=Sum('score', filter=counted, default=0),
+            ca_total=Sum('score', filter=shown & ~exam, default=0),
+            exam_total=Sum('score', filter=shown & exam, default=0),
+            score_sum=Sum('score', default=0),
+            score_count=Count('id'),
+        ).order_by()
+    ):
+        key = (sums.pop('record__subject_id'), sums.pop('record__class_name_id'), sums.pop('record__title'))
+        rows.append(SubjectTermTotal(
+            subject_id=key[0], class_name_id=key[1], term=key[2],
+            session=sessions[key[1]], obtainable=obtainable.get(key, 0), **sums
+        ))
+    SubjectTermTotal.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0005_alter_record_record_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubjectTermTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(choices=[('First Term', 'First Term'), ('Second Term', 'Second Term'), ('Third Term', 'Third Term')], max_length=20)),
+                ('session', models.CharField(max_length=20)),
+                ('obtained', models.IntegerField(default=0)),
+                ('obtainable', models.IntegerField(default=0)),
+                ('ca_total', models.IntegerField(default=0)),
+                ('exam_total', models.IntegerField(default=0)),
+                ('score_sum', models.IntegerField(default=0)),
+                ('score_count', models.IntegerField(default=0)),
+                ('class_name', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_totals', to='record.class')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_totals', to='record.student')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='student_totals', to='record.subjectteacher')),
+            ],
+            options={
+                'unique_together': {('student', 'subject', 'class_name', 'term')},
+            },
+        ),
+        migrations.RunPython(fill_subject_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0006_subjecttermtotal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='compiled_logic',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
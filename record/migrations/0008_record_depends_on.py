@@ -0,0 +1,97 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:50
+
+import re
+
+from django.db import migrations, models
+
+# A copy of record.formula's reference syntax as of this migration, so
+# later changes to the formula engine can't change what it links.
+REFERENCE_RE = re.compile(r"@([A-Za-z0-9 _.&]+(?::[A-Za-z0-9 _.&]+)*)")
+TERMS = {title.replace(" ", "").lower(): title for title in ('First Term', 'Second Term', 'Third Term')}
+
+
+def _parse_reference(text):
+    """(term, subject, record_type, number) for one @reference, None when it's malformed."""
+    parts = [part.strip() for part in text.split(":")]
+    try:
+        number = int(parts.pop())
+    except ValueError:
+        return None
+    term = None
+    if parts and parts[0].replace(" ", "").lower() in TERMS:
+        term = TERMS[parts.pop(0).replace(" ", "").lower()]
+    if len(parts) > 2:
+        return None
+    parts = [None] * (2 - len(parts)) + parts
+    return term, parts[0], parts[1], number
+
+
+def _resolve_reference(Record, record, ref):
+    """Record._resolve_reference against the historical model; None when it doesn't resolve."""
+    term, subject, record_type, number = ref
+    filters = {
+        'class_name_id': record.class_name_id,
+        'title': term or record.title,
+        'record_type': record_type or record.record_type,
+        'record_number': number,
+    }
+    if subject:
+        filters['subject__subject__name__iexact'] = subject
+    else:
+        filters['subject_id'] = record.subject_id
+    record_id = Record.objects.filter(**filters).values_list('id', flat=True).first()
+    return None if record_id == record.id else record_id
+
+
+def _reaches(graph, start, target):
+    """True when `target` can be reached from `start` along `graph`'s edges."""
+    seen, stack = set(), [start]
+    while stack:
+        node = stack.pop()
+        if node == target:
+            return True
+        if node not in seen:
+            seen.add(node)
+            stack.extend(graph.get(node, ()))
+    return False
+
+
+def link_dependencies(apps, schema_editor):
+    """
+    Fill the graph from each record's logic. References that don't resolve
+    are skipped, and so is any edge that would close a cycle: older logic
+    was never checked for one, and ScoreRefresh orders its work by this
+    graph. compiled_logic is left for Record.logic_record_ids() to fill
+    the first time each record is evaluated.
+    """
+    Record = apps.get_model('record', 'Record')
+    Through = Record.depends_on.through
+    graph = {}
+    for record in Record.objects.exclude(logic__isnull=True).exclude(logic='').order_by('id'):
+        for text in REFERENCE_RE.findall(record.logic):
+            ref = _parse_reference(text)
+            ref_id = ref and _resolve_reference(Record, record, ref)
+            if ref_id is None or ref_id in graph.get(record.id, ()) or _reaches(graph, ref_id, record.id):
+                continue
+            graph.setdefault(record.id, set()).add(ref_id)
+    Through.objects.bulk_create(
+        [Through(from_record_id=record_id, to_record_id=ref_id)
+         for record_id, ref_ids in graph.items() for ref_id in ref_ids],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0007_record_compiled_logic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='depends_on',
+            field=models.ManyToManyField(blank=True, editable=False, related_name='dependents', to='record.record'),
+        ),
+        migrations.RunPython(link_dependencies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0008_record_depends_on'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='history',
+            name='time',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-18 12:58
+
+import re
+
+from django.db import migrations, models
+
+TARGET_RE = re.compile(r"/(class|record|student|subject|topic)/(\d+)/")
+
+
+def fill_targets(apps, schema_editor):
+    """Parse target_model/object_id out of the urls already logged (same rule as History.target_from_url)."""
+    History = apps.get_model('record', 'History')
+    batch = []
+    for history in History.objects.exclude(url__isnull=True).only('id', 'url').iterator(chunk_size=2000):
+        match = TARGET_RE.search(history.url)
+        if match:
+            history.target_model, history.object_id = match.group(1), int(match.group(2))
+            batch.append(history)
+        if len(batch) >= 2000:
+            History.objects.bulk_update(batch, ['target_model', 'object_id'])
+            batch = []
+    History.objects.bulk_update(batch, ['target_model', 'object_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0009_history_time_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='history',
+            name='object_id',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='target_model',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['user', 'target_model', 'object_id', '-time'], name='history_target_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['user', '-time'], name='history_user_time_idx'),
+        ),
+        migrations.RunPython(fill_targets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0010_history_target'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['class_name', 'title', 'show_in_report', 'include_in_total'], name='record_class_term_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['class_name', 'name'], name='student_class_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentrecord',
+            index=models.Index(fields=['record', 'student', 'score'], name='studentrecord_record_idx'),
+        ),
+    ]
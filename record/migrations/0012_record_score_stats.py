@@ -0,0 +1,72 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:16
+
+from django.db import migrations, models
+from django.db.models import Case, Count, F, Max, Min, Sum, When
+
+
+def fill_score_stats(apps, schema_editor):
+    """Populate the new aggregates from existing scores (same as Record.rebuild_score_stats)."""
+    Record = apps.get_model('record', 'Record')
+    StudentRecord = apps.get_model('record', 'StudentRecord')
+
+    passed = Case(When(score__gte=F('record__total_score') * 0.5, then=1), default=0)
+    stats = {
+        row.pop('record_id'): row
+        for row in StudentRecord.objects.values('record_id').annotate(
+            score_count=Count('id'),
+            score_sum=Sum('score'),
+            score_sum_sq=Sum(F('score') * F('score')),
+            score_min=Min('score'),
+            score_max=Max('score'),
+            pass_count=Sum(passed),
+        ).order_by()
+    }
+    records = list(Record.objects.filter(id__in=stats).only('id'))
+    for record in records:
+        for field, value in stats[record.id].items():
+            setattr(record, field, value)
+    Record.objects.bulk_update(
+        records, ['score_count', 'score_sum', 'score_sum_sq', 'score_min', 'score_max', 'pass_count'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0011_report_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='pass_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_max',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_min',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_sum',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='record',
+            name='score_sum_sq',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_score_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, FloatField, Max, Min, Q, Sum
+from django.db.models.functions import Cast
+
+
+def fill_score_rollups(apps, schema_editor):
+    """Populate the new table from the records' score aggregates (same sums as ScoreRollup.rebuild)."""
+    Record = apps.get_model('record', 'Record')
+    ScoreRollup = apps.get_model('record', 'ScoreRollup')
+
+    scored = Q(total_score__gt=0)
+    rows = [
+        ScoreRollup(subject_id=sums.pop('subject_id'), class_name_id=sums.pop('class_name_id'),
+                    term=sums.pop('title'), user_id=sums.pop('class_name__user'),
+                    session=sums.pop('class_name__session'), **sums)
+        for sums in Record.objects.filter(
+            subject__isnull=False, class_name__isnull=False, title__isnull=False
+        ).values('subject_id', 'class_name_id', 'title', 'class_name__user', 'class_name__session').annotate(
+            percent_sum=Sum(Cast('score_sum', FloatField()) * 100 / F('total_score'), filter=scored, default=0),
+            best_percent=Max(Cast('score_max', FloatField()) * 100 / F('total_score'), filter=scored),
+            worst_percent=Min(Cast('score_min', FloatField()) * 100 / F('total_score'), filter=scored),
+            record_count=Count('id'),
+            score_count=Sum('score_count', default=0),
+            score_sum=Sum('score_sum', default=0),
+            pass_count=Sum('pass_count', default=0),
+        ).order_by()
+    ]
+    ScoreRollup.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0012_record_score_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(choices=[('First Term', 'First Term'), ('Second Term', 'Second Term'), ('Third Term', 'Third Term')], max_length=20)),
+                ('session', models.CharField(max_length=20)),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('score_count', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.BigIntegerField(default=0)),
+                ('percent_sum', models.FloatField(default=0)),
+                ('pass_count', models.PositiveIntegerField(default=0)),
+                ('best_percent', models.FloatField(blank=True, null=True)),
+                ('worst_percent', models.FloatField(blank=True, null=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('class_name', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='record.class')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='record.subjectteacher')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='record.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'term'], name='scorerollup_user_term_idx')],
+                'unique_together': {('subject', 'class_name', 'term')},
+            },
+        ),
+        migrations.RunPython(fill_score_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.4 on 2026-10-18 13:24
+
+from django.db import migrations
+
+# Same documents as record.search.DOCUMENTS: rowid = id * 8 + kind.
+FILL = [
+    """
+    INSERT INTO record_search (rowid, tags, title, body)
+    SELECT t.id * 8 + 1, 'u' || t.user_id || ' student', t.name,
+           COALESCE(t.admission_number, '') || ' ' || COALESCE(t.contact_info, '') || ' '
+           || COALESCE(c.name || ' ' || c.batch, '')
+    FROM record_student t LEFT JOIN record_class c ON c.id = t.class_name_id
+    """,
+    """
+    INSERT INTO record_search (rowid, tags, title, body)
+    SELECT t.id * 8 + 2, 'u' || t.user_id || ' record',
+           COALESCE(s.name || ' ', '') || t.record_type || ' ' || COALESCE(t.record_number, ''),
+           COALESCE(t.title, '') || ' ' || COALESCE(c.name || ' ' || c.batch, '')
+    FROM record_record t
+    LEFT JOIN record_subjectteacher st ON st.id = t.subject_id
+    LEFT JOIN record_subject s ON s.id = st.subject_id
+    LEFT JOIN record_class c ON c.id = t.class_name_id
+    """,
+    """
+    INSERT INTO record_search (rowid, tags, title, body)
+    SELECT t.id * 8 + 3, 'u' || t.user_id || ' class', t.name || ' ' || t.batch, COALESCE(t.session, '')
+    FROM record_class t
+    """,
+    """
+    INSERT INTO record_search (rowid, tags, title, body)
+    SELECT t.id * 8 + 4, 'shared subject', t.name, '' FROM record_subject t
+    """,
+    """
+    INSERT INTO record_search (rowid, tags, title, body)
+    SELECT t.id * 8 + 5, 'u' || t.user_id || ' topic', t.title, COALESCE(s.name, '') || ' ' || COALESCE(t.content, '')
+    FROM record_topic t LEFT JOIN record_subject s ON s.id = t.subject_id
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    """FTS5 is SQLite-only; other databases keep the icontains search."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS record_search USING fts5("
+        "tags, title, body, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3')"
+    )
+    for sql in FILL:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS record_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('record', '0013_scorerollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,6 +1,13 @@
 from django.db import models
+from django.db.models import Q, Sum, Count, F, Min, Max, Case, When, Value, OuterRef, Subquery
+from django.db.models.functions import Cast, Coalesce, Greatest, Least
 from django.shortcuts import reverse
+from django.dispatch import Signal
+import math
 import secrets
+import threading
+from contextlib import contextmanager
+from graphlib import CycleError, TopologicalSorter
 import hashlib
 from django.db import models
 from itsdangerous import TimestampSigner, BadSignature
@@ -26,6 +33,13 @@ class UserQuerySet(models.QuerySet):
     def for_user(self, user):
         return self.filter(user=user)
 
+    def delete(self):
+        # Scores and search rows the delete cascades to are dealt with once,
+        # at the end (ScoreRefresh, SearchIndex.deferred).
+        from .search import SearchIndex
+        with ScoreRefresh.deferred(), SearchIndex.deferred():
+            return super().delete()
+
 class StudentRecordQuerySet(UserQuerySet):
     def by_score_range(self, min_score, max_score):
         return self.filter(score__gte=min_score, score__lte=max_score)
@@ -53,6 +67,12 @@ class School(models.Model):
   def __str__(self):
     return self.name
 
+TOKEN_MAX_AGE = 60 * 60 * 24
+
+# A score passes at this percentage of its record's total_score.
+PASS_MARK = 50
+
+
 class User(models.Model):
     full_name = models.CharField(max_length=500, blank=True,null=True)
     username = models.CharField(max_length=255, unique=True)
@@ -91,14 +111,20 @@ class User(models.Model):
         token = signer.sign(f"{self.id}:{uuid4()}").decode()
         return token
 
-    def verify_token(self, token, max_age=60*60*24):
+    def verify_token(self, token, max_age=TOKEN_MAX_AGE):
+          return self.token_expiry(token, max_age) is not None
+
+    def token_expiry(self, token, max_age=TOKEN_MAX_AGE):
+          """Unix time at which a valid token of this user's expires; None if it isn't valid."""
           signer = TimestampSigner(self.secret_key)
           try:
-              unsigned = signer.unsign(token, max_age=max_age).decode()
-              user_id, _ = unsigned.split(":")  # Grab the ID part
-              return str(self.id) == user_id
-          except BadSignature:
-              return False
+              unsigned, signed_at = signer.unsign(token, max_age=max_age, return_timestamp=True)
+              user_id, _ = unsigned.decode().split(":")  # Grab the ID part
+          except (BadSignature, ValueError):
+              return None
+          if str(self.id) != user_id:
+              return None
+          return signed_at.timestamp() + max_age
 
 
 class UserModel(models.Model):
@@ -108,6 +134,11 @@ class UserModel(models.Model):
     class Meta:
         abstract = True
 
+    def delete(self, *args, **kwargs):
+        from .search import SearchIndex
+        with ScoreRefresh.deferred(), SearchIndex.deferred():
+            return super().delete(*args, **kwargs)
+
 
 CLASSES = [
     ("JSS1", "JSS1"),
@@ -151,6 +182,11 @@ class Student(UserModel):
 
   class Meta:
     unique_together = ("name","class_name")
+    indexes = [
+      # A class's students in name order (rosters, score entry, report cards)
+      # without a sort step; the unique index above leads with name instead.
+      models.Index(fields=["class_name", "name"], name="student_class_name_idx"),
+    ]
 
   def __str__(self):
     return self.name
@@ -230,13 +266,156 @@ class Record(UserModel):
         default=True,
         help_text="If unchecked, scores from this record are shown but excluded from total score and percentage in reports."
     )
+    # Parsed form of `logic` plus the ids of the records it references,
+    # filled in on save by compile_logic().
+    compiled_logic = models.JSONField(null=True, blank=True, editable=False)
+    # Dependency graph: the records this one's logic references. Kept in
+    # step with compiled_logic on save; `dependents` is the reverse side.
+    depends_on = models.ManyToManyField(
+        'self', symmetrical=False, related_name='dependents', blank=True, editable=False
+    )
+    # Running aggregates over this record's scores, folded in one score at
+    # a time by the StudentRecord signal handlers (apply_score_change) and
+    # recomputed on bulk writes; `manage.py rebuild_record_stats` repairs drift.
+    score_count = models.PositiveIntegerField(default=0, editable=False)
+    score_sum = models.BigIntegerField(default=0, editable=False)
+    score_sum_sq = models.BigIntegerField(default=0, editable=False)
+    score_min = models.IntegerField(null=True, blank=True, editable=False)
+    score_max = models.IntegerField(null=True, blank=True, editable=False)
+    pass_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         unique_together = ("title", "subject", "class_name", "record_type", "record_number")
+        # The unique index above already covers _next_record_number's
+        # (title, subject, class_name, record_type) lookup. This one serves
+        # the per-class/term report filters (positions, score matrix, totals).
+        indexes = [
+            models.Index(fields=["class_name", "title", "show_in_report", "include_in_total"],
+                         name="record_class_term_idx"),
+        ]
 
     def __str__(self):
         return f"{self.title} {self.subject} {self.record_type} {self.class_name} ({self.record_number})"
 
+    # ── Score statistics ───────────────────────────────────────────────────
+
+    STAT_FIELDS = ['score_count', 'score_sum', 'score_sum_sq', 'score_min', 'score_max', 'pass_count']
+
+    def passes(self, score):
+        return score >= self.total_score * PASS_MARK / 100
+
+    @property
+    def score_mean(self):
+        return self.score_sum / self.score_count if self.score_count else None
+
+    @property
+    def score_std(self):
+        """Population standard deviation, from the running sums."""
+        if not self.score_count:
+            return None
+        mean = self.score_sum / self.score_count
+        return math.sqrt(max(self.score_sum_sq / self.score_count - mean * mean, 0))
+
+    @property
+    def pass_rate(self):
+        return self.pass_count / self.score_count * 100 if self.score_count else None
+
+    def apply_score_change(self, old=None, new=None):
+        """
+        Fold one score change into the running aggregates with a single
+        UPDATE: an insert (old is None), an edit, or a delete (new is None).
+        Count, sums and pass count move by the difference. The min/max only
+        need the remaining scores when the old score was the extreme itself;
+        then they're re-read from the (record, student, score) index inside
+        the same statement.
+        """
+        def contribution(score):
+            if score is None:
+                return 0, 0, 0, 0
+            return 1, score, score * score, int(self.passes(score))
+
+        (n_new, sum_new, sq_new, pass_new) = contribution(new)
+        (n_old, sum_old, sq_old, pass_old) = contribution(old)
+
+        if old is None:
+            score_min = Least(Coalesce('score_min', Value(new)), Value(new))
+            score_max = Greatest(Coalesce('score_max', Value(new)), Value(new))
+        else:
+            remaining = StudentRecord.objects.filter(record_id=OuterRef('pk')).values('record_id').order_by()
+            kept_min = F('score_min') if new is None else Least('score_min', Value(new))
+            kept_max = F('score_max') if new is None else Greatest('score_max', Value(new))
+            score_min = Case(When(score_min__lt=old, then=kept_min),
+                             default=Subquery(remaining.annotate(v=Min('score')).values('v')))
+            score_max = Case(When(score_max__gt=old, then=kept_max),
+                             default=Subquery(remaining.annotate(v=Max('score')).values('v')))
+
+        Record.objects.filter(pk=self.pk).update(
+            score_count=F('score_count') + (n_new - n_old),
+            score_sum=F('score_sum') + (sum_new - sum_old),
+            score_sum_sq=F('score_sum_sq') + (sq_new - sq_old),
+            pass_count=F('pass_count') + (pass_new - pass_old),
+            score_min=score_min,
+            score_max=score_max,
+        )
+
+    @classmethod
+    def rebuild_score_stats(cls, records=None, dry_run=False):
+        """
+        Recompute the aggregates of `records` (a queryset; default all) from
+        StudentRecord: one grouped query, then a bulk_update of the records
+        that had drifted (skipped with dry_run). Returns how many were wrong.
+        """
+        records = cls.objects.all() if records is None else records
+        # Qs can't compare two columns, so the pass test is done as a sum of
+        # a CASE over score against the joined total_score.
+        passed = Case(When(score__gte=F('record__total_score') * (PASS_MARK / 100), then=1), default=0)
+        fresh = {
+            row.pop('record_id'): row
+            for row in StudentRecord.objects.filter(record__in=records).values('record_id').annotate(
+                score_count=Count('id'),
+                score_sum=Sum('score'),
+                score_sum_sq=Sum(F('score') * F('score')),
+                score_min=Min('score'),
+                score_max=Max('score'),
+                pass_count=Sum(passed),
+            ).order_by()
+        }
+        empty = dict(score_count=0, score_sum=0, score_sum_sq=0, score_min=None, score_max=None, pass_count=0)
+
+        stale = []
+        for record in records.only('id', *cls.STAT_FIELDS).order_by('id').iterator(chunk_size=2000):
+            values = fresh.get(record.id, empty)
+            if any(getattr(record, field) != values[field] for field in cls.STAT_FIELDS):
+                for field in cls.STAT_FIELDS:
+                    setattr(record, field, values[field])
+                stale.append(record)
+        if not dry_run:
+            cls.objects.bulk_update(stale, cls.STAT_FIELDS, batch_size=500)
+        return len(stale)
+
+    def refresh_score_stats(self):
+        """Recompute this record's aggregates in one UPDATE, after a bulk write to its scores."""
+        Record.refresh_score_stats_of([self.pk])
+
+    @classmethod
+    def refresh_score_stats_of(cls, record_ids):
+        """refresh_score_stats() for several records, still in one UPDATE."""
+        scores = StudentRecord.objects.filter(record_id=OuterRef('pk')).values('record_id').order_by()
+        passed = Q(score__gte=F('record__total_score') * (PASS_MARK / 100))
+
+        def aggregate(expression, default=None):
+            value = Subquery(scores.annotate(v=expression).values('v'))
+            return value if default is None else Coalesce(value, default)
+
+        cls.objects.filter(pk__in=record_ids).update(
+            score_count=aggregate(Count('id'), 0),
+            score_sum=aggregate(Sum('score'), 0),
+            score_sum_sq=aggregate(Sum(F('score') * F('score')), 0),
+            score_min=aggregate(Min('score')),
+            score_max=aggregate(Max('score')),
+            pass_count=aggregate(Count('id', filter=passed), 0),
+        )
+
     def _next_record_number(self):
         """
         Auto-assign the next record_number within this record's own scope
@@ -253,7 +432,98 @@ class Record(UserModel):
 
         return (existing_max or 0) + 1
 
+    @property
+    def formula(self):
+        """The compiled Formula for `logic` (parsed once per process), or None."""
+        from .formula import compile_formula
+        return compile_formula(self.logic) if self.logic else None
+
+    def _resolve_reference(self, ref):
+        """Record id for one formula Reference, looked up relative to this record."""
+        filters = {
+            'class_name': self.class_name,
+            'title': ref.term or self.title,
+            'record_type': ref.record_type or self.record_type,
+            'record_number': ref.number,
+        }
+        if ref.subject:
+            filters['subject__subject__name__iexact'] = ref.subject
+        else:
+            filters['subject'] = self.subject
+
+        record_id = Record.objects.filter(**filters).values_list('id', flat=True).first()
+        if record_id is None:
+            where = ":".join(str(part) for part in (
+                filters['title'], ref.subject, filters['record_type'], ref.number) if part)
+            raise ValidationError(f"Referenced record not found: @{where}")
+        if self.pk and record_id == self.pk:
+            raise ValidationError("A record's logic can't reference the record itself")
+        return record_id
+
+    def compile_logic(self):
+        """
+        Parse `logic` and resolve every @reference to a Record, raising
+        ValidationError if either fails. Returns the value stored in
+        compiled_logic (None when there's no logic).
+        """
+        if not self.logic:
+            return None
+
+        key = (self.logic, self.title, self.subject_id, self.class_name_id, self.record_type)
+        cached = getattr(self, '_compiled_for', None)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        compiled = self.formula.to_json()
+        compiled['record_ids'] = [self._resolve_reference(ref) for ref in self.formula.references]
+        self._check_for_cycle(compiled['record_ids'])
+        self._compiled_for = (key, compiled)
+        return compiled
+
+    def _check_for_cycle(self, record_ids):
+        """
+        Walk the dependency graph outwards from the records this logic
+        references, one query per level; reaching this record again means
+        saving would create a cycle (e.g. CA = @Exam:1 while Exam 1 = @CA).
+        """
+        if not self.pk:
+            return
+        through = Record.depends_on.through
+        seen = set()
+        frontier = set(record_ids)
+        while frontier:
+            if self.pk in frontier:
+                raise ValidationError("This logic creates a circular reference between records")
+            seen |= frontier
+            frontier = set(
+                through.objects.filter(from_record_id__in=frontier)
+                .values_list('to_record_id', flat=True)
+            ) - seen
+
+    def logic_record_ids(self):
+        """Ids of the referenced records, in the formula's reference order."""
+        if self.compiled_logic is None or self.compiled_logic.get('source') != (self.logic or '').strip():
+            self.compiled_logic = self.compile_logic()
+            if self.pk:
+                Record.objects.filter(pk=self.pk).update(compiled_logic=self.compiled_logic)
+                self.depends_on.set(self.compiled_logic['record_ids'] if self.compiled_logic else [])
+        return self.compiled_logic['record_ids'] if self.compiled_logic else []
+
+    def clean(self):
+        super().clean()
+        if self.logic:
+            try:
+                self.compile_logic()
+            except ValidationError as e:
+                raise ValidationError({'logic': e.messages})
+
     def save(self, *args, **kwargs):
+        # The record, its computed scores and the totals derived from them
+        # are written in one transaction.
+        with ScoreRefresh.deferred():
+            self._save(*args, **kwargs)
+
+    def _save(self, *args, **kwargs):
         is_new = self.pk is None
 
         # Auto-number on create only — never renumber an existing record
@@ -261,65 +531,110 @@ class Record(UserModel):
         if is_new and not self.record_number:
             self.record_number = self._next_record_number()
 
+        # Parse and validate the formula once here, so students are only
+        # ever evaluated against an already-compiled form.
+        previous = self.compiled_logic
+        self.compiled_logic = self.compile_logic()
+        logic_changed = previous != self.compiled_logic
+
+        # The score aggregates are kept by their own UPDATEs; don't write
+        # back whatever copy of them this instance happened to load.
+        if not is_new and not args and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.STAT_FIELDS
+            ]
+
         super().save(*args, **kwargs)
 
+        if is_new or logic_changed:
+            self.depends_on.set(self.compiled_logic['record_ids'] if self.compiled_logic else [])
+
         # Auto-create StudentRecords if enabled and logic exists
         if is_new and self.logic and self.auto_create_records:
             self.create_student_records_with_logic()
+        elif logic_changed and self.logic:
+            self.evaluate_logic_for_class(create_missing=self.auto_create_records)
+
+    def evaluate_logic_for_class(self, create_missing=True, update_existing=True, student_ids=None):
+        """
+        Evaluate this record's formula for every student in the class at
+        once (or only for `student_ids`, when propagating a single edit).
+
+        The referenced records' scores and this record's current scores are
+        read in one query and laid out as one column per reference; the
+        compiled formula runs over those columns, and results go back with
+        one bulk_create for students who have no row yet and one
+        bulk_update for rows whose score changed.
+        Returns {'created': n, 'updated': n}.
+        """
+        if not self.logic:
+            return {'created': 0, 'updated': 0}
+
+        record_ids = self.logic_record_ids()
+        students = Student.objects.filter(class_name_id=self.class_name_id)
+        if student_ids is not None:
+            students = students.filter(id__in=student_ids)
+        student_ids = list(students.order_by('id').values_list('id', flat=True))
+        scores = {}
+        existing = {}
+        for pk, student_id, record_id, score in StudentRecord.objects.filter(
+            student_id__in=student_ids, record_id__in=record_ids + [self.id]
+        ).values_list('id', 'student_id', 'record_id', 'score'):
+            if record_id == self.id:
+                existing[student_id] = StudentRecord(id=pk, student_id=student_id, score=score)
+            else:
+                scores[(student_id, record_id)] = score
+        columns = [[scores.get((student_id, record_id), 0) for student_id in student_ids]
+                   for record_id in record_ids]
+        results = self.formula.evaluate_columns(columns, len(student_ids))
+
+        to_create, to_update = [], []
+        for student_id, score in zip(student_ids, results):
+            sr = existing.get(student_id)
+            if sr is None:
+                if create_missing:
+                    to_create.append(StudentRecord(user=self.user, student_id=student_id, record=self, score=score))
+            elif update_existing and sr.score != score:
+                sr.score = score
+                to_update.append(sr)
+
+        with ScoreRefresh.deferred():
+            StudentRecord.objects.bulk_create(to_create, batch_size=500)
+            StudentRecord.objects.bulk_update(to_update, ['score'], batch_size=500)
+            changed = [sr.student_id for sr in to_create + to_update]
+            if changed:
+                scores_bulk_changed.send(sender=Record, record=self, student_ids=changed)
+        return {'created': len(to_create), 'updated': len(to_update)}
 
-    @transaction.atomic
     def create_student_records_with_logic(self):
         """
         Create StudentRecords for all students in this class.
         Only creates records that don't already exist.
         """
-        students = Student.objects.filter(class_name=self.class_name)
-
-        created_count = 0
-        failed_students = []
-
-        for student in students:
-            # Skip if StudentRecord already exists
-            if StudentRecord.objects.filter(student=student, record=self).exists():
-                continue
-
-            try:
-                # Create the StudentRecord - it will auto-calculate via save()
-                StudentRecord.objects.create(
-                    student=student,
-                    record=self,
-                    score=0  # Will be overwritten by process_logic in save()
-                )
-                created_count += 1
-            except Exception as e:
-                failed_students.append({
-                    'student': student.name,
-                    'error': str(e)
-                })
-
+        try:
+            result = self.evaluate_logic_for_class(update_existing=False)
+        except ValidationError as e:
+            return {'created': 0, 'failed': [{'student': str(self.class_name), 'error': '; '.join(e.messages)}]}
         return {
-            'created': created_count,
-            'failed': failed_students
+            'created': result['created'],
+            'failed': []
         }
 
     def recalculate_all_student_scores(self):
         """
         Recalculate scores for all existing StudentRecords.
         Useful when logic is updated or dependent records change.
+        Returns how many scores changed.
         """
-        student_records = StudentRecord.objects.filter(record=self)
-        updated_count = 0
+        return self.evaluate_logic_for_class(create_missing=False)['updated']
 
-        for sr in student_records:
-            try:
-                if self.logic:
-                    sr.score = sr.process_logic()
-                    sr.save()
-                    updated_count += 1
-            except Exception as e:
-                print(f"Failed to recalculate for {sr.student.name}: {e}")
 
-        return updated_count
+# Sent after StudentRecord rows for `record` are written with
+# bulk_create/bulk_update, which skip post_save, so the handlers in
+# signals.py can refresh whatever is derived from those scores.
+# Arguments: record, student_ids.
+scores_bulk_changed = Signal()
 
 
 class StudentRecord(UserModel):
@@ -329,74 +644,44 @@ class StudentRecord(UserModel):
 
     class Meta:
         unique_together = ("student", "record")
+        indexes = [
+            # Record-first and covering score: every student's score on a set
+            # of records (score matrix, totals, bulk entry) straight from the
+            # index, without visiting the table.
+            models.Index(fields=["record", "student", "score"], name="studentrecord_record_idx"),
+        ]
 
     def __str__(self):
         return f"{self.student.name} {self.record.title} {self.record.subject}"
-        
-    def _get_referenced_record_score(self, ref_pattern):
-      parts = ref_pattern.strip('@').split(':')
-      if not parts:
-          raise ValidationError("Empty reference")
-  
-      # Detect if first part is a term
-      valid_terms = [choice[0] for choice in TERM_CHOICES]
-      term = None
-      if parts[0] in valid_terms:
-          term = parts[0]
-          parts = parts[1:]  # remove term part
-  
-      # Now parse the remaining parts
-      filters = {'evaluation__student': self.student}
-  
-      if term:
-          filters['title'] = term
-      else:
-          filters['title'] = self.record.title
-  
-      # common filters: subject and class
-      filters['subject'] = self.record.subject
-      filters['class_name'] = self.record.class_name
-  
-      if len(parts) == 1:
-          # only record number
-          filters['record_number'] = int(parts[0])
-          filters['record_type'] = self.record.record_type
-      elif len(parts) == 2:
-          # record_type:record_number
-          filters['record_type'] = parts[0]
-          filters['record_number'] = int(parts[1])
-      elif len(parts) == 3:
-          # title:record_type:record_number
-          filters['title'] = parts[0]
-          filters['record_type'] = parts[1]
-          filters['record_number'] = int(parts[2])
-      elif len(parts) == 4:
-          # title:subject_name:record_type:record_number
-          subject_teacher = SubjectTeacher.objects.filter(
-              subject__name=parts[1],
-              user=self.record.user
-          ).first()
-          if not subject_teacher:
-              raise ValidationError(f"Subject '{parts[1]}' not found for this teacher")
-          filters['title'] = parts[0]
-          filters['subject'] = subject_teacher
-          filters['record_type'] = parts[2]
-          filters['record_number'] = int(parts[3])
-      else:
-          raise ValidationError(f"Invalid reference format: {ref_pattern}")
-  
-      try:
-          referenced_record = Record.objects.get(**filters)
-          student_record = StudentRecord.objects.get(
-              student=self.student,
-              record=referenced_record
-          )
-          return student_record.score
-      except Record.DoesNotExist:
-          raise ValidationError(f"Referenced record not found: {ref_pattern}")
-      except StudentRecord.DoesNotExist:
-          raise ValidationError(f"Student record for referenced record not found: {ref_pattern}")
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember what was loaded, so a later save can fold just the
+        # difference into the record's running aggregates.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded = (instance.__dict__.get('record_id'), instance.__dict__.get('score'))
+        return instance
+
+    def process_logic(self):
+        """
+        Score for a computed record: evaluate the record's compiled formula
+        against this student's scores on the referenced records. A missing
+        referenced score counts as 0, the same as on the report card.
+        """
+        record_ids = self.record.logic_record_ids()
+        scores = dict(
+            StudentRecord.objects.filter(student_id=self.student_id, record_id__in=record_ids)
+            .values_list('record_id', 'score')
+        )
+        return self.record.formula.evaluate([scores.get(record_id, 0) for record_id in record_ids])
+
+    def save(self, *args, **kwargs):
+        # The score and everything derived from it commit together.
+        with ScoreRefresh.deferred():
+            if self.record.logic:
+                self.score = self.process_logic()
+            super().save(*args, **kwargs)
+
 
 # MANAGEMENT COMMAND OR ADMIN ACTION
 # Use this to manually trigger student record creation if needed
@@ -421,14 +706,34 @@ def bulk_create_student_records_for_record(record_id):
         }
 
 
+HISTORY_TARGET_RE = re.compile(r"/(class|record|student|subject|topic)/(\d+)/")
+
+
 class History(UserModel):
   title = models.CharField(max_length=1000000,null=True,blank=True)
   url = models.URLField(null=True,blank=True)
-  time = models.DateTimeField(auto_now_add=True,null=True,blank=True)
+  # Set by HistoryBuffer to the time of the hit, not of the (later) flush.
+  time = models.DateTimeField(default=timezone.now,null=True,blank=True)
+  # What the page was about, parsed from the url on write ("class", 12),
+  # so per-object activity is an index lookup rather than a LIKE scan.
+  target_model = models.CharField(max_length=20,null=True,blank=True)
+  object_id = models.PositiveIntegerField(null=True,blank=True)
+
+  class Meta:
+    indexes = [
+      models.Index(fields=["user", "target_model", "object_id", "-time"], name="history_target_idx"),
+      models.Index(fields=["user", "-time"], name="history_user_time_idx"),
+    ]
 
   def __str__(self):
     return self.title
 
+  @staticmethod
+  def target_from_url(url):
+    """'/class/12/records/' -> ('class', 12); (None, None) if the url isn't about one object."""
+    match = HISTORY_TARGET_RE.search(url or "")
+    return (match.group(1), int(match.group(2))) if match else (None, None)
+
 
 class Topic(UserModel):
   subject = models.ForeignKey(Subject,related_name='topic',on_delete=models.CASCADE)
@@ -485,3 +790,444 @@ class TermReport(UserModel):
 
     def __str__(self):
         return f"{self.student.name} - {self.term} {self.session}"
+
+
+# ═══════════════════════════════════════════════════════════════
+# SubjectTermTotal (materialized per-student subject totals)
+# ═══════════════════════════════════════════════════════════════
+
+class SubjectTermTotal(models.Model):
+    """
+    One pre-summed row per (student, subject teacher, class, term) that
+    the student has at least one score in, so reports can read totals
+    instead of re-summing StudentRecord on every request.
+
+    Column meanings mirror the report card:
+      - ca_total / exam_total: scores on records shown in the report,
+        split into exams vs everything else.
+      - obtained / obtainable: scores and total_score of records that are
+        shown in the report AND counted in totals (obtainable covers every
+        such record, whether or not the student has a score for it).
+      - score_sum / score_count: every score entered, regardless of the
+        report flags, for plain averages.
+
+    Kept current by ScoreRefresh, which calls refresh() once per group
+    for each batch of score writes; `manage.py rebuild_subject_totals`
+    rebuilds it from scratch.
+    """
+    student = models.ForeignKey(Student, related_name="subject_totals", on_delete=models.CASCADE)
+    subject = models.ForeignKey(SubjectTeacher, related_name="student_totals", on_delete=models.CASCADE)
+    class_name = models.ForeignKey(Class, related_name="subject_totals", on_delete=models.CASCADE)
+    term = models.CharField(max_length=20, choices=TERM_CHOICES)
+    session = models.CharField(max_length=20)
+
+    obtained = models.IntegerField(default=0)
+    obtainable = models.IntegerField(default=0)
+    ca_total = models.IntegerField(default=0)
+    exam_total = models.IntegerField(default=0)
+    score_sum = models.IntegerField(default=0)
+    score_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("student", "subject", "class_name", "term")
+
+    def __str__(self):
+        return f"{self.student_id} {self.subject_id} {self.term}: {self.obtained}/{self.obtainable}"
+
+    @staticmethod
+    def _score_sums():
+        shown = Q(record__show_in_report=True)
+        counted = shown & Q(record__include_in_total=True)
+        exam = Q(record__record_type="Exam")
+        return {
+            'obtained': Sum('score', filter=counted, default=0),
+            'ca_total': Sum('score', filter=shown & ~exam, default=0),
+            'exam_total': Sum('score', filter=shown & exam, default=0),
+            'score_sum': Sum('score', default=0),
+            'score_count': Count('id'),
+        }
+
+    @classmethod
+    def refresh(cls, subject_id, class_id, term, student_ids=None):
+        """
+        Recompute the rows for one subject teacher/class/term — every
+        student in it, or just `student_ids`. Four queries whatever the
+        number of students: the class's session and obtainable total, the
+        grouped score sums, a delete for students left with no scores, and
+        one upsert.
+        """
+        if not subject_id or not class_id or not term:
+            return
+
+        records = Record.objects.filter(subject_id=subject_id, class_name_id=class_id, title=term)
+        counted = Q(record__subject_id=subject_id, record__title=term,
+                    record__show_in_report=True, record__include_in_total=True)
+        group = Class.objects.filter(id=class_id).aggregate(
+            session=Max('session'), obtainable=Sum('record__total_score', filter=counted, default=0)
+        )
+        session, obtainable = group['session'], group['obtainable']
+        if session is None:
+            return
+
+        scores = StudentRecord.objects.filter(record__in=records)
+        if student_ids is not None:
+            scores = scores.filter(student_id__in=student_ids)
+
+        rows = [
+            cls(subject_id=subject_id, class_name_id=class_id, term=term, session=session,
+                obtainable=obtainable, **sums)
+            for sums in scores.values('student_id').annotate(**cls._score_sums()).order_by()
+        ]
+
+        stale = cls.objects.filter(subject_id=subject_id, class_name_id=class_id, term=term)
+        if student_ids is not None:
+            stale = stale.filter(student_id__in=student_ids)
+        stale.exclude(student_id__in=[row.student_id for row in rows]).delete()
+
+        cls.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['student', 'subject', 'class_name', 'term'],
+            update_fields=['session', 'obtained', 'obtainable', 'ca_total', 'exam_total',
+                           'score_sum', 'score_count'],
+        )
+
+    @classmethod
+    def rebuild(cls, class_ids=None):
+        """Throw away and recompute every row (optionally only for some classes). Returns the row count."""
+        records = Record.objects.filter(subject__isnull=False, class_name__isnull=False)
+        if class_ids:
+            records = records.filter(class_name_id__in=class_ids)
+
+        obtainable = {
+            (row['subject_id'], row['class_name_id'], row['title']): row['total']
+            for row in records.filter(show_in_report=True, include_in_total=True)
+            .values('subject_id', 'class_name_id', 'title')
+            .annotate(total=Sum('total_score')).order_by()
+        }
+        sessions = dict(Class.objects.filter(record__in=records).values_list('id', 'session').distinct())
+
+        rows = []
+        for sums in (
+            StudentRecord.objects.filter(record__in=records)
+            .values('student_id', 'record__subject_id', 'record__class_name_id', 'record__title')
+            .annotate(**cls._score_sums()).order_by()
+        ):
+            key = (sums.pop('record__subject_id'), sums.pop('record__class_name_id'), sums.pop('record__title'))
+            rows.append(cls(
+                subject_id=key[0], class_name_id=key[1], term=key[2],
+                session=sessions[key[1]], obtainable=obtainable.get(key, 0), **sums
+            ))
+
+        with transaction.atomic():
+            stale = cls.objects.all()
+            if class_ids:
+                stale = stale.filter(class_name_id__in=class_ids)
+            stale.delete()
+            cls.objects.bulk_create(rows, batch_size=500)
+        return len(rows)
+
+
+# ═══════════════════════════════════════════════════════════════
+# ScoreRollup (pre-aggregated analytics per teacher/class/subject/term)
+# ═══════════════════════════════════════════════════════════════
+
+class ScoreRollup(UserModel):
+    """
+    One row per (subject teacher, class, term) summing the running score
+    aggregates of its records, so the analytics dashboard reads a handful
+    of rollups rather than every score the teacher ever entered.
+
+      - record_count / score_count / score_sum / pass_count: totals over
+        the group's records.
+      - percent_sum: every score as a percentage of its record's
+        total_score, summed; percent_sum / score_count is the average.
+      - best_percent / worst_percent: the highest and lowest percentage.
+
+    Rebuilt from Record (never from StudentRecord) by refresh(), which
+    ScoreRefresh calls once per group whenever a record's aggregates move.
+    `manage.py rebuild_score_rollups` rebuilds it from scratch.
+    """
+    subject = models.ForeignKey(SubjectTeacher, related_name="rollups", on_delete=models.CASCADE)
+    class_name = models.ForeignKey(Class, related_name="rollups", on_delete=models.CASCADE)
+    term = models.CharField(max_length=20, choices=TERM_CHOICES)
+    session = models.CharField(max_length=20)
+
+    record_count = models.PositiveIntegerField(default=0)
+    score_count = models.PositiveIntegerField(default=0)
+    score_sum = models.BigIntegerField(default=0)
+    percent_sum = models.FloatField(default=0)
+    pass_count = models.PositiveIntegerField(default=0)
+    best_percent = models.FloatField(null=True, blank=True)
+    worst_percent = models.FloatField(null=True, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("subject", "class_name", "term")
+        indexes = [
+            models.Index(fields=["user", "term"], name="scorerollup_user_term_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject_id} {self.class_name_id} {self.term}: {self.score_count} scores"
+
+    @staticmethod
+    def _record_sums():
+        scored = Q(total_score__gt=0)
+        percent = Cast('score_sum', models.FloatField()) * 100 / F('total_score')
+        best = Cast('score_max', models.FloatField()) * 100 / F('total_score')
+        worst = Cast('score_min', models.FloatField()) * 100 / F('total_score')
+        # The percentages come first: once 'score_sum' is annotated, F('score_sum')
+        # means the annotation rather than the Record column.
+        return {
+            'percent_sum': Sum(percent, filter=scored, default=0),
+            'best_percent': Max(best, filter=scored),
+            'worst_percent': Min(worst, filter=scored),
+            'record_count': Count('id'),
+            'score_count': Sum('score_count', default=0),
+            'score_sum': Sum('score_sum', default=0),
+            'pass_count': Sum('pass_count', default=0),
+        }
+
+    @staticmethod
+    def summarise(rollups, *group_by, **extra):
+        """
+        Combine rollups (a queryset) into one summary dict, or one per
+        distinct `group_by` values, with the averages and rates worked out.
+        `extra` aggregates are computed alongside.
+        """
+        sums = {
+            **extra,
+            'records': Sum('record_count', default=0),
+            'scores': Sum('score_count', default=0),
+            'score_sum': Sum('score_sum', default=0),
+            'percent_sum': Sum('percent_sum', default=0),
+            'passed': Sum('pass_count', default=0),
+            'best_percent': Max('best_percent'),
+            'worst_percent': Min('worst_percent'),
+        }
+        rows = [rollups.aggregate(**sums)] if not group_by else list(
+            rollups.values(*group_by).annotate(**sums).order_by(*group_by)
+        )
+        for row in rows:
+            scores = row['scores']
+            row['avg_score'] = row['score_sum'] / scores if scores else None
+            row['avg_percent'] = row['percent_sum'] / scores if scores else None
+            row['pass_rate'] = row['passed'] / scores * 100 if scores else None
+            row['failed'] = scores - row['passed']
+        return rows if group_by else rows[0]
+
+    @classmethod
+    def refresh(cls, subject_id, class_id, term):
+        """
+        Recompute one subject teacher/class/term from its records'
+        aggregates: one grouped query and one UPDATE (an insert the first
+        time, a delete once the group has no records left).
+        """
+        if not subject_id or not class_id or not term:
+            return
+
+        key = dict(subject_id=subject_id, class_name_id=class_id, term=term)
+        sums = Record.objects.filter(subject_id=subject_id, class_name_id=class_id, title=term).aggregate(
+            user_id=Max('class_name__user'), session=Max('class_name__session'), **cls._record_sums()
+        )
+        if not sums['record_count']:
+            cls.objects.filter(**key).delete()
+            return
+        # A plain UPDATE rather than an upsert, which would run in its own
+        # transaction; the row only needs creating once per group.
+        if not cls.objects.filter(**key).update(updated=timezone.now(), **sums):
+            cls.objects.create(**key, **sums)
+
+    @classmethod
+    def rebuild(cls, class_ids=None):
+        """Throw away and recompute every row (optionally only for some classes). Returns the row count."""
+        records = Record.objects.filter(subject__isnull=False, class_name__isnull=False, title__isnull=False)
+        if class_ids:
+            records = records.filter(class_name_id__in=class_ids)
+
+        rows = [
+            cls(subject_id=sums.pop('subject_id'), class_name_id=sums.pop('class_name_id'),
+                term=sums.pop('title'), user_id=sums.pop('class_name__user'),
+                session=sums.pop('class_name__session'), **sums)
+            for sums in records.values(
+                'subject_id', 'class_name_id', 'title', 'class_name__user', 'class_name__session'
+            ).annotate(**cls._record_sums()).order_by()
+        ]
+
+        with transaction.atomic():
+            stale = cls.objects.all()
+            if class_ids:
+                stale = stale.filter(class_name_id__in=class_ids)
+            stale.delete()
+            cls.objects.bulk_create(rows, batch_size=500)
+        return len(rows)
+
+
+# ═══════════════════════════════════════════════════════════════
+# ScoreRefresh (keeping score-derived data in step with the scores)
+# ═══════════════════════════════════════════════════════════════
+
+class ScoreRefresh:
+    """
+    Brings everything derived from StudentRecord scores up to date after a
+    batch of score writes: computed records, the Record score aggregates,
+    SubjectTermTotal, ScoreRollup and the cached ClassScoreMatrix.
+
+    Score writes run inside ScoreRefresh.deferred(). The signal handlers
+    report what changed (scores_changed, group_changed) and the refresh
+    runs when the outermost block ends, inside its transaction, once per
+    (subject teacher, class, term) however many rows the batch touched. A
+    change reported outside any block is refreshed straight away, in a
+    transaction of its own.
+    """
+
+    _pending = threading.local()
+
+    @classmethod
+    @contextmanager
+    def deferred(cls):
+        """Collect the changes reported inside the block; refresh what they touched at its end."""
+        if getattr(cls._pending, 'batch', None) is not None:
+            yield
+            return
+        batch = cls._pending.batch = {
+            'scores': {},     # record id -> ids of students whose score on it changed
+            'stats': set(),   # record ids whose aggregates need recounting
+            'groups': set(),  # (subject, class, term) whose every total needs refreshing
+            'keys': {},       # record id -> (subject, class, term), when already known
+            'orphaned': set(),  # computed record ids that lost a record their logic reads
+        }
+        try:
+            with transaction.atomic():
+                yield
+                cls._refresh(batch)
+        finally:
+            cls._pending.batch = None
+
+    @classmethod
+    def scores_changed(cls, record, student_ids=(), stats=False):
+        """
+        Scores on `record` (a Record or its id) changed for `student_ids`.
+        `stats` asks for the record's aggregates to be recounted; the
+        single-row paths keep them current themselves (apply_score_change).
+        """
+        with cls.deferred():
+            batch = cls._pending.batch
+            if isinstance(record, Record):
+                batch['keys'][record.pk] = (record.subject_id, record.class_name_id, record.title)
+                record = record.pk
+            batch['scores'].setdefault(record, set()).update(student_ids)
+            if stats:
+                batch['stats'].add(record)
+
+    @classmethod
+    def inputs_removed(cls, record_ids):
+        """
+        A record read by the logic of `record_ids` was deleted: re-evaluate
+        them for every student. The deleted record's scores count as 0, as
+        a missing score does, until the logic is edited.
+        """
+        with cls.deferred():
+            cls._pending.batch['orphaned'].update(record_ids)
+
+    @classmethod
+    def group_changed(cls, subject_id, class_id, term):
+        """A record of this group was added, edited or removed: refresh every student's total."""
+        with cls.deferred():
+            cls._pending.batch['groups'].add((subject_id, class_id, term))
+
+    @staticmethod
+    def _dependency_graph(record_ids):
+        """
+        Every record downstream of `record_ids`, mapped to the records it
+        reads from, one query per level of the dependency graph.
+        """
+        through = Record.depends_on.through
+        graph = {}
+        seen = set(record_ids)
+        frontier = set(record_ids)
+        while frontier:
+            edges = through.objects.filter(to_record_id__in=frontier).values_list('from_record_id', 'to_record_id')
+            frontier = set()
+            for dependent, source in edges:
+                graph.setdefault(dependent, set()).add(source)
+                if dependent not in seen:
+                    seen.add(dependent)
+                    frontier.add(dependent)
+        return graph
+
+    @classmethod
+    def _refresh(cls, batch):
+        from .service import ClassScoreMatrix
+
+        # Computed records first; their new scores are part of what the
+        # totals and aggregates below summarise. Each one downstream of a
+        # change is evaluated once, after everything it reads from, for
+        # every student whose inputs changed; evaluating it adds to
+        # batch['scores'] in turn.
+        orphaned = batch['orphaned']
+        graph = cls._dependency_graph(
+            [record_id for record_id, students in batch['scores'].items() if students] + list(orphaned)
+        )
+        for record_id in orphaned:
+            graph.setdefault(record_id, set())
+        if graph:
+            dependents = (
+                Record.objects.filter(id__in=graph).exclude(logic__isnull=True).exclude(logic='').in_bulk()
+            )
+            try:
+                order = list(TopologicalSorter(graph).static_order())
+            except CycleError as e:
+                titles = Record.objects.filter(id__in=e.args[1]).values_list('title', 'record_type', 'record_number')
+                raise ValidationError(
+                    "These records' logic references each other in a circle; edit one of them to break it: "
+                    + ", ".join(f"{title} {record_type} {number}" for title, record_type, number in titles)
+                )
+            for record_id in order:
+                dependent = dependents.get(record_id)
+                if dependent is None:
+                    continue
+                if record_id in orphaned:
+                    dependent.evaluate_logic_for_class(create_missing=dependent.auto_create_records)
+                    continue
+                students = set().union(*(batch['scores'].get(source, ()) for source in graph[record_id]))
+                if students:
+                    dependent.evaluate_logic_for_class(
+                        create_missing=dependent.auto_create_records, student_ids=sorted(students)
+                    )
+
+        unknown = (batch['scores'].keys() | batch['stats']) - batch['keys'].keys()
+        if unknown:
+            batch['keys'].update(
+                (record_id, tuple(key)) for record_id, *key in
+                Record.objects.filter(id__in=unknown).values_list('id', 'subject_id', 'class_name_id', 'title')
+            )
+        # Records deleted in this batch have no key and nothing left to refresh.
+        stats = [record_id for record_id in batch['stats'] if record_id in batch['keys']]
+        if stats:
+            Record.refresh_score_stats_of(stats)
+
+        totals = {group: None for group in batch['groups']}
+        rollups = set(batch['groups'])
+        for record_id, students in batch['scores'].items():
+            group = batch['keys'].get(record_id)
+            if group is None:
+                continue
+            rollups.add(group)
+            if not students or (group in totals and totals[group] is None):
+                continue
+            totals.setdefault(group, set()).update(students)
+        for group, students in totals.items():
+            SubjectTermTotal.refresh(*group, student_ids=None if students is None else sorted(students))
+        for group in rollups:
+            ScoreRollup.refresh(*group)
+
+        # Only once the new scores are visible, or a concurrent request
+        # could cache the old ones again.
+        class_ids = {class_id for _, class_id, _ in rollups if class_id}
+
+        def invalidate_matrices():
+            for class_id in class_ids:
+                ClassScoreMatrix.invalidate(class_id)
+        transaction.on_commit(invalidate_matrices)
@@ -1,6 +1,7 @@
 from django.db.models import Avg, Max, Min, Q
 from .models import Record, StudentRecord, Subject, Class, Student
 from collections import defaultdict
+from .report_engine import ReportEngine
 
 class Report:
     """Service for generating various reports with logic-aware features"""
@@ -133,169 +134,25 @@ class Report:
                 'error': str(e)
             }
     
-    @staticmethod    
+    @staticmethod
     def generate_report(subject_id, class_name, batch, term, sort_order, user=None):
         """
-        Generate academic report for students in a specific subject and class.
-        NOW WITH LOGIC SUPPORT - shows which scores are calculated vs manual
+        Generate academic report for students in a specific subject and class,
+        logic-aware (calculated scores carry is_calculated/logic_formula).
+        Built by ReportEngine, shared with class_report_view and the Excel export.
         """
-        
-        # Get class models — scoped to this teacher
-        class_model = Class.objects.filter(name=class_name, user=user)   # ← user added
-
-        if batch != "All":
-            class_model = class_model.filter(batch=batch)
-            is_all = False
-        else:
-            is_all = True
-    
-        # Get subject model
         try:
-            subject_model = Subject.objects.get(id=int(subject_id))
-        except (Subject.DoesNotExist, ValueError):
-            raise ValueError(f"Subject with id {subject_id} not found")
-    
-        # Get records — scoped to this teacher
-        record_qs = Record.objects.filter(
-            user=user,                               # ← user added
-            class_name__in=class_model, 
-            subject__subject=subject_model,          # ← fixed: was subject__subject__name=subject_model (object vs string)
-            show_in_report=True
-        ).select_related('class_name', 'subject')
-        
-        if term not in ["All", "None", None, "all"]:
-            record_qs = record_qs.filter(title=term)
-        
-        # Set term to None if "All" is selected
-        term = None if term in ("All", "all") else term
-    
-        # Get student records — scoped to this teacher
-        student_records = StudentRecord.objects.filter(
-            user=user,                               # ← user added
-            record__class_name__in=class_model,
-            record__subject__subject=subject_model
-        ).select_related('student', 'record', 'record__class_name')
-    
-        # Group student records by student name
-        student_names = set(student_records.values_list('student__name', flat=True))
-        student_objects = {name: [] for name in student_names}
-    
-        for std in student_records:
-            student_objects[std.student.name].append(std)
-    
-        # Initialize data structures
-        students_data = []
-        term_titles = ["First Term", "Second Term", "Third Term"]
-        all_term_records = defaultdict(list)
-        term_record_keys = defaultdict(set)
-    
-        for student_name in sorted(student_objects.keys()):
-            try:
-                # ← user added: prevents grabbing a same-named student from another teacher
-                student_model = Student.objects.select_related('class_name').get(
-                    name=student_name, user=user
-                )
-            except Student.DoesNotExist:
-                continue
-                
-            student_batch = student_model.class_name.batch
-            student_records_filtered = record_qs.filter(class_name__batch=student_batch)
-    
-            term_scores = {title: [] for title in term_titles}
-            term_test_totals = {title: 0 for title in term_titles}
-            term_total_scores = {title: 0 for title in term_titles}
-            student_total_score = 0
-            student_total_available_score = 0
-            
-            student_scores = {r.record.id: r.score for r in student_objects[student_name]}
-    
-            for rec in student_records_filtered:
-                score = student_scores.get(rec.id, '-')
-                term_key = rec.title
-                
-                rec_data = {
-                    'type': rec.record_type,
-                    'number': rec.record_number,
-                    'score': score,
-                    'is_calculated': bool(rec.logic),
-                    'logic_formula': rec.logic,
-                    'total_score': rec.total_score,
-                }
-                term_scores[term_key].append(rec_data)
-    
-                record_key = f"{rec.record_type}_{rec.record_number}"
-                if record_key not in term_record_keys[rec.title]:
-                    term_record_keys[rec.title].add(record_key)
-                    all_term_records[rec.title].append({
-                        'type': rec.record_type,
-                        'number': rec.record_number,
-                        'is_calculated': bool(rec.logic),
-                        'logic_formula': rec.logic,
-                    })
-    
-                if isinstance(score, (int, float)) and score != '-':
-                    student_total_score += score
-                    student_total_available_score += rec.total_score
-    
-                    if not term:
-                        if rec.record_type != "Exam":
-                            term_test_totals[term_key] += score
-                        term_total_scores[term_key] += score
-    
-            percentage = round((student_total_score / student_total_available_score) * 100, 2) if student_total_available_score > 0 else 0
-    
-            student_data = {
-                'id': student_model.id,
-                'name': student_name,
-                'record_by_term': term_scores,
-                'total_score': student_total_score,
-                'percentage': percentage,
-                'total_available_score': student_total_available_score,
-                'class_name': str(student_batch),
-            }
-            
-            if not term:
-                student_data['term_totals'] = {
-                    title: {
-                        'test_total': term_test_totals[title],
-                        'total_score': term_total_scores[title]
-                    } for title in term_titles
-                }
-    
-            students_data.append(student_data)
-    
-        if sort_order == 'desc':
-            students_data.sort(key=lambda x: x['total_score'], reverse=True)
-        else:
-            students_data.sort(key=lambda x: x['name'])
-    
-        header_structure = {
-            'header': True,
-            'count': 'S/N',
-            'name': 'Student',
-            'term_headers': {title: all_term_records[title] for title in term_titles},
-            'total': 'Total Score',
-            'Percentage': '100%',
-        }
-    
-        if not term:
-            header_structure['term_totals'] = {
-                title: {
-                    'test_total': f"{title} Test Total",
-                    'total_score': f"{title} Total Score"
-                } for title in term_titles
-            }
-    
-        total_report = [header_structure] + students_data
-        terms = term_titles
-        
+            engine = ReportEngine(subject_id, class_name, batch, term, sort_order, user=user).build()
+        except ValueError as e:
+            return {'success': False, 'error': str(e), 'total_report': None}
+
         return {
             'success': True,
-            'total_report': total_report,
-            'subject': subject_model,
-            'is_all': is_all,
-            'terms': terms or [],
+            'total_report': engine.render('html'),
+            'subject': engine.subject,
+            'is_all': engine.batch is None,
+            'terms': engine.terms,
             'class_name': class_name,
             'batch': batch,
-            'term': None if term in ("All", "all", None) else term,
+            'term': engine.term,
         }
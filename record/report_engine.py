@@ -0,0 +1,271 @@
+"""
+The subject report engine behind report_view, class_report_view, the Excel
+export and the JSON report API.
+
+A ReportEngine loads one report's data once (the record headers, then every
+score with its student) and pivots it into a header plus one row per
+student. Output stages turn that into what a caller needs: 'html' is the
+`total_report` list the report templates iterate, 'json' is plain data for
+the API, and excel.py registers 'excel', which builds the workbook.
+
+Totals follow the report card's rules (ReportCardService.calculate_positions):
+records with show_in_report off are left out, records with include_in_total
+off are shown but not counted, and a missing score counts as 0 against the
+record's full total_score.
+"""
+from collections import defaultdict
+
+from .models import Class, Record, StudentRecord, Subject
+
+TERM_TITLES = ["First Term", "Second Term", "Third Term"]
+ALL = ("All", "all", "None", None, "")
+
+
+class ReportEngine:
+    """
+    One subject report for a class (one batch or all of them) and a term
+    (or every term). `subject_id` "all" builds only the per-subject summary.
+
+        engine = ReportEngine(subject_id, class_name, batch, term, sort_order, user=request.user)
+        total_report = engine.render('html')
+
+    Invalid input raises ValueError. The data is loaded and pivoted on the
+    first render and reused by any further renders of the same engine.
+    """
+
+    outputs = {}
+
+    @classmethod
+    def output(cls, name):
+        """Register an output stage: a function taking the built engine."""
+        def register(func):
+            cls.outputs[name] = func
+            return func
+        return register
+
+    def __init__(self, subject_id, class_name, batch="All", term="All", sort_order="asc", user=None):
+        self.subject_id = subject_id
+        self.class_name = class_name
+        self.batch = None if batch in ALL else batch
+        self.term = None if term in ALL else term
+        self.sort_order = sort_order
+        self.user = user
+        self.is_all_subjects = subject_id in ALL
+        self.terms = TERM_TITLES
+        self._built = False
+
+    def render(self, output):
+        if output not in self.outputs:
+            raise ValueError(f"Unknown report output {output!r}")
+        self.build()
+        return self.outputs[output](self)
+
+    # ── Loading ─────────────────────────────────────────────────────────────
+
+    def build(self):
+        if self._built:
+            return self
+
+        classes = Class.objects.filter(name=self.class_name)
+        if self.user is not None:
+            classes = classes.filter(user=self.user)
+        if self.batch:
+            classes = classes.filter(batch=self.batch)
+        if not classes.exists():
+            raise ValueError(f"Class {self.class_name} (batch={self.batch or 'All'}) not found")
+
+        if self.is_all_subjects:
+            self.subject = None
+            subjects = Subject.objects.all()
+        else:
+            try:
+                self.subject = Subject.objects.get(id=int(self.subject_id))
+            except (Subject.DoesNotExist, ValueError, TypeError):
+                raise ValueError(f"Subject with id {self.subject_id} not found")
+            subjects = [self.subject]
+
+        records = Record.objects.filter(
+            class_name__in=classes, subject__subject__in=subjects, show_in_report=True
+        ).select_related('class_name', 'subject__subject')
+        if self.user is not None:
+            records = records.filter(user=self.user)
+        if self.term:
+            records = records.filter(title=self.term)
+        self.records = list(records.order_by('id'))
+
+        records_by_id = {rec.id: rec for rec in self.records}
+        self.scores = list(
+            StudentRecord.objects.filter(record_id__in=records_by_id)
+            .select_related('student__class_name')
+            .order_by('id')
+        )
+        for sr in self.scores:
+            sr.record = records_by_id[sr.record_id]
+
+        self.summary = self._summarise()
+        self.header, self.rows = (None, None) if self.is_all_subjects else self._pivot()
+        self._built = True
+        return self
+
+    # ── Pivot ───────────────────────────────────────────────────────────────
+
+    def _summarise(self):
+        """Per (subject, student): average score and percentage over their scores."""
+        by_subject_student = defaultdict(list)
+        self.detected_terms = []
+        for sr in self.scores:
+            by_subject_student[(sr.record.subject.subject, sr.student)].append(sr)
+            if sr.record.record_type not in self.detected_terms:
+                self.detected_terms.append(sr.record.record_type)
+
+        summary = []
+        for (subject, student), recs in by_subject_student.items():
+            percentages = [r.score / r.record.total_score * 100 for r in recs if r.record.total_score]
+            summary.append({
+                'student': student,
+                'subject': subject,
+                'records': recs,
+                'average_score': round(sum(r.score for r in recs) / len(recs), 2),
+                'average_percentage': round(sum(percentages) / (len(percentages) or 1), 2),
+                'total_records': len(recs),
+            })
+        if self.sort_order == 'desc':
+            summary.sort(key=lambda x: x['average_percentage'], reverse=True)
+        else:
+            summary.sort(key=lambda x: x['student'].name)
+        return summary
+
+    def _pivot(self):
+        """The header and one row per student who has any score, each over their batch's records."""
+        students, scores_by_student = {}, defaultdict(dict)
+        for sr in self.scores:
+            students[sr.student_id] = sr.student
+            scores_by_student[sr.student_id][sr.record_id] = sr.score
+
+        records_by_batch = defaultdict(list)
+        for rec in self.records:
+            records_by_batch[rec.class_name.batch].append(rec)
+
+        term_headers = defaultdict(list)
+        header_keys = defaultdict(set)
+        rows = []
+        for student in sorted(students.values(), key=lambda s: (s.name, s.id)):
+            batch = student.class_name.batch
+            student_scores = scores_by_student[student.id]
+            record_by_term = {title: [] for title in TERM_TITLES}
+            test_totals = dict.fromkeys(TERM_TITLES, 0)
+            term_totals = dict.fromkeys(TERM_TITLES, 0)
+            total_score = total_available = 0
+
+            for rec in records_by_batch[batch]:
+                score = student_scores.get(rec.id, '-')
+                record_by_term.setdefault(rec.title, []).append({
+                    'type': rec.record_type,
+                    'number': rec.record_number,
+                    'score': score,
+                    'total_score': rec.total_score,
+                    'is_calculated': bool(rec.logic),
+                    'logic_formula': rec.logic,
+                })
+
+                key = (rec.record_type, rec.record_number)
+                if key not in header_keys[rec.title]:
+                    header_keys[rec.title].add(key)
+                    term_headers[rec.title].append({
+                        'type': rec.record_type,
+                        'number': rec.record_number,
+                        'total_score': rec.total_score,
+                        'is_calculated': bool(rec.logic),
+                        'logic_formula': rec.logic,
+                    })
+
+                if rec.include_in_total:
+                    obtained = score if score != '-' else 0
+                    total_score += obtained
+                    total_available += rec.total_score or 0
+                    if rec.record_type != "Exam":
+                        test_totals[rec.title] = test_totals.get(rec.title, 0) + obtained
+                    term_totals[rec.title] = term_totals.get(rec.title, 0) + obtained
+
+            row = {
+                'id': student.id,
+                'name': student.name,
+                'record_by_term': record_by_term,
+                'total_score': total_score,
+                'percentage': round(total_score / total_available * 100, 2) if total_available else 0,
+                'total_available_score': total_available,
+                'class_name': str(batch),
+            }
+            if not self.term:
+                row['term_totals'] = {
+                    title: {'test_total': test_totals[title], 'total_score': term_totals[title]}
+                    for title in TERM_TITLES
+                }
+            rows.append(row)
+
+        if self.sort_order == 'desc':
+            rows.sort(key=lambda x: x['total_score'], reverse=True)
+        else:
+            rows.sort(key=lambda x: x['name'])
+
+        header = {
+            'header': True,
+            'count': 'S/N',
+            'name': 'Student',
+            'term_headers': {title: term_headers.get(title, []) for title in TERM_TITLES},
+            'total': 'Total Score',
+            'Percentage': '100%',
+        }
+        if not self.term:
+            header['term_totals'] = {
+                title: {'test_total': f"{title} Test Total", 'total_score': f"{title} Total Score"}
+                for title in TERM_TITLES
+            }
+        return header, rows
+
+
+@ReportEngine.output('html')
+def html_output(engine):
+    """`total_report` for report-table.html: the header dict, then the student rows."""
+    if engine.header is None:
+        return None
+    return [engine.header] + engine.rows
+
+
+@ReportEngine.output('json')
+def json_output(engine):
+    """Plain, JSON-serialisable data; missing scores are None."""
+    return {
+        'subject': {'id': engine.subject.id, 'name': engine.subject.name} if engine.subject else None,
+        'class_name': engine.class_name,
+        'batch': engine.batch or "All",
+        'term': engine.term,
+        'terms': engine.terms,
+        'columns': engine.header['term_headers'] if engine.header else {},
+        'students': [
+            {
+                'id': row['id'],
+                'name': row['name'],
+                'batch': row['class_name'],
+                'scores': {
+                    title: [None if rec['score'] == '-' else rec['score'] for rec in recs]
+                    for title, recs in row['record_by_term'].items()
+                },
+                'term_totals': row.get('term_totals'),
+                'total_score': row['total_score'],
+                'total_available_score': row['total_available_score'],
+                'percentage': row['percentage'],
+            }
+            for row in engine.rows or []
+        ],
+        'summary': [
+            {
+                'student_id': item['student'].id,
+                'subject_id': item['subject'].id,
+                'average_score': item['average_score'],
+                'average_percentage': item['average_percentage'],
+                'total_records': item['total_records'],
+            }
+            for item in engine.summary
+        ],
+    }
@@ -0,0 +1,231 @@
+"""
+Full-text search over a teacher's students, records, classes, subjects and
+topics, on an SQLite FTS5 table (created by migration 0014).
+
+Every object is one row of `record_search`: `tags` naming its owner and
+kind ("u12 student", or "shared subject" for the shared subject list), a
+`title` (what the result is called, weighted highest) and a `body`
+(everything else worth matching). Owner and kind are part of the MATCH, so
+one teacher's students are picked out by the index itself, and each kind's
+top N can stop after N rows. The rowid packs the kind and id together
+(id * 8 + kind), so a row is replaced or dropped by primary key.
+
+The documents are built by SQL straight from the model tables (DOCUMENTS),
+so indexing one object, a class's worth of them, or the whole database is
+the same INSERT ... SELECT with a different WHERE. The signal handlers
+keep it current; `manage.py rebuild_search_index` rebuilds it. Deletes
+run inside SearchIndex.deferred(), so the rows of everything a delete
+cascades to are dropped together rather than one statement per object.
+"""
+import re
+import threading
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Count
+
+from .models import Class, Record, Student, Subject, Topic
+
+TABLE = "record_search"
+RESULTS_PER_TYPE = 10
+# Above this many matches (a one- or two-letter prefix over a big school)
+# bm25 costs more than it's worth; the newest matches are shown instead.
+RANKED_MATCHES_MAX = 1000
+
+# kind -> (rowid code, model)
+KINDS = {
+    'student': (1, Student),
+    'record': (2, Record),
+    'class': (3, Class),
+    'subject': (4, Subject),
+    'topic': (5, Topic),
+}
+
+# kind -> SELECT of (rowid, tags, title, body) over the kind's table,
+# aliased `t`, to which a WHERE on `t` is appended.
+DOCUMENTS = {
+    'student': """
+        SELECT t.id * 8 + 1, 'u' || t.user_id || ' student', t.name,
+               COALESCE(t.admission_number, '') || ' ' || COALESCE(t.contact_info, '') || ' '
+               || COALESCE(c.name || ' ' || c.batch, '')
+        FROM record_student t LEFT JOIN record_class c ON c.id = t.class_name_id
+    """,
+    'record': """
+        SELECT t.id * 8 + 2, 'u' || t.user_id || ' record',
+               COALESCE(s.name || ' ', '') || t.record_type || ' ' || COALESCE(t.record_number, ''),
+               COALESCE(t.title, '') || ' ' || COALESCE(c.name || ' ' || c.batch, '')
+        FROM record_record t
+        LEFT JOIN record_subjectteacher st ON st.id = t.subject_id
+        LEFT JOIN record_subject s ON s.id = st.subject_id
+        LEFT JOIN record_class c ON c.id = t.class_name_id
+    """,
+    'class': """
+        SELECT t.id * 8 + 3, 'u' || t.user_id || ' class', t.name || ' ' || t.batch, COALESCE(t.session, '')
+        FROM record_class t
+    """,
+    'subject': """
+        SELECT t.id * 8 + 4, 'shared subject', t.name, ''
+        FROM record_subject t
+    """,
+    'topic': """
+        SELECT t.id * 8 + 5, 'u' || t.user_id || ' topic', t.title,
+               COALESCE(s.name, '') || ' ' || COALESCE(t.content, '')
+        FROM record_topic t LEFT JOIN record_subject s ON s.id = t.subject_id
+    """,
+}
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """
+    User input as an FTS5 query: every word must match, each as a prefix
+    ("ada lov" finds "Ada Lovelace"). None when there's nothing to match.
+    """
+    tokens = TOKEN_RE.findall(query or "")
+    return " ".join(f'"{token}"*' for token in tokens) or None
+
+
+class SearchIndex:
+
+    _pending = threading.local()
+
+    @classmethod
+    @contextmanager
+    def deferred(cls):
+        """Queue the removals made inside the block; drop them all in one statement at its end."""
+        if getattr(cls._pending, 'rowids', None) is not None:
+            yield
+            return
+        rowids = cls._pending.rowids = []
+        try:
+            with transaction.atomic(savepoint=False):
+                yield
+                cls._delete_rows(rowids)
+        finally:
+            cls._pending.rowids = None
+
+    @staticmethod
+    def refresh(kind, where, params=()):
+        """Re-index the `kind` objects matching `where` (SQL on `t`): drop their rows, then re-insert them."""
+        if not enabled():
+            return
+        code, model = KINDS[kind]
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {TABLE} WHERE rowid IN (SELECT t.id * 8 + {code} FROM {table} t WHERE {where})",
+                params,
+            )
+            cursor.execute(
+                f"INSERT INTO {TABLE} (rowid, tags, title, body) {DOCUMENTS[kind]} WHERE {where}",
+                params,
+            )
+
+    @staticmethod
+    def index(instance):
+        """Re-index one saved object."""
+        kind = SearchIndex.kind_of(instance)
+        SearchIndex.refresh(kind, "t.id = %s", [instance.pk])
+
+    @classmethod
+    def remove(cls, instance):
+        if not enabled():
+            return
+        code, _ = KINDS[cls.kind_of(instance)]
+        rowid = instance.pk * 8 + code
+        pending = getattr(cls._pending, 'rowids', None)
+        if pending is not None:
+            pending.append(rowid)
+        else:
+            cls._delete_rows([rowid])
+
+    @staticmethod
+    def _delete_rows(rowids):
+        if not rowids or not enabled():
+            return
+        with connection.cursor() as cursor:
+            for start in range(0, len(rowids), 500):
+                chunk = rowids[start:start + 500]
+                cursor.execute(
+                    f"DELETE FROM {TABLE} WHERE rowid IN ({', '.join(['%s'] * len(chunk))})", chunk
+                )
+
+    @staticmethod
+    def kind_of(instance):
+        return next(kind for kind, (_, model) in KINDS.items() if isinstance(instance, model))
+
+    @staticmethod
+    def rebuild():
+        """Throw away and re-index everything. Returns the row count."""
+        if not enabled():
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLE}")
+            for document in DOCUMENTS.values():
+                cursor.execute(f"INSERT INTO {TABLE} (rowid, tags, title, body) {document}")
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+            cursor.execute(f"SELECT COUNT(*) FROM {TABLE}")
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def search(query, user, limit=RESULTS_PER_TYPE):
+        """
+        {kind: [object, ...]} for `user`, at most `limit` per kind, best
+        match first. A capped count of the matches decides the order: bm25
+        while ranking is cheap, newest first past RANKED_MATCHES_MAX. Then
+        one FTS statement takes each kind's top `limit`, and one fetch per
+        kind loads the objects. Subjects are shared; only those the user
+        teaches count.
+        """
+        results = {kind: [] for kind in KINDS}
+        terms = match_expression(query)
+        if terms is None:
+            return results
+
+        owner = f'(tags:"u{user.id}" OR tags:shared) AND {{title body}}: ({terms})'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM (SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s LIMIT %s)",
+                [owner, RANKED_MATCHES_MAX + 1],
+            )
+            ranked = cursor.fetchone()[0] <= RANKED_MATCHES_MAX
+            order = f"bm25({TABLE}, 0.0, 10.0, 1.0)" if ranked else "-rowid"
+
+            selects, params = [], []
+            for kind in KINDS:
+                scope = 'tags:shared' if kind == 'subject' else f'tags:"u{user.id}"'
+                taught = (" AND rowid / 8 IN (SELECT subject_id FROM record_subjectteacher WHERE user_id = %s)"
+                          if kind == 'subject' else "")
+                selects.append(
+                    f"SELECT * FROM (SELECT rowid, {order} AS position FROM {TABLE} "
+                    f"WHERE {TABLE} MATCH %s{taught} ORDER BY position LIMIT %s)"
+                )
+                params += [f'{scope} AND tags:{kind} AND {{title body}}: ({terms})',
+                           *([user.id] if taught else []), limit]
+            cursor.execute(" UNION ALL ".join(selects), params)
+            hits = sorted(cursor.fetchall(), key=lambda hit: hit[1])
+
+        for kind, (code, model) in KINDS.items():
+            ids = [rowid // 8 for rowid, _ in hits if rowid % 8 == code]
+            if ids:
+                found = result_queryset(kind).in_bulk(ids)
+                results[kind] = [found[pk] for pk in ids if pk in found]
+        return results
+
+
+def result_queryset(kind):
+    """What the search result templates need of each kind, loaded with it."""
+    if kind == 'student':
+        return Student.objects.select_related('class_name')
+    if kind == 'record':
+        return Record.objects.select_related('subject__subject', 'class_name')
+    if kind == 'class':
+        return Class.objects.annotate(student_count=Count('student'))
+    if kind == 'topic':
+        return Topic.objects.select_related('subject')
+    return Subject.objects.all()
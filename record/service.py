@@ -1,28 +1,181 @@
 # services.py - Business logic separated from views
-from django.db.models import Q, Avg, Max, Min, Count
+from django.db.models import Q, Avg, Max, Min, Count, Sum
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 from django.contrib.auth.hashers import make_password
 from django.utils import timezone
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from collections import defaultdict
+from datetime import timedelta
+import atexit
+import threading
 from .models import *
+from .db import retry_on_busy
+from .report_engine import ReportEngine
+from .search import RESULTS_PER_TYPE, SearchIndex, enabled as search_enabled
 
 class HistoryService:
     """Handle user history logging"""
 
     @staticmethod
     def log_user_activity(user, title, url):
-        """Log user activity to history"""
-        history, created = History.objects.get_or_create(
-            user=user, 
-            title=title, 
-            url=url,
-            defaults={'time': timezone.now()}
-        )
-        if not created:
-            history.time = timezone.now()
-            history.save()
-        return history
+        """
+        Log user activity to history. The hit is queued in HistoryBuffer
+        rather than written here, so page views don't wait on a write.
+        """
+        HistoryBuffer.add(user, title, url)
+
+    @staticmethod
+    def recent_for(user, target_model, object_id, limit=10):
+        """Latest activity about one object (a class, record, student...), via history_target_idx."""
+        return History.objects.for_user(user).filter(
+            target_model=target_model, object_id=object_id
+        ).order_by('-time')[:limit]
+
+    @staticmethod
+    def prune(user_ids=None):
+        """
+        Enforce the retention policy: drop rows older than HISTORY_KEEP_DAYS
+        and everything past each user's newest HISTORY_KEEP_PER_USER rows
+        (either limit can be set to None to turn it off). Returns the number
+        of rows deleted.
+        """
+        keep_days = getattr(settings, 'HISTORY_KEEP_DAYS', 90)
+        keep_per_user = getattr(settings, 'HISTORY_KEEP_PER_USER', 200)
+        history = History.objects.all()
+        if user_ids is not None:
+            history = history.filter(user_id__in=user_ids)
+
+        deleted = 0
+        if keep_days is not None:
+            cutoff = timezone.now() - timedelta(days=keep_days)
+            deleted += history.filter(time__lt=cutoff).delete()[0]
+
+        if keep_per_user is not None:
+            if user_ids is None:
+                user_ids = history.values_list('user_id', flat=True).distinct()
+            for user_id in user_ids:
+                oldest_kept = (
+                    History.objects.filter(user_id=user_id).order_by('-time', '-id')
+                    .values_list('time', 'id')[keep_per_user:keep_per_user + 1]
+                )
+                for time, pk in oldest_kept:
+                    deleted += History.objects.filter(user_id=user_id).filter(
+                        Q(time__lt=time) | Q(time=time, id__lte=pk) | Q(time__isnull=True)
+                    ).delete()[0]
+        return deleted
+
+    @staticmethod
+    def compact():
+        """
+        Collapse duplicate (user, title, url) rows left by older,
+        unbuffered writes into the newest one. Returns the number deleted.
+        """
+        keep = History.objects.values('user_id', 'title', 'url').annotate(keep_id=Max('id')).values('keep_id')
+        return History.objects.exclude(id__in=keep).delete()[0]
+
+
+class HistoryBuffer:
+    """
+    Write-behind queue for History rows.
+
+    Hits are coalesced per (user, title, url), keeping the latest time, and
+    written in one go (a bulk_update of the rows that already exist and a
+    bulk_create of the rest) once HISTORY_BUFFER_SIZE hits have queued up
+    or HISTORY_FLUSH_INTERVAL seconds after the first one, whichever comes
+    first. Either way the write happens on a timer thread, never in the
+    request that queued the hit, and reads don't wait for it: History can
+    be up to one interval behind. A buffer size of 0 writes every hit
+    straight away, in the request.
+    """
+
+    _pending = {}     # (user_id, title, url) -> time of the latest hit
+    _hits = 0
+    _timer = None
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+
+    @staticmethod
+    def size():
+        return getattr(settings, 'HISTORY_BUFFER_SIZE', 50)
+
+    @staticmethod
+    def interval():
+        return getattr(settings, 'HISTORY_FLUSH_INTERVAL', 5)
+
+    @classmethod
+    def add(cls, user, title, url):
+        with cls._lock:
+            cls._pending[(getattr(user, 'id', None), title, url)] = timezone.now()
+            cls._hits += 1
+            immediate = cls.size() <= 0
+            # Schedule the first hit's timer, and bring it forward to now
+            # once the buffer fills.
+            if not immediate and (cls._timer is None or cls._hits == cls.size()):
+                if cls._timer is not None:
+                    cls._timer.cancel()
+                delay = 0 if cls._hits >= cls.size() else cls.interval()
+                cls._timer = threading.Timer(delay, cls._flush_from_timer)
+                cls._timer.daemon = True
+                cls._timer.start()
+        if immediate:
+            cls.flush()
+
+    @classmethod
+    def _flush_from_timer(cls):
+        try:
+            cls.flush()
+        finally:
+            # The timer thread opened its own connection; don't leak it.
+            connection.close()
+
+    @classmethod
+    def flush(cls):
+        """Write everything queued so far. Returns the number of rows written."""
+        with cls._lock:
+            pending, cls._pending, cls._hits = cls._pending, {}, 0
+            if cls._timer is not None:
+                cls._timer.cancel()
+                cls._timer = None
+        if not pending:
+            return 0
+
+        with cls._flush_lock:
+            cls._write(pending)
+        return len(pending)
+
+    @staticmethod
+    @retry_on_busy
+    def _write(pending):
+        """Upsert one flushed batch; safe to retry, rows written first time round are just updated."""
+        existing = {
+            (h.user_id, h.title, h.url): h
+            for h in History.objects.filter(
+                user_id__in={key[0] for key in pending}, url__in={key[2] for key in pending}
+            ).only('id', 'user_id', 'title', 'url', 'time')
+        }
+        to_update, to_create = [], []
+        for (user_id, title, url), when in pending.items():
+            history = existing.get((user_id, title, url))
+            if history:
+                history.time = when
+                to_update.append(history)
+            else:
+                target_model, object_id = History.target_from_url(url)
+                to_create.append(History(user_id=user_id, title=title, url=url, time=when,
+                                         target_model=target_model, object_id=object_id))
+        with transaction.atomic():
+            History.objects.bulk_update(to_update, ['time'], batch_size=500)
+            History.objects.bulk_create(to_create, batch_size=500)
+        if to_create:
+            # Only new rows can push a user past the retention limits.
+            HistoryService.prune({history.user_id for history in to_create})
+
+
+atexit.register(HistoryBuffer.flush)
 
 class FormService:
     """Handle form processing and validation"""
@@ -117,16 +270,83 @@ class StudentRecordService:
 
         return students_queryset
 
+    @staticmethod
+    def parse_score(record, raw):
+        """
+        Validate one typed-in score against its record.
+        Returns (score, None) or (None, error message).
+        """
+        try:
+            score = int(raw)
+        except ValueError:
+            return None, f"'{raw}' is not a whole number"
+        if not 0 <= score <= record.total_score:
+            return None, f"{score} is outside 0-{record.total_score}"
+        return score, None
+
+    @staticmethod
+    @retry_on_busy
+    def upsert_scores(user, records, scores):
+        """
+        Write a batch of already-validated scores in one statement.
+
+        `scores` maps (student_id, record_id) -> score. Rows that already
+        exist have their score overwritten (the (student, record) unique
+        constraint is the conflict target) and the rest are inserted.
+        Totals, aggregates, rollups and computed records are refreshed in
+        the same transaction, once per subject/class/term rather than once
+        per row or per record (ScoreRefresh).
+        """
+        if not scores:
+            return
+        changed = defaultdict(list)
+        for student_id, record_id in scores:
+            changed[record_id].append(student_id)
+        with ScoreRefresh.deferred():
+            StudentRecord.objects.bulk_create(
+                [
+                    StudentRecord(user=user, student_id=student_id, record_id=record_id, score=score)
+                    for (student_id, record_id), score in scores.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['student', 'record'],
+                update_fields=['score'],
+                batch_size=500,
+            )
+            for record in records:
+                if record.id in changed:
+                    scores_bulk_changed.send(sender=StudentRecord, record=record, student_ids=changed[record.id])
+
 class SearchService:
     """Handle search operations"""
 
     @staticmethod
-    def search_all(query, user):
-        """Search across all models"""
+    def search_all(query, user, limit=RESULTS_PER_TYPE):
+        """
+        Search students, records, classes, subjects and topics: ranked
+        prefix matches from the FTS5 index (search.py), at most `limit` of
+        each. Without SQLite, falls back to name/title icontains scans.
+        """
+        if search_enabled():
+            found = SearchIndex.search(query, user, limit)
+            return {
+                'records': found['record'],
+                'students': found['student'],
+                'classes': found['class'],
+                'subjects': found['subject'],
+                'topics': found['topic'],
+            }
+        if not query:
+            return {'records': [], 'students': [], 'classes': [], 'subjects': [], 'topics': []}
         return {
-            'records': Record.objects.for_user(user).filter(title__icontains=query),
-            'students': Student.objects.for_user(user).filter(name__icontains=query),
-            'classes': Class.objects.for_user(user).filter(name__icontains=query)
+            'records': Record.objects.for_user(user).filter(title__icontains=query)[:limit],
+            'students': Student.objects.for_user(user).filter(name__icontains=query)[:limit],
+            'classes': Class.objects.for_user(user).filter(name__icontains=query).annotate(
+                student_count=Count('student'))[:limit],
+            'subjects': Subject.objects.filter(
+                subjectTeacher__user=user, name__icontains=query
+            ).distinct()[:limit],
+            'topics': Topic.objects.for_user(user).filter(title__icontains=query)[:limit],
         }
 
 class UserService:
@@ -279,10 +499,20 @@ class PromotionService:
             session=target_session,
         )
 
-        moved_count = Student.objects.filter(
-            id__in=student_ids,
-            class_name=source_class
-        ).update(class_name=target_class)
+        # .update() sends no signals: re-index the moved students and drop
+        # both classes' cached score matrices here instead.
+        with transaction.atomic():
+            students = Student.objects.filter(id__in=student_ids, class_name=source_class)
+            moved = list(students.values_list('id', flat=True))
+            moved_count = students.filter(id__in=moved).update(class_name=target_class)
+            for start in range(0, len(moved), 500):
+                chunk = moved[start:start + 500]
+                SearchIndex.refresh('student', f"t.id IN ({', '.join(['%s'] * len(chunk))})", chunk)
+
+            def invalidate_matrices():
+                ClassScoreMatrix.invalidate(source_class.id)
+                ClassScoreMatrix.invalidate(target_class.id)
+            transaction.on_commit(invalidate_matrices)
 
         return target_class, moved_count
 
@@ -291,7 +521,7 @@ class ReportService:
     """Unified report service combining student performance and class-summary style output."""
 
     @staticmethod
-    def generate_report(subject_id, class_name, batch="All", term="All", sort_order="asc"):
+    def generate_report(subject_id, class_name, batch="All", term="All", sort_order="asc", user=None):
         """
         Unified report builder.
 
@@ -301,230 +531,30 @@ class ReportService:
           - total_report: header + student rows (only built when a single subject is requested)
           - subject: Subject model or None
           - is_all_subjects: bool
-          - terms: list of detected term names
+          - terms: the term titles the report's columns are grouped by
           - class_name, batch, term, sort_order (echoed)
           - error (if success is False)
+
+        Built by ReportEngine (report_engine.py), shared with report_view and
+        the Excel export. Pass `user` to limit it to that teacher's classes.
         """
         try:
-            # --- Resolve class queryset and batch handling ---
-            class_qs = Class.objects.filter(name=class_name)
-            if batch and batch != "All":
-                class_qs = class_qs.filter(batch=batch)
-                is_all_batches = False
-            else:
-                is_all_batches = True
-
-            if not class_qs.exists():
-                raise ValueError(f"Class {class_name} (batch={batch}) not found")
-
-            # --- Resolve subject(s) ---
-            if subject_id in ("all", "All", None):
-                subjects = Subject.objects.all()
-                is_all_subjects = True
-                subject_model = None
-            else:
-                try:
-                    subject_model = Subject.objects.get(id=int(subject_id))
-                except (Subject.DoesNotExist, ValueError):
-                    raise ValueError(f"Subject with id {subject_id} not found")
-                subjects = Subject.objects.filter(id=subject_model.id)
-                is_all_subjects = False
-
-            # --- Build base Record queryset ---
-            record_qs = Record.objects.filter(
-                class_name__in=class_qs,
-                subject__in=subjects
-            ).select_related('class_name', 'subject')
-
-            # term filtering — accept either record_type or title
-            if term not in ("All", "all", None):
-                record_qs = record_qs.filter(Q(record_type=term) | Q(title=term))
-                term_filtering = True
-            else:
-                term_filtering = False
-
-            # --- StudentRecord queryset (optimized) ---
-            student_record_qs = StudentRecord.objects.filter(
-                record__in=record_qs
-            ).select_related('student', 'record', 'record__class_name')
-
-            # --- Build per-subject per-student summary (data) ---
-            data = []
-            detected_terms = []
-            for subject in subjects:
-                s_records = student_record_qs.filter(record__subject=subject)
-                # group by student
-                by_student = defaultdict(list)
-                for sr in s_records:
-                    by_student[sr.student].append(sr)
-                    if sr.record.record_type not in detected_terms:
-                        detected_terms.append(sr.record.record_type)
-
-                for student_obj, recs in by_student.items():
-                    avg_score = sum(r.score for r in recs if isinstance(r.score, (int, float))) / (
-                        sum(1 for r in recs if isinstance(r.score, (int, float))) or 1
-                    )
-                    avg_percentage = sum(r.percentage for r in recs if isinstance(r.percentage, (int, float))) / (
-                        sum(1 for r in recs if isinstance(r.percentage, (int, float))) or 1
-                    )
-
-                    data.append({
-                        'student': student_obj,
-                        'subject': subject,
-                        'records': recs,
-                        'average_score': round(avg_score, 2),
-                        'average_percentage': round(avg_percentage, 2),
-                        'total_records': len(recs)
-                    })
-
-            # sort `data` by average_percentage or student name as requested
-            if sort_order == 'desc':
-                data.sort(key=lambda x: x['average_percentage'], reverse=True)
-            else:
-                data.sort(key=lambda x: getattr(x['student'], 'name', '') or '')
-
-            # --- Build detailed `total_report` (header + student rows) when a single subject requested ---
-            total_report = None
-            if not is_all_subjects and subjects.exists():
-                subject_for_report = subjects.first()
-
-                # We'll build a header describing terms and the records for each term
-                term_titles = ["First Term", "Second Term", "Third Term"]
-                # collect all records grouped by term title to use as column headers
-                all_term_records = defaultdict(list)
-                term_record_keys = defaultdict(set)
-
-                # prepare mapping of student name -> list of StudentRecord
-                student_objects = defaultdict(list)
-                for sr in student_record_qs.filter(record__subject=subject_for_report):
-                    student_objects[sr.student.name].append(sr)
-
-                # Build students_data rows
-                students_data = []
-                for student_name in sorted(student_objects.keys()):
-                    try:
-                        student_model = Student.objects.select_related('class_name').get(name=student_name)
-                    except Student.DoesNotExist:
-                        continue
-
-                    student_batch = student_model.class_name.batch
-                    # filter records to the class & batch of the student
-                    records_for_class_and_subject = record_qs.filter(class_name__batch=student_batch, subject=subject_for_report)
-
-                    # term structures
-                    term_scores_by_title = {t: [] for t in term_titles}
-                    term_test_totals = {t: 0 for t in term_titles}
-                    term_total_scores = {t: 0 for t in term_titles}
-                    student_total_score = 0
-                    student_total_available_score = 0
-
-                    # map record.id -> score for this student
-                    student_scores_map = {r.record.id: r.score for r in student_objects[student_name]}
-
-                    for rec in records_for_class_and_subject:
-                        score = student_scores_map.get(rec.id, '-')
-                        term_key = rec.title if rec.title else rec.record_type or "Unknown"
-
-                        rec_data = {
-                            'type': rec.record_type,
-                            'number': getattr(rec, 'record_number', None),
-                            'score': score,
-                            'total_score': getattr(rec, 'total_score', None)
-                        }
-                        # append to term list
-                        if term_key not in term_scores_by_title:
-                            term_scores_by_title.setdefault(term_key, [])
-                        term_scores_by_title[term_key].append(rec_data)
-
-                        # build unique key for header record list
-                        record_key = f"{rec.record_type}_{getattr(rec, 'record_number', '')}"
-                        if record_key not in term_record_keys[term_key]:
-                            term_record_keys[term_key].add(record_key)
-                            all_term_records[term_key].append({
-                                'type': rec.record_type,
-                                'number': getattr(rec, 'record_number', None)
-                            })
-
-                        # ---- Totals: always add total_score to available, add score (or 0) to obtained ----
-                        if rec.include_in_total:
-                            # Add to available total (always)
-                            if getattr(rec, 'total_score', None):
-                                student_total_available_score += rec.total_score
-                            # Add to obtained total only if score is numeric, else 0
-                            if isinstance(score, (int, float)):
-                                student_total_score += score
-                            # (if score is '-', it contributes 0 – no action needed)
-
-                            # Also update term totals (if not filtering by term)
-                            if not term_filtering:
-                                if rec.record_type != "Exam":
-                                    term_test_totals[term_key] = term_test_totals.get(term_key, 0) + (score if isinstance(score, (int, float)) else 0)
-                                term_total_scores[term_key] = term_total_scores.get(term_key, 0) + (score if isinstance(score, (int, float)) else 0)
-
-                    percentage = round(
-                        (student_total_score / student_total_available_score) * 100, 2
-                    ) if student_total_available_score > 0 else 0
-
-                    student_row = {
-                        'id': student_model.id,
-                        'name': student_name,
-                        'record_by_term': term_scores_by_title,
-                        'total_score': student_total_score,
-                        'percentage': percentage,
-                        'total_available_score': student_total_available_score,
-                        'class_name': str(student_batch),
-                    }
-
-                    if not term_filtering:
-                        student_row['term_totals'] = {
-                            title: {
-                                'test_total': term_test_totals.get(title, 0),
-                                'total_score': term_total_scores.get(title, 0)
-                            } for title in term_titles
-                        }
-
-                    students_data.append(student_row)
-
-                # Sorting students_data
-                if sort_order == 'desc':
-                    students_data.sort(key=lambda x: x['total_score'], reverse=True)
-                else:
-                    students_data.sort(key=lambda x: x['name'])
-
-                # header
-                header_structure = {
-                    'header': True,
-                    'count': 'S/N',
-                    'name': 'Student',
-                    'term_headers': {title: all_term_records.get(title, []) for title in term_titles},
-                    'total': 'Total Score',
-                    'Percentage': '100%',
-                }
-                if not term_filtering:
-                    header_structure['term_totals'] = {
-                        title: {
-                            'test_total': f"{title} Test Total",
-                            'total_score': f"{title} Total Score"
-                        } for title in term_titles
-                    }
-
-                total_report = [header_structure] + students_data
-
-            # --- assemble final response ---
+            engine = ReportEngine(subject_id, class_name, batch, term, sort_order, user=user).build()
             return {
                 'success': True,
-                'data': data,
-                'total_report': total_report,
-                'subject': subject_model,
-                'is_all_subjects': is_all_subjects,
-                'terms': detected_terms or [],
+                'data': engine.summary,
+                'total_report': engine.render('html'),
+                'subject': engine.subject,
+                'is_all_subjects': engine.is_all_subjects,
+                'terms': engine.terms,
                 'class_name': class_name,
                 'batch': batch,
-                'term': None if term in ("All", "all", None) else term,
+                'term': engine.term,
                 'sort_order': sort_order
             }
 
-        except Exception as e:
+        except ValueError as e:
+            # ReportEngine's invalid input: an unknown class, subject or output.
             return {
                 'success': False,
                 'error': str(e),
@@ -545,41 +575,50 @@ class ReportCardService:
         """
         Calculate positions based on all records for the class/term.
         Missing scores are treated as 0, so the total available is the same for every student.
+
+        Reads the pre-summed SubjectTermTotal rows rather than raw scores:
+        one SUM over the counted records' total_score, and one per-student
+        SUM of `obtained` (students with no scores still come back, with a
+        total of 0). Records without a subject aren't part of any subject
+        total, so they're left out of both sides.
         """
-        students = Student.objects.filter(class_name=class_obj)
-        # Get all records for this class and term that are included in totals
-        all_records = Record.objects.filter(
+        total_available = Record.objects.filter(
             class_name=class_obj,
             title=term,
+            subject__isnull=False,
             include_in_total=True,
             show_in_report=True
+        ).aggregate(total=Sum('total_score'))['total'] or 0
+
+        this_term = Q(subject_totals__class_name=class_obj, subject_totals__term=term)
+        totals = list(
+            Student.objects.filter(class_name=class_obj)
+            .annotate(total=Coalesce(Sum('subject_totals__obtained', filter=this_term), 0))
+            .order_by('id')
+            .values_list('id', 'total')
         )
+        return ReportCardService.rank_totals(totals, total_available)
 
-        totals = []
-        for student in students:
-            total_score = 0
-            total_available = 0
-            for rec in all_records:
-                total_available += rec.total_score
-                # Get the student's score for this record, default to 0
-                sr = StudentRecord.objects.filter(student=student, record=rec).first()
-                score = sr.score if sr else 0
-                total_score += score
-            totals.append((student, total_score, total_available))
-
-        totals.sort(key=lambda x: x[1], reverse=True)
+    @staticmethod
+    def rank_totals(totals, total_available):
+        """
+        Turn [(student_id, total_score), ...] into the positions dict.
+        Ties share a position and the next distinct score skips ahead
+        (competition ranking: 1, 2, 2, 4).
+        """
+        totals = sorted(totals, key=lambda x: x[1], reverse=True)
 
         positions = {}
         current_position = 0
         previous_score = None
-        for idx, (student, score, available) in enumerate(totals, start=1):
+        for idx, (student_id, score) in enumerate(totals, start=1):
             if score != previous_score:
                 current_position = idx
                 previous_score = score
-            positions[student.id] = {
+            positions[student_id] = {
                 'position': current_position,
                 'total_score': score,
-                'total_available': available,
+                'total_available': total_available,
                 'out_of': len(totals)
             }
         return positions
@@ -593,65 +632,161 @@ class ReportCardService:
         return "Poor"
 
     @staticmethod
-    def build_report_card_context(student, term, session):
+    def build_report_card_context(student, term, session, matrix=None, positions=None, term_reports=None):
+        """
+        Everything report-card.html needs for one student.
+
+        `matrix`, `positions` and `term_reports` (student_id -> TermReport)
+        can be passed in when rendering several students of the same
+        class/term, so they're only loaded once; otherwise the cached
+        ClassScoreMatrix is used.
+        """
         class_obj = student.class_name
-        term_report = TermReport.objects.filter(student=student, term=term, session=session).first()
+        if term_reports is None:
+            term_report = TermReport.objects.filter(student=student, term=term, session=session).first()
+        else:
+            term_report = term_reports.get(student.id)
 
-        positions = ReportCardService.calculate_positions(class_obj, term, session)
+        if positions is None:
+            positions = ReportCardService.calculate_positions(class_obj, term, session)
         pdata = positions.get(student.id, {})
         position = (term_report.position_override if term_report and term_report.position_override
                     else pdata.get('position'))
 
-        subjects_data = []
-        for st in SubjectTeacher.objects.filter(class_name=class_obj):
-            # Get all records for this subject, term, and class (show_in_report=True)
-            all_records = Record.objects.filter(
-                subject=st, class_name=class_obj, title=term, show_in_report=True
+        if matrix is None:
+            matrix = ClassScoreMatrix.load(class_obj, term)
+
+        total_score = pdata.get('total_score', 0)
+        total_available = pdata.get('total_available', 0)
+
+        return {
+            'student': student, 'class_obj': class_obj, 'term': term, 'session': session,
+            'term_report': term_report, 'position': position, 'out_of': pdata.get('out_of'),
+            'total_score': total_score, 'total_available': total_available,
+            'percentage': round((total_score / total_available) * 100, 1) if total_available else 0,
+            'subjects_data': matrix.subjects_data(student.id),
+            'number_examined': len(positions),
+        }
+
+    @staticmethod
+    def iter_class_report_cards(class_obj, term, session, students):
+        """
+        Yield a report card context per student, sharing one positions
+        computation, one score matrix and one TermReport query across the
+        whole class. `students` must all belong to class_obj.
+        """
+        positions = ReportCardService.calculate_positions(class_obj, term, session)
+        matrix = ClassScoreMatrix.load(class_obj, term)
+        term_reports = {
+            tr.student_id: tr
+            for tr in TermReport.objects.filter(student__class_name=class_obj, term=term, session=session)
+        }
+        for student in students:
+            student.class_name = class_obj
+            yield ReportCardService.build_report_card_context(
+                student, term, session,
+                matrix=matrix, positions=positions, term_reports=term_reports,
             )
-            # Separate included vs excluded for total calculation
-            included_records = all_records.filter(include_in_total=True)
 
+
+class ClassScoreMatrix:
+    """
+    Every (student, record, score) for one class/term held in memory, so a
+    report card's subject breakdown is built without touching the database.
+
+    Only records with show_in_report=True are loaded, matching what the
+    report card displays. Instances are cached per class/term and dropped
+    by the signal handlers in signals.py whenever a score, record or
+    subject assignment in that class changes.
+    """
+
+    CACHE_TIMEOUT = 60 * 10
+
+    def __init__(self, class_id, term, subjects, records, scores):
+        self.class_id = class_id
+        self.term = term
+        # [(subject_teacher_id, subject name), ...] in display order
+        self.subjects = subjects
+        # subject_teacher_id -> [{'id', 'record_type', 'record_number', 'total_score', 'include_in_total'}, ...]
+        self.records = records
+        # (student_id, record_id) -> score
+        self.scores = scores
+
+    @staticmethod
+    def cache_key(class_id, term):
+        return f"score-matrix:{class_id}:{term.replace(' ', '_')}"
+
+    @classmethod
+    def load(cls, class_obj, term):
+        """Return the cached matrix for this class/term, building it on a miss."""
+        key = cls.cache_key(class_obj.id, term)
+        matrix = cache.get(key)
+        if matrix is None:
+            matrix = cls.build(class_obj, term)
+            cache.set(key, matrix, cls.CACHE_TIMEOUT)
+        return matrix
+
+    @classmethod
+    def build(cls, class_obj, term):
+        """Three queries: the class's subjects, the term's records, and every score."""
+        subjects = [
+            (st.id, str(st))
+            for st in SubjectTeacher.objects.filter(class_name=class_obj)
+            .select_related('subject').order_by('id')
+        ]
+
+        records = defaultdict(list)
+        for rec in Record.objects.filter(
+            class_name=class_obj, title=term, show_in_report=True
+        ).order_by('id').values('id', 'subject_id', 'record_type', 'record_number', 'total_score', 'include_in_total'):
+            records[rec.pop('subject_id')].append(rec)
+
+        scores = {
+            (student_id, record_id): score
+            for student_id, record_id, score in StudentRecord.objects.filter(
+                record__class_name=class_obj, record__title=term, record__show_in_report=True
+            ).values_list('student_id', 'record_id', 'score')
+        }
+        return cls(class_obj.id, term, subjects, dict(records), scores)
+
+    @classmethod
+    def invalidate(cls, class_id):
+        cache.delete_many([cls.cache_key(class_id, term) for term, _ in TERM_CHOICES])
+
+    def score(self, student_id, record_id, default=0):
+        return self.scores.get((student_id, record_id), default)
+
+    def subjects_data(self, student_id):
+        """Per-subject CA/exam/obtained breakdown for one student; missing scores count as 0."""
+        subjects_data = []
+        for st_id, subject_name in self.subjects:
             test_score = 0
             exam_score = 0
             total_obtainable = 0
             obtained = 0
 
-            # Process all records for display
-            for rec in all_records:
-                sr = StudentRecord.objects.filter(student=student, record=rec).first()
-                score = sr.score if sr else 0
-                if rec.record_type == "Exam":
+            for rec in self.records.get(st_id, []):
+                score = self.score(student_id, rec['id'])
+                if rec['record_type'] == "Exam":
                     exam_score += score
                 else:
                     test_score += score
 
                 # For totals, only include if this record is marked to be included
-                if rec.include_in_total:
-                    total_obtainable += rec.total_score
+                if rec['include_in_total']:
+                    total_obtainable += rec['total_score']
                     obtained += score
-                # else: excluded, so not added to obtained/total_obtainable
 
             pct = round((obtained / total_obtainable) * 100, 1) if total_obtainable else 0
             subjects_data.append({
-                'subject': st.subject.name,
+                'subject': subject_name,
                 'cont_assess': test_score,
                 'exam': exam_score,
                 'obtainable': total_obtainable,
                 'obtained': obtained,
                 'remark': ReportCardService.grade_remark(pct),
             })
-
-        total_score = pdata.get('total_score', 0)
-        total_available = pdata.get('total_available', 0)
-
-        return {
-            'student': student, 'class_obj': class_obj, 'term': term, 'session': session,
-            'term_report': term_report, 'position': position, 'out_of': pdata.get('out_of'),
-            'total_score': total_score, 'total_available': total_available,
-            'percentage': round((total_score / total_available) * 100, 1) if total_available else 0,
-            'subjects_data': subjects_data,
-            'number_examined': Student.objects.filter(class_name=class_obj).count(),
-        }
+        return subjects_data
 
 
 class RecordGroupingService:
@@ -0,0 +1,181 @@
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from .models import (
+    Class, Record, ScoreRefresh, ScoreRollup, Student, StudentRecord, Subject, SubjectTeacher, Topic, User,
+    scores_bulk_changed,
+)
+from .search import SearchIndex
+from .service import ClassScoreMatrix
+from .decorator import TokenCache
+
+
+def _deleted_directly(origin, model):
+    """
+    True when a delete started on `model` itself (an instance or a
+    queryset), rather than cascading down from a parent row. Cascades from
+    a Student/Class/SubjectTeacher take the SubjectTermTotal rows with
+    them, and a Record delete refreshes its group once on its own.
+    """
+    return isinstance(origin, model) or getattr(origin, 'model', None) is model
+
+
+@receiver(pre_save, sender=StudentRecord)
+def remember_score_before(sender, instance, **kwargs):
+    """The (record, score) this row held before the save, None for a new row."""
+    if instance._state.adding:
+        instance._score_before = None
+    elif hasattr(instance, '_loaded'):
+        instance._score_before = instance._loaded
+    else:
+        instance._score_before = (
+            StudentRecord.objects.filter(pk=instance.pk).values_list('record_id', 'score').first()
+        )
+
+
+@receiver(post_save, sender=StudentRecord)
+def student_record_saved(sender, instance, **kwargs):
+    """
+    Fold this save into its record's running score aggregates straight
+    away, and leave the rest (totals, computed records, rollups, the cached
+    score matrix) to ScoreRefresh.
+    """
+    record = instance.record
+    before = getattr(instance, '_score_before', None)
+    if before is None:
+        record.apply_score_change(new=instance.score)
+    elif before[0] != instance.record_id:
+        ScoreRefresh.scores_changed(before[0], [instance.student_id], stats=True)
+        record.apply_score_change(new=instance.score)
+    elif before[1] != instance.score:
+        record.apply_score_change(old=before[1], new=instance.score)
+    else:
+        return
+    instance._loaded = (instance.record_id, instance.score)
+    instance._score_before = instance._loaded
+    ScoreRefresh.scores_changed(record, [instance.student_id])
+
+
+@receiver(post_delete, sender=StudentRecord)
+def student_record_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Deletes run inside ScoreRefresh.deferred() (UserModel/UserQuerySet),
+    so each row only notes its record_id; the record itself is never
+    loaded, and the aggregates, totals and rollups of the records left
+    standing are refreshed once at the end.
+    """
+    if _deleted_directly(origin, StudentRecord):
+        ScoreRefresh.scores_changed(instance.record_id, [instance.student_id], stats=True)
+    elif _deleted_directly(origin, Student) or _deleted_directly(origin, Class):
+        # The student's totals went with them; a promoted student's scores
+        # in an earlier class's records leave those records to recount.
+        ScoreRefresh.scores_changed(instance.record_id, stats=True)
+    # Cascades from a Record, SubjectTeacher or User take the record too.
+
+
+@receiver(scores_bulk_changed)
+def student_records_bulk_changed(sender, record, student_ids, **kwargs):
+    """Same as student_record_changed, once for a whole batch of one record's scores."""
+    ScoreRefresh.scores_changed(record, student_ids, stats=True)
+
+
+@receiver(pre_save, sender=Record)
+def remember_record_totals_key(sender, instance, **kwargs):
+    """Keep the pre-edit (subject, class, term) so an edit that moves a record refreshes both sides."""
+    instance._totals_key_before = None
+    if instance.pk:
+        instance._totals_key_before = (
+            Record.objects.filter(pk=instance.pk)
+            .values_list('subject_id', 'class_name_id', 'title', 'total_score').first()
+        )
+
+
+@receiver(pre_delete, sender=Record)
+def remember_record_dependents(sender, instance, origin=None, **kwargs):
+    """
+    Note the computed records whose logic reads this one; the depends_on
+    rows are gone by post_delete. References stay within a class, so a
+    deleted class or user takes the dependents along too.
+    """
+    instance._dependents_before = []
+    if not (_deleted_directly(origin, Class) or _deleted_directly(origin, User)):
+        instance._dependents_before = list(instance.dependents.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Record)
+def record_deleted(sender, instance, **kwargs):
+    """Re-evaluate the computed records that read the deleted one."""
+    dependents = getattr(instance, '_dependents_before', None)
+    if dependents:
+        ScoreRefresh.inputs_removed(dependents)
+
+
+@receiver([post_save, post_delete], sender=Record)
+def record_changed(sender, instance, **kwargs):
+    # Cascades are handled where they start (subject_teacher_changed; a deleted class has no matrix left).
+    if 'origin' in kwargs and not _deleted_directly(kwargs['origin'], Record):
+        return
+    if instance.class_name_id:
+        ClassScoreMatrix.invalidate(instance.class_name_id)
+
+    # total_score and the report flags feed every student's row.
+    ScoreRefresh.group_changed(instance.subject_id, instance.class_name_id, instance.title)
+    before = getattr(instance, '_totals_key_before', None)
+    if before:
+        before, total_before = before[:3], before[3]
+        ScoreRefresh.group_changed(*before)
+        if total_before != instance.total_score:
+            # The pass mark moved with it.
+            ScoreRefresh.scores_changed(instance, stats=True)
+        if before[1] and before[1] != instance.class_name_id:
+            ClassScoreMatrix.invalidate(before[1])
+
+
+@receiver(post_save, sender=Class)
+def class_changed(sender, instance, created, **kwargs):
+    """The rollups carry their class's session and owner; students' and records' search text its name."""
+    if not created:
+        ScoreRollup.objects.filter(class_name=instance).update(session=instance.session, user=instance.user)
+        SearchIndex.refresh('student', "t.class_name_id = %s", [instance.id])
+        SearchIndex.refresh('record', "t.class_name_id = %s", [instance.id])
+
+
+@receiver(post_save, sender=Subject)
+def subject_changed(sender, instance, created, **kwargs):
+    """A renamed subject renames its records and topics in search."""
+    if not created:
+        SearchIndex.refresh(
+            'record', "t.subject_id IN (SELECT id FROM record_subjectteacher WHERE subject_id = %s)", [instance.id]
+        )
+        SearchIndex.refresh('topic', "t.subject_id = %s", [instance.id])
+
+
+@receiver([post_save, post_delete], sender=SubjectTeacher)
+def subject_teacher_changed(sender, instance, **kwargs):
+    if instance.class_name_id:
+        ClassScoreMatrix.invalidate(instance.class_name_id)
+    if kwargs.get('created') is False:
+        SearchIndex.refresh('record', "t.subject_id = %s", [instance.id])
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_save, sender=Record)
+@receiver(post_save, sender=Class)
+@receiver(post_save, sender=Subject)
+@receiver(post_save, sender=Topic)
+def searchable_saved(sender, instance, **kwargs):
+    SearchIndex.index(instance)
+
+
+@receiver(post_delete, sender=Student)
+@receiver(post_delete, sender=Record)
+@receiver(post_delete, sender=Class)
+@receiver(post_delete, sender=Subject)
+@receiver(post_delete, sender=Topic)
+def searchable_deleted(sender, instance, **kwargs):
+    SearchIndex.remove(instance)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    """Cached auth snapshots of this user are stale (term, role, secret_key...)."""
+    TokenCache.invalidate_user(instance.id)
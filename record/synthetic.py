@@ -0,0 +1,163 @@
+"""
+Synthetic school data for benchmarks and load testing.
+
+Everything is written with bulk_create, so a school with a few hundred
+thousand scores is generated in seconds. Derived data (SubjectTermTotal,
+the Record score aggregates, ScoreRollup, the search index) is rebuilt at
+the end so the data looks exactly like data entered through the app.
+"""
+import random
+from uuid import uuid4
+
+from django.db import transaction
+
+from .models import (
+    CLASSES, TERM_CHOICES, Class, Record, ScoreRollup, Student, StudentRecord, Subject,
+    SubjectTeacher, SubjectTermTotal, User, current_academic_session,
+)
+from .search import SearchIndex
+
+SUBJECT_NAMES = [
+    "Mathematics", "English Language", "Basic Science", "Basic Technology", "Social Studies",
+    "Civic Education", "Agricultural Science", "Home Economics", "Computer Studies",
+    "Christian Religious Studies", "Islamic Religious Studies", "French", "Yoruba",
+    "Igbo", "Hausa", "Physical and Health Education", "Business Studies", "Fine Arts",
+    "Music", "Literature in English",
+]
+
+# (record_type, record_number, total_score) per subject per term
+RECORD_LAYOUT = [("Test", 1, 10), ("Test", 2, 20), ("Exam", 1, 70)]
+
+# Marks the tests share when record_layout() spreads them over more or fewer tests.
+CA_MARKS = 30
+
+
+# A computed record per subject and term: the CA, summed from the tests.
+LOGIC_LAYOUT = ("Assignment", 1)
+
+
+def record_layout(records_per_term=len(RECORD_LAYOUT)):
+    """
+    RECORD_LAYOUT for the default count; otherwise `records_per_term - 1`
+    tests sharing CA_MARKS and an exam making the total up to 100.
+    """
+    if records_per_term < 1:
+        raise ValueError("records_per_term must be at least 1")
+    if records_per_term == len(RECORD_LAYOUT):
+        return RECORD_LAYOUT
+    tests = records_per_term - 1
+    marks = [max(1, CA_MARKS // tests + (n < CA_MARKS % tests)) for n in range(tests)]
+    return [("Test", n + 1, total) for n, total in enumerate(marks)] + [("Exam", 1, 100 - CA_MARKS if tests else 100)]
+
+
+def generate_school(classes=10, students_per_class=40, subjects_per_class=10,
+                    terms=None, fill=1.0, seed=None, username=None,
+                    class_specs=None, school=None, with_logic=False,
+                    records_per_term=len(RECORD_LAYOUT)):
+    """
+    Create one teacher with `classes` classes, each with its own students,
+    subject assignments and `records_per_term` records (record_layout) for
+    every term, and score `fill` (0-1) of all student/record cells.
+    Returns the User.
+
+    `class_specs` ([(name, batch), ...]) picks the classes explicitly
+    instead of cycling JSS1-SS3 x A-D; classes past the first 24 go in
+    earlier sessions. `with_logic` adds the LOGIC_LAYOUT computed record,
+    summing the tests, to every subject/term, compiled and evaluated the
+    same way a teacher-created one would be.
+    """
+    rng = random.Random(seed)
+    terms = terms or [title for title, _ in TERM_CHOICES]
+    layout = record_layout(records_per_term)
+    if with_logic and not any(record_type == "Test" for record_type, _, _ in layout):
+        raise ValueError("with_logic needs at least one test per term (records_per_term >= 2)")
+    tag = uuid4().hex[:8]
+    if class_specs is None:
+        class_specs = [(CLASSES[i % len(CLASSES)][0], "ABCD"[(i // len(CLASSES)) % 4]) for i in range(classes)]
+    first_year = int(current_academic_session().split("/")[0])
+
+    with transaction.atomic():
+        user = User.objects.create(username=username or f"synthetic-{tag}", password="!", school=school)
+
+        class_objs = Class.objects.bulk_create([
+            Class(user=user, name=name, batch=batch, session=f"{year}/{year + 1}")
+            for i, (name, batch) in enumerate(class_specs)
+            for year in [first_year - i // (len(CLASSES) * 4)]
+        ])
+        subjects = [Subject.objects.get_or_create(name=name)[0]
+                    for name in SUBJECT_NAMES[:subjects_per_class]]
+
+        students = Student.objects.bulk_create([
+            Student(user=user, class_name=class_obj, name=f"Student {class_obj.id}-{n:03d}",
+                    admission_number=class_obj.id * 1000 + n, school=school,
+                    gender=("Male", "Female")[n % 2])
+            for class_obj in class_objs
+            for n in range(students_per_class)
+        ], batch_size=1000)
+
+        teachers = SubjectTeacher.objects.bulk_create([
+            SubjectTeacher(user=user, subject=subject, class_name=class_obj)
+            for class_obj in class_objs
+            for subject in subjects
+        ], batch_size=1000)
+
+        records = Record.objects.bulk_create([
+            Record(user=user, title=term, subject=teacher, class_name=teacher.class_name,
+                   record_type=record_type, record_number=number, total_score=total)
+            for teacher in teachers
+            for term in terms
+            for record_type, number, total in layout
+        ], batch_size=1000)
+
+        by_class = {}
+        for student in students:
+            by_class.setdefault(student.class_name_id, []).append(student.id)
+
+        batch = []
+        for record in records:
+            for student_id in by_class[record.class_name_id]:
+                if fill >= 1 or rng.random() < fill:
+                    batch.append(StudentRecord(user=user, student_id=student_id, record_id=record.id,
+                                               score=rng.randint(0, record.total_score)))
+                if len(batch) >= 5000:
+                    StudentRecord.objects.bulk_create(batch)
+                    batch = []
+        StudentRecord.objects.bulk_create(batch)
+
+        if with_logic:
+            _add_logic_records(user, teachers, terms, layout)
+
+        SubjectTermTotal.rebuild([class_obj.id for class_obj in class_objs])
+        Record.rebuild_score_stats(Record.objects.filter(class_name__in=class_objs))
+        ScoreRollup.rebuild([class_obj.id for class_obj in class_objs])
+        for kind in ('class', 'student', 'record'):
+            SearchIndex.refresh(kind, "t.user_id = %s", [user.id])
+    return user
+
+
+def _add_logic_records(user, teachers, terms, layout):
+    record_type, number = LOGIC_LAYOUT
+    tests = [(n, marks) for kind, n, marks in layout if kind == "Test"]
+    logic = " + ".join(f"@Test:{n}" for n, _ in tests)
+    total = sum(marks for _, marks in tests)
+    logic_records = Record.objects.bulk_create([
+        Record(user=user, title=term, subject=teacher, class_name=teacher.class_name,
+               record_type=record_type, record_number=number, total_score=total,
+               logic=logic, include_in_total=False)
+        for teacher in teachers
+        for term in terms
+    ], batch_size=1000)
+
+    for record in logic_records:
+        record.compiled_logic = record.compile_logic()
+    Record.objects.bulk_update(logic_records, ['compiled_logic'], batch_size=500)
+
+    Through = Record.depends_on.through
+    Through.objects.bulk_create([
+        Through(from_record_id=record.id, to_record_id=ref_id)
+        for record in logic_records
+        for ref_id in set(record.compiled_logic['record_ids'])
+    ], batch_size=1000)
+
+    for record in logic_records:
+        record.evaluate_logic_for_class()
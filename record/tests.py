@@ -1,3 +1,1054 @@
-from django.test import TestCase
+import json
+import logging
+import math
+import random
+import statistics
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from io import BytesIO, StringIO
+from pathlib import Path
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .analytics import ClassAnalytics, describe
+from .decorator import TokenCache
+from .formula import FormulaError, Reference, compile_formula, parse_reference
+from .importer import ScoreImport, iter_rows
+from .models import (
+    Class, History, Record, ScoreRollup, Student, StudentRecord, SubjectTeacher, SubjectTermTotal, User,
+)
+from .service import (
+    ClassScoreMatrix, HistoryBuffer, HistoryService, ReportCardService, SearchService, StudentRecordService,
+)
+from .synthetic import generate_school
+
+TERM = "First Term"
+
+# QueryStatsMiddleware logs a line per request at INFO; in tests only the
+# over-budget warnings are worth seeing.
+logging.getLogger('record.queries').setLevel(logging.WARNING)
+
+
+def scenarios(class_obj, term=TERM):
+    """
+    (label, method, url, data) for the requests the query budgets cover,
+    against one class of a synthetic school. `data` may be a callable, so
+    each save posts new scores rather than repeating an unchanged grid.
+    """
+    teacher = SubjectTeacher.objects.filter(class_name=class_obj).select_related('subject').order_by('id').first()
+    students = list(Student.objects.filter(class_name=class_obj).order_by('name'))
+    student = students[0]
+    student_ids = [s.id for s in students]
+    manual = list(Record.objects.filter(subject=teacher, title=term, logic__isnull=True).order_by('id'))
+    record = manual[0]
+    rng = random.Random(0)
+
+    def score_sheet(action):
+        def data():
+            rows = [["Name"] + [f"{rec.record_type} {rec.record_number}" for rec in manual]]
+            rows += [[s.name] + [str(rng.randint(0, rec.total_score)) for rec in manual] for s in students]
+            sheet = "\n".join(",".join(row) for row in rows).encode()
+            return {'action': action, 'term': term, 'file': SimpleUploadedFile("scores.csv", sheet)}
+        return data
+
+    report_params = {'subject': teacher.subject_id, 'class': class_obj.name,
+                     'batch': class_obj.batch, 'term': term}
+    return [
+        ("home", "get", reverse('home'), None),
+        ("class detail", "get", reverse('get-class', args=[class_obj.id]), None),
+        ("class report", "get", reverse('class-report', args=[class_obj.id]), None),
+        ("class subject report", "get", reverse('class-report', args=[class_obj.id]),
+         {'subject_id': teacher.subject_id}),
+        ("class analytics", "get", reverse('class-analytics', args=[class_obj.id]), None),
+        ("subject detail", "get", reverse('subject-detail', args=[teacher.subject_id]), None),
+        ("record detail", "get", reverse('get-record', args=[record.id]), None),
+        ("report form", "post", reverse('generateReport'), dict(report_params, sort='asc')),
+        ("report card", "get", reverse('report-card', args=[student.id]),
+         {'term': term, 'session': class_obj.session}),
+        ("class report cards", "get", reverse('report-card-class-print', args=[class_obj.id]),
+         {'term': term, 'session': class_obj.session}),
+        ("excel export", "get", reverse('export_report_excel'), report_params),
+        ("report json", "get", reverse('api-report'), report_params),
+        ("class broadsheet", "get", reverse('class-broadsheet', args=[class_obj.id]), {'term': term}),
+        ("bulk score entry form", "get", reverse('bulk-score-entry', args=[record.id]), None),
+        ("bulk score entry save", "post", reverse('bulk-score-entry', args=[record.id]),
+         lambda: {f"score_{sid}": str(rng.randint(0, record.total_score)) for sid in student_ids}),
+        ("score grid form", "get", reverse('bulk-multi-score-entry', args=[teacher.id]), None),
+        ("score grid save", "post", reverse('bulk-multi-score-entry', args=[teacher.id]),
+         lambda: {f"score_{sid}_{rec.id}": str(rng.randint(0, rec.total_score))
+                  for sid in student_ids for rec in manual}),
+        ("score import preview", "post", reverse('import-scores', args=[teacher.id]), score_sheet('preview')),
+        ("score import", "post", reverse('import-scores', args=[teacher.id]), score_sheet('import')),
+        ("history", "get", reverse('historyView'), None),
+        ("analytics dashboard", "get", reverse('analytics'), None),
+        ("search", "get", reverse('search'), {'search': student.name[:3]}),
+    ]
+
+
+# Page views queue History rows for a timer thread; keep them queued for
+# the whole test and drop them in tearDown, so no write lands mid-request.
+@override_settings(HISTORY_BUFFER_SIZE=10 ** 6, HISTORY_FLUSH_INTERVAL=3600)
+class QueryBudgetTests(TestCase):
+    """
+    Every view in scenarios() stays within its @query_budget on a synthetic
+    school. The budgets don't depend on the data size, so a view that
+    starts querying per student, subject or record fails here.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = generate_school(classes=2, students_per_class=40, subjects_per_class=10,
+                                   terms=[TERM], seed=1, with_logic=True)
+        cls.user.active_term = TERM
+        cls.user.save(update_fields=['active_term'])
+        cls.class_obj = Class.objects.filter(user=cls.user).order_by('id').first()
+
+    def setUp(self):
+        self.token = self.user.generate_token()
+        self.client = Client()
+        self.client.cookies['auth_token'] = self.token
+
+    def tearDown(self):
+        HistoryBuffer.flush()
+
+    def request(self, method, url, data):
+        response = getattr(self.client, method)(url, data() if callable(data) else data)
+        if hasattr(response, 'streaming_content'):
+            b''.join(response.streaming_content)
+        return response
+
+    def test_views_stay_within_their_query_budgets(self):
+        for label, method, url, data in scenarios(self.class_obj):
+            with self.subTest(label):
+                budget = getattr(resolve(url).func, 'query_budget', None)
+                self.assertIsNotNone(budget, f"{label}: the view has no @query_budget")
+                # Measure the worst case: the token not yet cached and the
+                # score matrix cold. The first request just leaves a save's
+                # rows in place, so the measured one updates them.
+                self.request(method, url, data)
+                TokenCache.invalidate_token(self.token)
+                ClassScoreMatrix.invalidate(self.class_obj.id)
+                with CaptureQueriesContext(connection) as captured:
+                    response = self.request(method, url, data)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(
+                    len(captured), budget,
+                    f"{label}: {len(captured)} queries, over its budget of {budget}:\n"
+                    + "\n".join(query['sql'] for query in captured.captured_queries),
+                )
+
+
+@override_settings(HISTORY_BUFFER_SIZE=10 ** 6, HISTORY_FLUSH_INTERVAL=3600)
+class ConcurrentBulkEntryTests(TransactionTestCase):
+    """
+    Several teachers saving score columns at once: every save must land,
+    with no "database is locked" failures and no lost scores. Runs against
+    the file-based test database (DATABASES TEST NAME), where SQLite's
+    locking behaves as it does in production.
+    """
+
+    THREADS = 6
+    POSTS = 5
+
+    def setUp(self):
+        self.user = generate_school(classes=1, students_per_class=60, subjects_per_class=2,
+                                    terms=[TERM], seed=1)
+        self.records = list(Record.objects.filter(user=self.user).order_by('id')[:self.THREADS])
+        self.students = list(Student.objects.filter(user=self.user).values_list('id', flat=True))
+
+    def tearDown(self):
+        HistoryBuffer.flush()
+
+    def test_concurrent_column_saves_all_land(self):
+        token = self.user.generate_token()
+        last_posted, failures = {}, []
+        lock = threading.Lock()
+
+        def worker(record):
+            client = Client(raise_request_exception=False)
+            client.cookies['auth_token'] = token
+            url = reverse('bulk-score-entry', args=[record.id])
+            rng = random.Random(record.id)
+            try:
+                for _ in range(self.POSTS):
+                    scores = {sid: rng.randint(0, record.total_score) for sid in self.students}
+                    response = client.post(url, {f"score_{sid}": str(score) for sid, score in scores.items()})
+                    with lock:
+                        if response.status_code == 200:
+                            last_posted[record.id] = scores
+                        else:
+                            failures.append(f"record {record.id}: HTTP {response.status_code}")
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker, args=(record,)) for record in self.records]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+
+        self.assertEqual(failures, [])
+        self.assertEqual(len(last_posted), len(self.records))
+        for record_id, scores in last_posted.items():
+            stored = dict(StudentRecord.objects.filter(record_id=record_id).values_list('student_id', 'score'))
+            self.assertEqual(stored, scores, f"record {record_id} doesn't hold its last save")
+
+
+@override_settings(HISTORY_BUFFER_SIZE=10 ** 6, HISTORY_FLUSH_INTERVAL=3600)
+class BenchmarkReportsCommandTests(TestCase):
+    """benchmark_reports runs every benchmark on its own synthetic school and removes it again."""
+
+    def test_every_benchmark_runs_and_the_school_is_removed(self):
+        users_before = User.objects.count()
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / "results.json"
+            call_command('benchmark_reports', classes=1, students=5, subjects=2, logic=True, repeat=1,
+                         output=str(output), stdout=StringIO())
+            results = json.loads(output.read_text())['results']
+
+        failed = {name: line['error'] for name, line in results.items() if not line['ok']}
+        self.assertEqual(failed, {})
+        self.assertEqual(User.objects.count(), users_before)
+
+
+class SchoolTestCase(TestCase):
+    """A single small class: six students, two subjects, one term, with a computed CA record."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = generate_school(classes=1, students_per_class=6, subjects_per_class=2,
+                                   terms=[TERM], seed=1, with_logic=True)
+        cls.class_obj = Class.objects.get(user=cls.user)
+        cls.students = list(Student.objects.filter(class_name=cls.class_obj).order_by('id'))
+        cls.teacher = SubjectTeacher.objects.filter(class_name=cls.class_obj).order_by('id').first()
+        cls.manual = list(Record.objects.filter(subject=cls.teacher, logic__isnull=True).order_by('id'))
+        cls.computed = Record.objects.get(subject=cls.teacher, logic__isnull=False)
+
+    def set_scores(self, scores):
+        """Write {(student, record): score} the way the bulk entry views do."""
+        records = {record for _, record in scores}
+        StudentRecordService.upsert_scores(self.user, records, {
+            (student.id, record.id): score for (student, record), score in scores.items()
+        })
+
+    def score_edits(self):
+        """
+        (label, edit) for each way scores and records change through the
+        models: every edit leaves the derived tables to their signal
+        handlers and ScoreRefresh.
+        """
+        first, second, third = self.manual[:3]
+
+        def single_save():
+            row = StudentRecord.objects.filter(record=first).order_by('id').first()
+            row.score = (row.score + 1) % (first.total_score + 1)
+            row.save()
+
+        def new_score():
+            StudentRecord.objects.filter(record=second, student=self.students[0]).delete()
+            StudentRecord.objects.create(user=self.user, student=self.students[0], record=second, score=1)
+
+        def move_score():
+            row = StudentRecord.objects.get(record=third, student=self.students[2])
+            StudentRecord.objects.filter(record=first, student=self.students[2]).delete()
+            row.record = first
+            row.score = min(row.score, first.total_score)
+            row.save()
+
+        def total_score_edit():
+            third.total_score += 5
+            third.save()
+
+        def left_out_of_totals():
+            second.include_in_total = False
+            second.save()
+
+        return [
+            ("single save", single_save),
+            ("new score", new_score),
+            ("bulk upsert", lambda: self.set_scores({(student, first): 0 for student in self.students})),
+            ("score moved to another record", move_score),
+            ("score deleted", lambda: StudentRecord.objects.filter(record=second, student=self.students[1]).delete()),
+            ("queryset delete", lambda: StudentRecord.objects.filter(student=self.students[3]).delete()),
+            ("record total edited", total_score_edit),
+            ("record left out of totals", left_out_of_totals),
+            ("student deleted", lambda: self.students[4].delete()),
+            ("record deleted", lambda: Record.objects.get(pk=first.pk).delete()),
+        ]
+
+
+class RankingTests(SchoolTestCase):
+    """calculate_positions: competition ranking over the SubjectTermTotal rows."""
+
+    def test_rank_totals_shares_a_position_and_skips_the_next(self):
+        positions = ReportCardService.rank_totals([(1, 50), (2, 70), (3, 50), (4, 30)], 200)
+        self.assertEqual({sid: p['position'] for sid, p in positions.items()}, {2: 1, 1: 2, 3: 2, 4: 4})
+        self.assertEqual({p['out_of'] for p in positions.values()}, {4})
+        self.assertEqual({p['total_available'] for p in positions.values()}, {200})
+
+    def test_tied_students_share_a_position(self):
+        first, second = self.students[:2]
+        # Same scores for both on every record, in both subjects.
+        records = Record.objects.filter(class_name=self.class_obj, logic__isnull=True)
+        self.set_scores({(student, record): record.total_score
+                         for student in (first, second) for record in records})
+
+        positions = ReportCardService.calculate_positions(self.class_obj, TERM)
+        self.assertEqual(positions[first.id]['position'], 1)
+        self.assertEqual(positions[second.id]['position'], 1)
+        self.assertEqual(positions[first.id]['total_score'], positions[second.id]['total_score'])
+        self.assertTrue(all(positions[s.id]['position'] >= 3 for s in self.students[2:]))
+
+    def test_matches_totals_summed_from_the_scores(self):
+        counted = Record.objects.filter(class_name=self.class_obj, title=TERM, subject__isnull=False,
+                                        include_in_total=True, show_in_report=True)
+        StudentRecord.objects.filter(student=self.students[-1]).delete()
+        totals = {student.id: 0 for student in self.students}
+        for student_id, score in StudentRecord.objects.filter(record__in=counted).values_list('student_id', 'score'):
+            totals[student_id] += score
+        available = sum(record.total_score for record in counted)
+
+        positions = ReportCardService.calculate_positions(self.class_obj, TERM)
+        self.assertEqual(positions, ReportCardService.rank_totals(list(totals.items()), available))
+        self.assertEqual(positions[self.students[-1].id]['total_score'], 0)
+
+
+class SubjectTermTotalTests(SchoolTestCase):
+    """The SubjectTermTotal rows the write paths maintain match a rebuild from the scores."""
+
+    def snapshot(self):
+        return sorted(SubjectTermTotal.objects.values_list(
+            'student_id', 'subject_id', 'class_name_id', 'term', 'session', 'obtained', 'obtainable',
+            'ca_total', 'exam_total', 'score_sum', 'score_count'))
+
+    def test_every_edit_matches_a_rebuild(self):
+        for label, edit in self.score_edits():
+            with self.subTest(label):
+                edit()
+                maintained = self.snapshot()
+                SubjectTermTotal.rebuild()
+                self.assertEqual(maintained, self.snapshot())
+
+
+class FormulaParserTests(SimpleTestCase):
+    """Tokenising and parsing Record.logic into the formula AST."""
+
+    def test_precedence_parentheses_and_unary_minus(self):
+        self.assertEqual(compile_formula("@Test:1 + @Test:2 * 2").ast,
+                         ["add", ["ref", 0], ["mul", ["ref", 1], ["num", 2.0]]])
+        self.assertEqual(compile_formula("(@1 + @2) / -2").ast,
+                         ["div", ["add", ["ref", 0], ["ref", 1]], ["neg", ["num", 2.0]]])
+        self.assertEqual(compile_formula("round(avg(@1, .5), 1)").ast,
+                         ["call", "round", [["call", "avg", [["ref", 0], ["num", 0.5]]], ["num", 1.0]]])
+
+    def test_each_reference_is_listed_once_in_order(self):
+        formula = compile_formula("@Exam:1 + @Test:1 + @Exam:1")
+        self.assertEqual(formula.references, [Reference(None, None, "Exam", 1), Reference(None, None, "Test", 1)])
+        self.assertEqual(formula.ast, ["add", ["add", ["ref", 0], ["ref", 1]], ["ref", 0]])
+
+    def test_reference_forms(self):
+        cases = {
+            "1": Reference(None, None, None, 1),
+            "Test:2": Reference(None, None, "Test", 2),
+            "First Term:Test:1": Reference("First Term", None, "Test", 1),
+            "FirstTerm:Test:1": Reference("First Term", None, "Test", 1),
+            "second term:3": Reference("Second Term", None, None, 3),
+            "Third Term:Mathematics:Exam:1": Reference("Third Term", "Mathematics", "Exam", 1),
+        }
+        for text, reference in cases.items():
+            with self.subTest(text):
+                self.assertEqual(parse_reference(text), reference)
+
+    def test_malformed_logic_is_rejected(self):
+        cases = {
+            "": "empty",
+            "   ": "empty",
+            "@Test:1 +": "Unexpected end of formula",
+            "(@1 + @2": "expected ')'",
+            "@1 $ 2": "Unexpected character '$'",
+            "@1 @2": "Unexpected '2'",
+            "@Test:one": "must end with a record number",
+            "@A:B:C:D:1": "Invalid reference format",
+            "total(@1)": "Unknown function 'total'",
+        }
+        for source, message in cases.items():
+            with self.subTest(source):
+                with self.assertRaisesMessage(FormulaError, message):
+                    compile_formula(source)
+
+    def test_formula_errors_are_validation_errors(self):
+        self.assertTrue(issubclass(FormulaError, ValidationError))
+
+
+class FormulaEvaluationTests(SimpleTestCase):
+    """Formula.evaluate and its whole-class counterpart evaluate_columns."""
+
+    def test_results_are_rounded_whole_scores(self):
+        formula = compile_formula("avg(@1, @2) * 0.7 + max(@1, 3) - min(@2, 1)")
+        self.assertEqual(formula.evaluate([10, 5]), round((7.5 * 0.7) + 10 - 1))
+        self.assertEqual(compile_formula("round(@1 / 3, 1) * 10").evaluate([10]), 33)
+
+    def test_division_by_zero_scores_zero(self):
+        formula = compile_formula("@1 / @2 * 100")
+        self.assertEqual(formula.evaluate([7, 0]), 0)
+        self.assertEqual(formula.evaluate_columns([[7, 7], [0, 14]], 2), [0, 50])
+
+    def test_columns_match_row_by_row(self):
+        formula = compile_formula("(@Test:1 + @Test:2) / 2 - -@Exam:1 * 0.5")
+        columns = [[0, 3, 10], [5, 0, 20], [70, 1, 0]]
+        self.assertEqual(formula.evaluate_columns(columns, 3),
+                         [formula.evaluate([column[i] for column in columns]) for i in range(3)])
+        self.assertEqual(compile_formula("5").evaluate_columns([], 2), [5, 5])
+        self.assertEqual(formula.evaluate_columns(columns, 0), [])
+
+    def test_unusable_scores_raise_formula_error(self):
+        with self.assertRaisesMessage(FormulaError, "Could not evaluate logic"):
+            compile_formula("@1 + 1").evaluate([None])
+        with self.assertRaisesMessage(FormulaError, "Could not evaluate logic"):
+            compile_formula("@1 * 2").evaluate_columns([[1, None]], 2)
+
+
+class EvaluateLogicForClassTests(SchoolTestCase):
+    """Record.evaluate_logic_for_class over the synthetic CA record (the sum of the tests)."""
+
+    def expected(self):
+        tests = [record.id for record in self.manual if record.record_type == "Test"]
+        sums = {student.id: 0 for student in self.students}
+        for student_id, score in StudentRecord.objects.filter(record_id__in=tests).values_list('student_id', 'score'):
+            sums[student_id] += score
+        return sums
+
+    def stored(self):
+        return dict(StudentRecord.objects.filter(record=self.computed).values_list('student_id', 'score'))
+
+    def test_every_student_gets_the_formula_result(self):
+        StudentRecord.objects.filter(record=self.computed).update(score=0)
+        self.assertEqual(self.computed.evaluate_logic_for_class(), {'created': 0, 'updated': len(self.students)})
+        self.assertEqual(self.stored(), self.expected())
+
+    def test_missing_inputs_count_as_zero_and_rows_are_created(self):
+        student = self.students[0]
+        StudentRecord.objects.filter(student=student, record__in=self.manual).delete()
+        StudentRecord.objects.filter(student=student, record=self.computed).delete()
+        result = self.computed.evaluate_logic_for_class(student_ids=[student.id])
+        self.assertEqual(result, {'created': 1, 'updated': 0})
+        self.assertEqual(self.stored()[student.id], 0)
+
+    def test_create_missing_false_leaves_absent_rows_alone(self):
+        StudentRecord.objects.filter(record=self.computed, student=self.students[0]).delete()
+        self.computed.evaluate_logic_for_class(create_missing=False)
+        self.assertNotIn(self.students[0].id, self.stored())
+
+
+class DependencyPropagationTests(SchoolTestCase):
+    """
+    Score edits reach every computed record downstream, each evaluated
+    once and after the records it reads; logic that would loop is refused.
+    The chain: CA = Test 1 + Test 2, Practical = CA + Exam, Worksheet =
+    Practical * 2 - Test 1 (so Worksheet reads Test 1 both directly and
+    through the chain).
+    """
+
+    def setUp(self):
+        self.test1, self.test2, self.exam = self.manual
+        self.practical = self.add_computed("Practical", "@Assignment:1 + @Exam:1")
+        self.worksheet = self.add_computed("Worksheet", "@Practical:1 * 2 - @Test:1")
+
+    def add_computed(self, record_type, logic):
+        record = Record(user=self.user, title=TERM, subject=self.teacher, class_name=self.class_obj,
+                        record_type=record_type, record_number=1, total_score=300, logic=logic)
+        record.save()
+        return record
+
+    def scores(self, record):
+        return dict(StudentRecord.objects.filter(record=record).values_list('student_id', 'score'))
+
+    def assert_chain_is_current(self):
+        test1, test2, exam = self.scores(self.test1), self.scores(self.test2), self.scores(self.exam)
+        ca, practical, worksheet = {}, {}, {}
+        for student in self.students:
+            sid = student.id
+            ca[sid] = test1.get(sid, 0) + test2.get(sid, 0)
+            practical[sid] = ca[sid] + exam.get(sid, 0)
+            worksheet[sid] = practical[sid] * 2 - test1.get(sid, 0)
+        self.assertEqual(self.scores(self.computed), ca)
+        self.assertEqual(self.scores(self.practical), practical)
+        self.assertEqual(self.scores(self.worksheet), worksheet)
+
+    def test_a_score_edit_reaches_the_whole_chain(self):
+        self.assert_chain_is_current()
+        row = StudentRecord.objects.get(record=self.test1, student=self.students[0])
+        row.score = (row.score + 3) % (self.test1.total_score + 1)
+        row.save()
+        self.assert_chain_is_current()
+        self.set_scores({(student, self.test2): 1 for student in self.students})
+        self.assert_chain_is_current()
+
+    def test_each_dependent_is_evaluated_once_after_its_inputs(self):
+        evaluated = []
+        original = Record.evaluate_logic_for_class
+
+        def track(record, *args, **kwargs):
+            evaluated.append(record.id)
+            return original(record, *args, **kwargs)
+
+        with mock.patch.object(Record, 'evaluate_logic_for_class', autospec=True, side_effect=track):
+            self.set_scores({(student, self.test1): 0 for student in self.students})
+        self.assertEqual(evaluated, [self.computed.id, self.practical.id, self.worksheet.id])
+        self.assert_chain_is_current()
+
+    def test_logic_that_would_loop_is_rejected(self):
+        self.computed.logic = "@Test:1 + @Worksheet:1"
+        with self.assertRaisesMessage(ValidationError, "circular reference"):
+            self.computed.save()
+        self.computed.logic = "@Assignment:1 + 1"
+        with self.assertRaisesMessage(ValidationError, "can't reference the record itself"):
+            self.computed.full_clean()
+
+    def test_a_cycle_already_in_the_graph_is_reported(self):
+        Record.depends_on.through.objects.create(from_record=self.computed, to_record=self.worksheet)
+        with self.assertRaisesMessage(ValidationError, "references each other in a circle"):
+            self.set_scores({(self.students[0], self.test1): 1})
+
+    def test_deleting_an_input_recomputes_its_dependents(self):
+        Record.objects.get(pk=self.exam.pk).delete()
+        # The deleted exam now reads as 0 for every student.
+        self.assertEqual(self.scores(self.practical), self.scores(self.computed))
+        self.assert_chain_is_current()
+
+
+@override_settings(HISTORY_BUFFER_SIZE=10 ** 6, HISTORY_FLUSH_INTERVAL=3600)
+class ScoreEntryValidationTests(SchoolTestCase):
+    """Bulk score entry validates every typed score before its single upsert."""
+
+    def setUp(self):
+        self.record = self.manual[0]
+        self.client = Client()
+        self.client.cookies['auth_token'] = self.user.generate_token()
+
+    def tearDown(self):
+        HistoryBuffer.flush()
+
+    def test_parse_score(self):
+        total = self.record.total_score
+        self.assertEqual(StudentRecordService.parse_score(self.record, "7"), (7, None))
+        self.assertEqual(StudentRecordService.parse_score(self.record, str(total)), (total, None))
+        cases = {
+            "abc": "'abc' is not a whole number",
+            "7.5": "'7.5' is not a whole number",
+            "-1": f"-1 is outside 0-{total}",
+            str(total + 1): f"{total + 1} is outside 0-{total}",
+        }
+        for raw, message in cases.items():
+            with self.subTest(raw):
+                self.assertEqual(StudentRecordService.parse_score(self.record, raw), (None, message))
+
+    def test_invalid_scores_are_reported_and_left_untouched(self):
+        valid, non_numeric, too_high, blank = self.students[:4]
+        before = dict(StudentRecord.objects.filter(record=self.record).values_list('student_id', 'score'))
+        new_score = (before[valid.id] + 1) % (self.record.total_score + 1)
+
+        response = self.client.post(reverse('bulk-score-entry', args=[self.record.id]), {
+            f"score_{valid.id}": str(new_score),
+            f"score_{non_numeric.id}": "ten",
+            f"score_{too_high.id}": str(self.record.total_score + 1),
+            f"score_{blank.id}": "  ",
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.context['errors']), sorted([
+            f"{non_numeric.name}: 'ten' is not a whole number",
+            f"{too_high.name}: {self.record.total_score + 1} is outside 0-{self.record.total_score}",
+        ]))
+        self.assertEqual((response.context['created'], response.context['updated']), (0, 1))
+        after = dict(StudentRecord.objects.filter(record=self.record).values_list('student_id', 'score'))
+        self.assertEqual(after, {**before, valid.id: new_score})
+
+
+@override_settings(HISTORY_BUFFER_SIZE=10 ** 6, HISTORY_FLUSH_INTERVAL=3600)
+class ScoreGridTests(SchoolTestCase):
+    """The multi-record score grid writes only the cells that changed."""
+
+    def setUp(self):
+        self.client = Client()
+        self.client.cookies['auth_token'] = self.user.generate_token()
+        self.url = reverse('bulk-multi-score-entry', args=[self.teacher.id])
+
+    def tearDown(self):
+        HistoryBuffer.flush()
+
+    def grid(self):
+        return {(student_id, record_id): score for student_id, record_id, score in
+                StudentRecord.objects.filter(record__in=self.manual).values_list('student_id', 'record_id', 'score')}
+
+    def post(self, grid):
+        upsert = mock.patch.object(StudentRecordService, 'upsert_scores', wraps=StudentRecordService.upsert_scores)
+        with upsert as written:
+            response = self.client.post(self.url, {f"score_{sid}_{rid}": str(score)
+                                                   for (sid, rid), score in grid.items()})
+        self.assertEqual(response.status_code, 200)
+        return response, written.call_args.args[2]
+
+    def test_an_unchanged_grid_writes_nothing(self):
+        response, written = self.post(self.grid())
+        self.assertEqual(written, {})
+        self.assertEqual((response.context['created'], response.context['updated']), (0, 0))
+
+    def test_only_changed_and_new_cells_are_written(self):
+        first, second = self.manual[:2]
+        changed, added = (self.students[0].id, first.id), (self.students[1].id, second.id)
+        StudentRecord.objects.filter(student_id=added[0], record_id=added[1]).delete()
+        grid = self.grid()
+        grid[changed] = (grid[changed] + 1) % (first.total_score + 1)
+        grid[added] = 2
+
+        response, written = self.post(grid)
+        self.assertEqual(written, {changed: grid[changed], added: 2})
+        self.assertEqual((response.context['created'], response.context['updated']), (1, 1))
+        self.assertEqual(self.grid(), grid)
+
+
+class ScoreImportTests(SchoolTestCase):
+    """Previewing and importing a score sheet with ScoreImport."""
+
+    def setUp(self):
+        self.test1, self.test2, self.exam = self.manual
+        self.scores = {(sid, rid): score for sid, rid, score in StudentRecord.objects.filter(
+            record__in=self.manual).values_list('student_id', 'record_id', 'score')}
+
+    def sheet(self, *rows):
+        text = "\n".join(",".join(str(cell) for cell in row) for row in rows)
+        return iter_rows(BytesIO(text.encode()), "scores.csv")
+
+    def run_import(self, rows, dry_run):
+        return ScoreImport(self.teacher, TERM, self.user).run(rows, dry_run=dry_run)
+
+    def stored(self):
+        return {(sid, rid): score for sid, rid, score in StudentRecord.objects.filter(
+            record__in=self.manual).values_list('student_id', 'record_id', 'score')}
+
+    def example(self):
+        """A sheet editing one score, adding one, keeping one, with a bad cell and an unknown student."""
+        edited, added, kept, bad = self.students[:4]
+        StudentRecord.objects.filter(student=added, record=self.test1).delete()
+        self.scores.pop((added.id, self.test1.id))
+        new_score = (self.scores[(edited.id, self.test1.id)] + 1) % (self.test1.total_score + 1)
+        rows = self.sheet(
+            ["S/N", "Name", "Adm. No", "Test 1 (/10)", "Assignment 1", "Homework 3"],
+            [1, edited.name, "", new_score, 99, 1],
+            [2, "", added.admission_number, 4, "", ""],
+            [3, kept.name.upper(), "", self.scores[(kept.id, self.test1.id)], "", ""],
+            [4, bad.name, "", "ten", "", ""],
+            [5, "Nobody", "", 1, "", ""],
+        )
+        return rows, edited, added, new_score
+
+    def test_preview_reports_the_changes_and_writes_nothing(self):
+        rows, edited, added, new_score = self.example()
+        report = self.run_import(rows, dry_run=True)
+
+        self.assertTrue(report['dry_run'])
+        self.assertEqual([(c['student'], c['old'], c['new']) for c in report['updated']],
+                         [(edited, self.scores[(edited.id, self.test1.id)], new_score)])
+        self.assertEqual([(c['student'], c['old'], c['new']) for c in report['created']], [(added, None, 4)])
+        self.assertEqual(report['unchanged'], 1)
+        self.assertEqual([(e['row'], e['value']) for e in report['errors']], [(5, "ten")])
+        self.assertEqual([(u['row'], u['name']) for u in report['unmatched_students']], [(6, "Nobody")])
+        self.assertEqual(report['computed_columns'], ["Assignment 1"])
+        self.assertEqual(report['unmatched_columns'], ["Homework 3"])
+        self.assertEqual(self.stored(), self.scores)
+
+    def test_import_writes_only_the_valid_changes(self):
+        rows, edited, added, new_score = self.example()
+        report = self.run_import(rows, dry_run=False)
+
+        self.assertFalse(report['dry_run'])
+        self.assertEqual(self.stored(), {**self.scores, (edited.id, self.test1.id): new_score,
+                                         (added.id, self.test1.id): 4})
+
+    def test_a_student_listed_twice_is_reported(self):
+        student = self.students[0]
+        report = self.run_import(self.sheet(["Name", "Exam 1"], [student.name, 1], [student.name, 2]), dry_run=True)
+        self.assertEqual([(e['row'], e['message']) for e in report['errors']],
+                         [(3, f"{student.name} already appears on row 2")])
+
+    def test_xlsx_cells_are_read_as_scores(self):
+        workbook = Workbook()
+        workbook.active.append(["Name", "Exam 1"])
+        workbook.active.append([self.students[0].name, 8.0])
+        upload = BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+        self.set_scores({(self.students[0], self.exam): 0})
+        report = self.run_import(iter_rows(upload, "scores.xlsx"), dry_run=True)
+        self.assertEqual([(c['old'], c['new']) for c in report['updated']], [(0, 8)])
+
+    def test_unusable_sheets_are_rejected(self):
+        cases = [
+            (self.sheet(), "The file is empty"),
+            (self.sheet(["Score", "Test 1"]), "'Name' or 'Admission Number' column"),
+            (self.sheet(["Name", "Homework 1"]), "No column matches a record"),
+            (iter_rows(BytesIO(b"not a workbook"), "scores.xlsx"), "is damaged"),
+            (iter_rows(BytesIO(b"Name,Test 1\n\xff\xfe,1\n"), "scores.csv"), "UTF-8 text"),
+            (iter_rows(BytesIO(b""), "scores.pdf"), "Upload an .xlsx or .csv file"),
+        ]
+        for rows, message in cases:
+            with self.subTest(message):
+                with self.assertRaisesMessage(ValidationError, message):
+                    self.run_import(rows, dry_run=True)
+
+
+class TokenCacheTests(TestCase):
+    """The verified-token cache: bounded LRU eviction, expiry and invalidation."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create(username="alice", password="!")
+        cls.bob = User.objects.create(username="bob", password="!")
+
+    def setUp(self):
+        TokenCache._local.clear()
+        TokenCache._by_user.clear()
+        cache.clear()
+        self.later = time.time() + 3600
+
+    def cached(self, *tokens):
+        return [token for token in tokens if TokenCache.get(token) is not None]
+
+    def test_get_returns_a_fresh_copy_of_the_user(self):
+        TokenCache.set("a", self.alice, self.later)
+        first, second = TokenCache.get("a"), TokenCache.get("a")
+        self.assertEqual((first.pk, first.username), (self.alice.pk, "alice"))
+        self.assertIsNot(first, second)
+        self.assertIsNone(TokenCache.get("unknown"))
+
+    @override_settings(AUTH_TOKEN_CACHE_MAX_ENTRIES=2)
+    def test_the_least_recently_used_entry_is_evicted(self):
+        TokenCache.set("a", self.alice, self.later)
+        TokenCache.set("b", self.bob, self.later)
+        TokenCache.get("a")
+        TokenCache.set("c", self.alice, self.later)
+        self.assertEqual(self.cached("a", "b", "c"), ["a", "c"])
+        self.assertEqual(len(TokenCache._local), 2)
+        self.assertNotIn(self.bob.id, TokenCache._by_user)
+
+    def test_entries_expire_with_their_token_or_the_ttl(self):
+        now = time.time()
+        TokenCache.set("short", self.alice, now + 5)
+        TokenCache.set("long", self.bob, self.later)
+        with mock.patch('record.decorator.time.time', return_value=now + 10):
+            self.assertEqual(self.cached("short", "long"), ["long"])
+        with mock.patch('record.decorator.time.time', return_value=now + TokenCache.ttl() + 1):
+            self.assertEqual(self.cached("long"), [])
+        self.assertEqual(TokenCache._local, {})
+        self.assertEqual(TokenCache._by_user, {})
+
+    def test_expired_entries_are_swept_on_set(self):
+        TokenCache.set("old", self.alice, time.time() + 1)
+        with mock.patch('record.decorator.time.time', return_value=time.time() + 5):
+            TokenCache.set("new", self.bob, self.later)
+        self.assertEqual(list(TokenCache._by_user), [self.bob.id])
+        self.assertEqual(len(TokenCache._local), 1)
+
+    @override_settings(AUTH_TOKEN_CACHE_TTL=0)
+    def test_a_zero_ttl_turns_the_cache_off(self):
+        TokenCache.set("a", self.alice, self.later)
+        self.assertEqual(self.cached("a"), [])
+
+    def test_invalidation(self):
+        for token, user in (("a1", self.alice), ("a2", self.alice), ("b1", self.bob)):
+            TokenCache.set(token, user, self.later)
+        TokenCache.invalidate_token("a1")
+        self.assertEqual(self.cached("a1", "a2", "b1"), ["a2", "b1"])
+        # Saving a user drops all their tokens (signals.user_changed).
+        self.alice.save()
+        self.assertEqual(self.cached("a2", "b1"), ["b1"])
+        self.bob.delete()
+        self.assertEqual(self.cached("b1"), [])
+
+    @override_settings(AUTH_TOKEN_CACHE_SHARED=True)
+    def test_shared_entries_live_in_the_django_cache(self):
+        TokenCache.set("a", self.alice, self.later)
+        TokenCache.set("b", self.bob, self.later)
+        self.assertEqual(TokenCache._local, {})
+        self.assertEqual(self.cached("a", "b"), ["a", "b"])
+        TokenCache.invalidate_user(self.alice.id)
+        self.assertEqual(self.cached("a", "b"), ["b"])
+
+
+@override_settings(HISTORY_BUFFER_SIZE=3, HISTORY_FLUSH_INTERVAL=60)
+class HistoryBufferTests(TestCase):
+    """
+    HistoryBuffer coalesces hits and leaves the write to a timer thread.
+    threading.Timer is replaced so nothing runs behind the test's back;
+    the tests flush by hand where the timer would.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="reader", password="!")
+
+    def setUp(self):
+        patcher = mock.patch('record.service.threading.Timer')
+        self.timer = patcher.start()
+        self.addCleanup(patcher.stop)
+        HistoryBuffer.flush()
+        self.addCleanup(HistoryBuffer.flush)
+
+    def delays(self):
+        return [call.args[0] for call in self.timer.call_args_list]
+
+    def test_repeated_hits_are_coalesced_into_one_row(self):
+        HistoryBuffer.add(self.user, "Class JSS1", "/class/12/")
+        HistoryBuffer.add(self.user, "Class JSS1", "/class/12/")
+        self.assertEqual(HistoryBuffer.flush(), 1)
+        HistoryBuffer.add(self.user, "Class JSS1", "/class/12/")
+        HistoryBuffer.flush()
+
+        row = History.objects.get(user=self.user)
+        self.assertEqual((row.title, row.url, row.target_model, row.object_id), ("Class JSS1", "/class/12/", "class", 12))
+
+    def test_the_flush_waits_for_the_timer(self):
+        HistoryBuffer.add(self.user, "Home", "/")
+        self.assertEqual(self.delays(), [60])
+        self.timer.return_value.start.assert_called_once_with()
+        self.assertFalse(History.objects.exists())
+
+    def test_a_full_buffer_brings_the_flush_forward_but_off_the_request(self):
+        for n in range(3):
+            HistoryBuffer.add(self.user, f"Page {n}", f"/page/{n}/")
+        self.assertEqual(self.delays(), [60, 0])
+        self.timer.return_value.cancel.assert_called_once_with()
+        self.assertFalse(History.objects.exists())
+        self.assertEqual(HistoryBuffer.flush(), 3)
+        self.assertEqual(History.objects.filter(user=self.user).count(), 3)
+
+    @override_settings(HISTORY_BUFFER_SIZE=0)
+    def test_a_zero_size_buffer_writes_straight_away(self):
+        HistoryBuffer.add(self.user, "Home", "/")
+        self.assertEqual(self.delays(), [])
+        self.assertTrue(History.objects.filter(user=self.user, title="Home").exists())
+
+
+@override_settings(HISTORY_KEEP_DAYS=30, HISTORY_KEEP_PER_USER=3)
+class HistoryRetentionTests(TestCase):
+    """HistoryService.prune's age and per-user windows, and compact()."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create(username="alice", password="!")
+        cls.bob = User.objects.create(username="bob", password="!")
+
+    def add(self, user, days_ago, url="/"):
+        return History.objects.create(user=user, title=url, url=url, time=timezone.now() - timedelta(days=days_ago))
+
+    def kept(self, user):
+        return sorted(History.objects.filter(user=user).values_list('url', flat=True))
+
+    def test_rows_past_either_window_are_deleted(self):
+        for day in (1, 2, 3, 4, 40):
+            self.add(self.alice, day, f"/page/{day}/")
+        self.add(self.bob, 50, "/old/")
+        self.add(self.bob, 1, "/new/")
+
+        self.assertEqual(HistoryService.prune(), 3)
+        self.assertEqual(self.kept(self.alice), ["/page/1/", "/page/2/", "/page/3/"])
+        self.assertEqual(self.kept(self.bob), ["/new/"])
+
+    def test_rows_sharing_a_time_are_cut_by_id(self):
+        when = timezone.now()
+        rows = [History.objects.create(user=self.alice, title=str(n), url=f"/{n}/", time=when) for n in range(5)]
+        HistoryService.prune()
+        self.assertEqual(sorted(History.objects.values_list('id', flat=True)), [row.id for row in rows[2:]])
+
+    def test_only_the_given_users_are_pruned(self):
+        for day in range(1, 6):
+            self.add(self.alice, day, f"/a/{day}/")
+            self.add(self.bob, day, f"/b/{day}/")
+        HistoryService.prune([self.alice.id])
+        self.assertEqual(len(self.kept(self.alice)), 3)
+        self.assertEqual(len(self.kept(self.bob)), 5)
+
+    @override_settings(HISTORY_KEEP_DAYS=None, HISTORY_KEEP_PER_USER=None)
+    def test_either_window_can_be_turned_off(self):
+        for day in (1, 2, 3, 4, 400):
+            self.add(self.alice, day, f"/page/{day}/")
+        self.assertEqual(HistoryService.prune(), 0)
+
+    def test_compact_keeps_the_newest_duplicate(self):
+        for day in (3, 2, 1):
+            newest = self.add(self.alice, day, "/class/7/")
+        self.add(self.bob, 1, "/class/7/")
+        self.assertEqual(HistoryService.compact(), 2)
+        self.assertEqual(list(History.objects.filter(user=self.alice).values_list('id', flat=True)), [newest.id])
+
+    def test_recent_for_lists_one_objects_activity_newest_first(self):
+        for url, days in (("/class/7/", 3), ("/class/7/students/", 1), ("/class/8/", 2), ("/record/7/", 1)):
+            target_model, object_id = History.target_from_url(url)
+            History.objects.create(user=self.alice, title=url, url=url, target_model=target_model,
+                                   object_id=object_id, time=timezone.now() - timedelta(days=days))
+        recent = HistoryService.recent_for(self.alice, "class", 7)
+        self.assertEqual([row.url for row in recent], ["/class/7/students/", "/class/7/"])
+
+
+class ClassAnalyticsTests(SchoolTestCase):
+    """describe() and ClassAnalytics against the same figures worked out directly."""
+
+    def test_describe(self):
+        stats = describe([2, 4, 6, 8, math.nan], 10)
+        self.assertEqual((stats['entered'], stats['missing']), (4, 1))
+        self.assertEqual((stats['mean'], stats['median'], stats['min'], stats['max']), (5, 5, 2, 8))
+        self.assertEqual(stats['std'], round(statistics.pstdev([2, 4, 6, 8]), 2))
+        self.assertEqual((stats['passed'], stats['failed'], stats['pass_rate']), (2, 2, 50.0))
+        self.assertEqual(stats['below_average'], 2)
+        self.assertEqual([b['count'] for b in stats['histogram']], [1, 1, 1, 1])
+        self.assertEqual(stats['mean_percent'], 50.0)
+
+    def test_full_marks_fall_in_the_top_bin(self):
+        self.assertEqual([b['count'] for b in describe([10], 10)['histogram']], [0, 0, 0, 1])
+
+    def test_a_column_with_nothing_entered(self):
+        stats = describe([math.nan, math.nan], 10)
+        self.assertEqual((stats['entered'], stats['missing']), (0, 2))
+        self.assertEqual({stats[key] for key in ('mean', 'median', 'std', 'min', 'max', 'pass_rate')}, {None})
+
+    def test_record_stats_match_the_scores(self):
+        analytics = ClassAnalytics.load(self.class_obj, TERM)
+        for stats in analytics.record_stats():
+            with self.subTest(stats['record']['id']):
+                scores = list(StudentRecord.objects.filter(record_id=stats['record']['id'])
+                              .values_list('score', flat=True))
+                self.assertEqual(stats['entered'], len(scores))
+                self.assertEqual(stats['mean'], round(statistics.fmean(scores), 2))
+                self.assertEqual(stats['median'], round(float(statistics.median(scores)), 2))
+
+    def test_subject_totals_match_subject_term_totals(self):
+        # The cached score matrix is dropped once the delete commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentRecord.objects.filter(student=self.students[0], record__subject=self.teacher,
+                                         record__logic__isnull=True).delete()
+        analytics = ClassAnalytics.load(self.class_obj, TERM)
+        obtained, obtainable = analytics.subject_totals()
+        for k, (subject_id, _) in enumerate(analytics.subjects):
+            rows = {row.student_id: row for row in SubjectTermTotal.objects.filter(subject_id=subject_id, term=TERM)}
+            for i, student_id in enumerate(analytics.student_ids):
+                with self.subTest(subject=subject_id, student=student_id):
+                    if student_id in rows:
+                        self.assertEqual(obtained[i, k], rows[student_id].obtained)
+                        self.assertEqual(obtainable[k], rows[student_id].obtainable)
+                    else:
+                        self.assertTrue(math.isnan(obtained[i, k]))
+
+    def test_overall_percentages_match_the_positions(self):
+        positions = ReportCardService.calculate_positions(self.class_obj, TERM)
+        analytics = ClassAnalytics.load(self.class_obj, TERM)
+        for student_id, percent in zip(analytics.student_ids, analytics.overall_percentages()):
+            position = positions[student_id]
+            self.assertAlmostEqual(percent, position['total_score'] / position['total_available'] * 100)
+
+
+class RecordScoreStatsTests(SchoolTestCase):
+    """The running score aggregates on Record match a recount from the scores."""
+
+    def test_every_edit_matches_a_rebuild(self):
+        for label, edit in self.score_edits():
+            with self.subTest(label):
+                edit()
+                self.assertEqual(Record.rebuild_score_stats(dry_run=True), 0)
+
+    def test_aggregates_after_single_row_edits(self):
+        record = self.manual[0]
+        rows = list(StudentRecord.objects.filter(record=record).order_by('id'))
+        # Raise the maximum, then delete a lowest score.
+        rows[0].score = record.total_score
+        rows[0].save()
+        low = min(rows[1:], key=lambda row: row.score)
+        low.delete()
+
+        record.refresh_from_db()
+        scores = list(StudentRecord.objects.filter(record=record).values_list('score', flat=True))
+        self.assertEqual((record.score_count, record.score_sum), (len(scores), sum(scores)))
+        self.assertEqual((record.score_min, record.score_max), (min(scores), record.total_score))
+        self.assertAlmostEqual(record.score_mean, statistics.fmean(scores))
+        self.assertAlmostEqual(record.score_std, statistics.pstdev(scores))
+        self.assertEqual(record.pass_count, sum(record.passes(score) for score in scores))
+
+
+class ScoreRollupTests(SchoolTestCase):
+    """The ScoreRollup rows the write paths maintain match a rebuild from the records."""
+
+    def snapshot(self):
+        # Percentages are summed in SQL; allow for the order they were added in.
+        return sorted(
+            tuple(round(value, 6) if isinstance(value, float) else value for value in row)
+            for row in ScoreRollup.objects.values_list(
+                'subject_id', 'class_name_id', 'term', 'user_id', 'session', 'record_count', 'score_count',
+                'score_sum', 'pass_count', 'percent_sum', 'best_percent', 'worst_percent')
+        )
+
+    def test_every_edit_matches_a_rebuild(self):
+        for label, edit in self.score_edits():
+            with self.subTest(label):
+                edit()
+                maintained = self.snapshot()
+                ScoreRollup.rebuild()
+                self.assertEqual(maintained, self.snapshot())
+
+    def test_a_subject_without_records_loses_its_rollup(self):
+        Record.objects.filter(subject=self.teacher).delete()
+        self.assertFalse(ScoreRollup.objects.filter(subject=self.teacher).exists())
+        self.assertTrue(ScoreRollup.objects.filter(class_name=self.class_obj).exists())
+
+
+class SearchTests(TestCase):
+    """Search results come from the FTS index, only ever the searching teacher's, and follow edits."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = generate_school(classes=1, students_per_class=3, subjects_per_class=2, terms=[TERM], seed=1)
+        cls.bob = generate_school(classes=1, students_per_class=3, subjects_per_class=3, terms=[TERM], seed=2)
+        cls.alice_class = Class.objects.get(user=cls.alice)
+
+    def found(self, query, user, kind='students'):
+        return {obj.pk for obj in SearchService.search_all(query, user)[kind]}
+
+    def test_results_are_scoped_to_the_user(self):
+        self.assertEqual(self.found("Student", self.alice),
+                         set(Student.objects.filter(user=self.alice).values_list('id', flat=True)))
+        self.assertEqual(self.found("Student", self.bob),
+                         set(Student.objects.filter(user=self.bob).values_list('id', flat=True)))
+        # Subjects are shared, but only the ones a teacher teaches are theirs to find.
+        self.assertEqual(self.found("Basic Science", self.alice, 'subjects'), set())
+        self.assertEqual(len(self.found("Basic Science", self.bob, 'subjects')), 1)
+
+    def test_prefixes_match(self):
+        student = Student.objects.create(user=self.alice, class_name=self.alice_class, name="Zebedee Okafor")
+        self.assertEqual(self.found("zeb oka", self.alice), {student.pk})
+        self.assertEqual(self.found("Zebedee", self.bob), set())
+
+    def test_the_index_follows_edits_and_deletes(self):
+        student = Student.objects.create(user=self.alice, class_name=self.alice_class, name="Zebedee Okafor")
+        student.name = "Adaeze Okafor"
+        student.save()
+        self.assertEqual(self.found("Zebedee", self.alice), set())
+        self.assertEqual(self.found("Adaeze", self.alice), {student.pk})
+        student.delete()
+        self.assertEqual(self.found("Adaeze", self.alice), set())
+
+    def test_a_class_delete_drops_everything_it_cascades_to(self):
+        self.alice_class.delete()
+        self.assertEqual(self.found("Student", self.alice), set())
+        self.assertEqual(self.found("Test", self.alice, 'records'), set())
+        self.assertEqual(len(self.found("Student", self.bob)), 3)
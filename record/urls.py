@@ -1,7 +1,7 @@
 # Complete URL patterns
 from django.urls import path
 from . import views
-from .excel import export_report_excel
+from .excel import export_report_excel, export_class_broadsheet
 
 urlpatterns = [
   #Landing views
@@ -48,17 +48,20 @@ urlpatterns = [
 
     # NEW: bulk score entry across MULTIPLE records for one subject+class+term
     path('subject-teacher/<int:st_id>/bulk-multi-scores/', views.bulk_multi_record_score_view, name='bulk-multi-score-entry'),
+    path('subject-teacher/<int:st_id>/import-scores/', views.import_scores_view, name='import-scores'),
 
     # Filter and search
     path('search/', views.search_view, name='search'),
     path('filter/records/', views.filter_record_view, name='filterRecord'),
     path('filter/students/', views.filter_student_view, name='filter-students'),
     path('class/<int:id>/report/', views.class_report_view, name='class-report'),
+    path('class/<int:id>/analytics/', views.class_analytics_view, name='class-analytics'),
 
     # Reports and analytics
     path('reports/', views.report_view, name='generateReport'),
     path('analytics/', views.analytics_dashboard_view, name='analytics'),
     path("export_excel", export_report_excel, name="export_report_excel"),
+    path('class/<int:class_id>/broadsheet/', export_class_broadsheet, name='class-broadsheet'),
     path('report-card/', views.report_card_view, name='report-card-class'),
     path('report-card/<int:student_id>/', views.report_card_view, name='report-card'),
     path('report-card/', views.report_card_view, name='report-card'),          # no args → class selection
@@ -66,10 +69,12 @@ urlpatterns = [
 
     # NEW: Report Card
     path('report-card/<int:student_id>/', views.report_card_view, name='report-card'),
+    path('report-card/class/<int:class_id>/print/', views.class_report_cards_view, name='report-card-class-print'),
 
     # API endpoints
     path('api/student/<int:student_id>/records/', views.api_student_records, name='api-student-records'),
     path('api/class/<int:class_id>/summary/', views.api_class_summary, name='api-class-summary'),
+    path('api/report/', views.api_report, name='api-report'),
 
     # Utility views
     path('close/', views.close_request_view, name='closeRequest'),
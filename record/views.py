@@ -1,5 +1,7 @@
 from django.shortcuts import render, reverse, redirect, get_object_or_404
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
 from django.contrib.auth.hashers import check_password
 from django.core.exceptions import ValidationError
 from django import forms
@@ -9,8 +11,11 @@ from django.contrib import messages
 from .models import *
 from .form import *
 from .service import *
-from .decorator import login_require
+from .decorator import login_require, query_budget, TokenCache
 from .report import Report 
+from .report_engine import ReportEngine
+from .analytics import PASS_MARK, ClassAnalytics, describe
+from .importer import ScoreImport, iter_rows
 
 # Utility Mixins
 class UserFilterMixin:
@@ -36,6 +41,7 @@ def landing_view(request):
   return render(request,"landing.html")
 
 # Main Views
+@query_budget(5)
 @login_require
 def home_view(request, part=None):
     """Dashboard view with overview data"""
@@ -112,7 +118,7 @@ class ClassListView(ListView):
     context_object_name = 'school_class'
 
     def get_queryset(self):
-        return Class.objects.for_user(self.request.user)
+        return Class.objects.for_user(self.request.user).annotate(student_count=Count('student'))
 
     def get(self, request, *args, **kwargs):
         HistoryService.log_user_activity(
@@ -123,25 +129,29 @@ class ClassListView(ListView):
         return super().get(request, *args, **kwargs)
 
 # Detail Views
+@query_budget(4)
 @login_require
 def record_detail_view(request, id):
-    record = get_object_or_404(Record, id=id)
-    students = StudentRecord.objects.filter(record=record)
+    record = get_object_or_404(Record.objects.select_related('subject__subject', 'class_name'), id=id)
+    students = StudentRecord.objects.filter(record=record).select_related('student')
     students_without_record = StudentRecordService.get_students_without_record(record)
 
     # ---- Statistics ----
-    score_list = [sr.score for sr in students]
-    total_students = students.count() + students_without_record.count()
-    entered = students.count()
-    remaining = students_without_record.count()
-    avg_score = sum(score_list) / len(score_list) if score_list else None
-    max_score = max(score_list) if score_list else None
-    min_score = min(score_list) if score_list else None
+    # Counts and extremes are the record's running aggregates; the median,
+    # histogram and below-average count come from the rows the table loads.
+    stats = describe([sr.score for sr in students], record.total_score)
+    entered = record.score_count
+    total_students = Student.objects.filter(class_name_id=record.class_name_id).count()
+    remaining = max(total_students - entered, 0)
+    stats.update(
+        passed=record.pass_count,
+        failed=entered - record.pass_count,
+        pass_rate=round(record.pass_rate, 1) if entered else None,
+        fail_rate=round(100 - record.pass_rate, 1) if entered else None,
+    )
 
     # For top performers – sort by score descending, take first 5
-    top_performers = students.order_by('-score')[:5] if students else []
-
-    # For "needs attention" – we'll compute in template with filters or simple loops
+    top_performers = sorted(students, key=lambda sr: -sr.score)[:5]
 
     HistoryService.log_user_activity(
         request.user,
@@ -158,11 +168,11 @@ def record_detail_view(request, id):
         'total_students': total_students,
         'entered': entered,
         'remaining': remaining,
-        'avg_score': avg_score,
-        'max_score': max_score,
-        'min_score': min_score,
+        'avg_score': record.score_mean,
+        'max_score': record.score_max,
+        'min_score': record.score_min,
+        'stats': stats,
         'top_performers': top_performers,
-        'score_list': score_list,   # for distribution if needed
     }
     return render(request, 'record-detail.html', context)
     
@@ -184,14 +194,13 @@ def student_detail_view(request, id):
     }
     return render(request, 'student-detail.html', context)
 
+@query_budget(5)
 @login_require
 def class_detail_view(request, id):
     class_obj = get_object_or_404(Class, id=id)
     students = Student.objects.filter(class_name=class_obj)
-    # Filter history for this class by URL containing the class ID
-    history = History.objects.for_user(request.user).filter(
-        url__icontains=f'/class/{id}/'
-    ).order_by('-time')[:10]
+    # Recent activity on this class's pages (indexed on target_model/object_id)
+    history = HistoryService.recent_for(request.user, 'class', id)
 
     HistoryService.log_user_activity(
         request.user, 
@@ -221,13 +230,13 @@ def class_report_view(request, id):
     sort_order = request.GET.get('sort', 'asc')
 
     if subject_id:
-        # Generate report for a specific subject – NO user argument
         report_result = ReportService.generate_report(
             subject_id=subject_id,
             class_name=class_obj.name,
             batch=class_obj.batch,
             term=term,
             sort_order=sort_order,
+            user=request.user,
         )
 
         context = {
@@ -252,15 +261,29 @@ def class_report_view(request, id):
             record__isnull=False
         ).distinct().select_related('subject')
 
+        # Pre-summed totals and record counts, one grouped query each
+        score_totals = {
+            row['subject_id']: row
+            for row in SubjectTermTotal.objects.filter(
+                class_name=class_obj, subject__in=subject_teachers
+            ).values('subject_id').annotate(
+                score_sum=Sum('score_sum'), score_count=Sum('score_count')
+            ).order_by()
+        }
+        record_counts = dict(
+            Record.objects.filter(class_name=class_obj, subject__in=subject_teachers)
+            .values('subject_id').annotate(count=Count('id'))
+            .order_by().values_list('subject_id', 'count')
+        )
+
         subjects_data = []
         for st in subject_teachers:
-            records = Record.objects.filter(subject=st, class_name=class_obj)
-            student_records = StudentRecord.objects.filter(record__in=records)
-            avg_score = student_records.aggregate(Avg('score'))['score__avg']
+            totals = score_totals.get(st.id)
+            avg_score = totals['score_sum'] / totals['score_count'] if totals and totals['score_count'] else None
             subjects_data.append({
                 'subject_teacher': st,
                 'subject': st.subject,
-                'record_count': records.count(),
+                'record_count': record_counts.get(st.id, 0),
                 'avg_score': avg_score or 0,
             })
 
@@ -339,12 +362,14 @@ def form_view(request, form_type, update_id=None):
     return render(request, 'record-form.html', context)
 
 # Search and Filter Views
+@query_budget(6)
 @login_require
 def search_view(request):
     """Search across all models"""
     query = request.GET.get('search', '')
     result = SearchService.search_all(query, request.user)
-    context = dict(record=result['records'], student=result["students"], school_class=result["classes"])
+    context = dict(record=result['records'], student=result["students"], school_class=result["classes"],
+                   subjects=result['subjects'], topics=result['topics'], query=query)
     return render(request, 'search.html', context)
 
 def filter_record_view(request):
@@ -450,6 +475,12 @@ def add_to_record_view(request, id):
     }
     return render(request, 'record-form.html', context)
 
+# Saving: the user (when their token isn't cached), the record and
+# students, the upsert with its BEGIN/COMMIT, then
+# ScoreRefresh for the column's group: the computed record reading it
+# (2 to walk the dependencies, 1 to load it, 3 to evaluate), the record
+# aggregates (1), SubjectTermTotal (4) and ScoreRollup (2).
+@query_budget(19)
 @login_require
 def bulk_score_entry_view(request, id):
     """
@@ -457,45 +488,45 @@ def bulk_score_entry_view(request, id):
 
     GET  -> render a table with one row per student, score input pre-filled
             with their existing StudentRecord.score if one exists.
-    POST -> for each non-empty score_<student_id> field, create a new
-            StudentRecord or update the existing one. Blank fields are
-            skipped (lets a teacher save a partial pass without wiping
-            scores for students they haven't gotten to yet).
+    POST -> validate every non-empty score_<student_id> field (whole
+            number between 0 and the record's total), then create/update
+            the valid ones in a single upsert. Blank fields are skipped
+            (lets a teacher save a partial pass without wiping scores for
+            students they haven't gotten to yet); invalid ones are listed
+            in `errors` and left untouched.
     """
-    record = get_object_or_404(Record, id=id)
-    students = Student.objects.filter(class_name=record.class_name).order_by('name')
+    record = get_object_or_404(Record.objects.select_related('subject__subject', 'class_name'), id=id)
+    # Each student's current score on this record comes back with the student.
+    students = Student.objects.filter(class_name_id=record.class_name_id).annotate(
+        current_score=Subquery(
+            StudentRecord.objects.filter(record=record, student=OuterRef('pk')).values('score')[:1]
+        )
+    ).order_by('name')
 
     if request.method == "POST":
-        existing = {sr.student_id: sr for sr in StudentRecord.objects.filter(record=record)}
-        created, updated, errors = 0, 0, []
+        scores, errors = {}, []
 
-        for student in students:
-            raw_score = request.POST.get(f"score_{student.id}", "").strip()
-            if raw_score == "":
-                continue
+        if record.logic:
+            # Computed scores always come from the record's formula, so
+            # recalculate instead of storing what was typed in.
+            result = record.evaluate_logic_for_class(create_missing=True)
+            created, updated = result['created'], result['updated']
+        else:
+            for student in students:
+                raw_score = request.POST.get(f"score_{student.id}", "").strip()
+                if raw_score == "":
+                    continue
 
-            try:
-                score = int(raw_score)
-            except ValueError:
-                errors.append(f"{student.name}: '{raw_score}' is not a whole number")
-                continue
+                score, error = StudentRecordService.parse_score(record, raw_score)
+                if error:
+                    errors.append(f"{student.name}: {error}")
+                    continue
+                scores[(student.id, record.id)] = score
 
-            student_record = existing.get(student.id)
-            try:
-                if student_record:
-                    student_record.score = score
-                    student_record.save()
-                    updated += 1
-                else:
-                    StudentRecord.objects.create(
-                        user=request.user,
-                        student=student,
-                        record=record,
-                        score=score
-                    )
-                    created += 1
-            except ValidationError as e:
-                errors.append(f"{student.name}: {'; '.join(e.messages) if hasattr(e, 'messages') else str(e)}")
+            existing = {student.id for student in students if student.current_score is not None}
+            StudentRecordService.upsert_scores(request.user, [record], scores)
+            updated = sum(1 for student_id, _ in scores if student_id in existing)
+            created = len(scores) - updated
 
         HistoryService.log_user_activity(
             request.user,
@@ -512,12 +543,8 @@ def bulk_score_entry_view(request, id):
         return render(request, 'bulk-score-result.html', context)
 
     # GET: build rows, pre-filling any score the student already has
-    existing_scores = {
-        sr.student_id: sr.score
-        for sr in StudentRecord.objects.filter(record=record)
-    }
     student_rows = [
-        {'student': s, 'score': existing_scores.get(s.id, '')}
+        {'student': s, 'score': '' if s.current_score is None else s.current_score}
         for s in students
     ]
 
@@ -611,6 +638,7 @@ def subject_list_view(request):
     subjects = Subject.objects.filter(subjectTeacher__user=request.user).order_by('name').distinct()
     return render(request, 'subject.html', {'subjects': subjects})
 
+@query_budget(2)
 @login_require
 def history_view(request):
     """User activity history – latest 10 entries"""
@@ -628,6 +656,7 @@ def topic_list_view(request):
     topics = Topic.objects.for_user(request.user).select_related('subject', 'class_name')
     return render(request, 'topic.html', {'topics': topics})
 
+@query_budget(5)
 @login_require
 def subject_detail_view(request, id):
     """Subject detail — classes, students, and topics scoped via SubjectTeacher."""
@@ -841,39 +870,41 @@ def get_class_students_view(request, id):
     return render(request, 'student-list.html', {'student': students})
 
 # Advanced filtering and analytics views
+@query_budget(7)
 @login_require
 def analytics_dashboard_view(request):
-    """Analytics dashboard with charts and statistics"""
-    user_records = Record.objects.for_user(request.user)
-    user_students = Student.objects.for_user(request.user)
-
-    # Calculate basic statistics
-    stats = {
-        'total_records': user_records.count(),
-        'total_students': user_students.count(),
-        'total_classes': Class.objects.for_user(request.user).count(),
-        'total_subjects': Subject.objects.for_user(request.user).count(),
-    }
+    """
+    Analytics dashboard. Every score figure comes from ScoreRollup (one
+    row per subject/class/term), so the cost doesn't grow with the number
+    of scores a teacher has entered over the years.
+    """
+    rollups = ScoreRollup.objects.for_user(request.user).filter(record_count__gt=0)
 
-    # Get recent activity
-    recent_records = user_records.order_by('-date_created')[:5]
-
-    # Performance statistics
-    student_records = StudentRecord.objects.for_user(request.user)
-    if student_records.exists():
-        performance_stats = student_records.aggregate(
-            avg_score=Avg('score'),
-            max_score=Max('score'),
-            min_score=Min('score'),
-            total_records=Count('id')
-        )
-        stats.update(performance_stats)
+    stats = ScoreRollup.summarise(
+        rollups,
+        total_classes=Count('class_name', distinct=True),
+        total_subjects=Count('subject__subject', distinct=True),
+    )
+    stats['total_students'] = Student.objects.for_user(request.user).count()
+
+    by_term = ScoreRollup.summarise(rollups, 'session', 'term')
+    by_class = ScoreRollup.summarise(rollups, 'class_name__name', 'class_name__batch', 'class_name__session')
+    by_subject = ScoreRollup.summarise(rollups, 'subject__subject__name')
+
+    recent_records = Record.objects.for_user(request.user).select_related(
+        'subject__subject', 'class_name'
+    ).order_by('-id')[:5]
+
+    HistoryService.log_user_activity(request.user, "Analytics", reverse('analytics'))
 
     context = {
         'stats': stats,
+        'by_term': by_term,
+        'by_class': by_class,
+        'by_subject': by_subject,
         'recent_records': recent_records,
+        'pass_mark': PASS_MARK,
     }
-
     return render(request, 'analytics.html', context)
 
 # API-style views for AJAX requests
@@ -934,6 +965,28 @@ def api_class_summary(request, class_id):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
+
+@query_budget(5)
+@login_require
+def api_report(request):
+    """API endpoint: a subject report as JSON, from the same engine as report_view"""
+    from django.http import JsonResponse
+
+    try:
+        data = ReportEngine(
+            request.GET.get('subject'),
+            request.GET.get('class'),
+            batch=request.GET.get('batch', 'All'),
+            term=request.GET.get('term', 'All'),
+            sort_order=request.GET.get('sort', 'asc'),
+            user=request.user,
+        ).render('json')
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({'success': True, 'data': data})
+
+@query_budget(5)
 @login_require
 def report_view(request):
     """Report generation — only shows subject+class combos the teacher has records for."""
@@ -1009,6 +1062,9 @@ def report_view(request):
 
 def logout_view(request):
     """User logout"""
+    auth_token = request.COOKIES.get('auth_token')
+    if auth_token:
+        TokenCache.invalidate_token(auth_token)
     response = redirect('login')
     response.delete_cookie('auth_token')
     messages.success(request, "You have been logged out successfully.")
@@ -1364,6 +1420,7 @@ def quick_setup_view(request, class_id):
 # NEW: Report Card view
 # ═══════════════════════════════════════════════════════════════
 
+@query_budget(10)
 @login_require
 def report_card_view(request, student_id=None):
     # ----- No student or class specified – show class selection -----
@@ -1387,7 +1444,7 @@ def report_card_view(request, student_id=None):
     # ----- Existing student report logic (same as before) -----
 
     # Otherwise, get the student by ID
-    student = get_object_or_404(Student, id=student_id, user=request.user)
+    student = get_object_or_404(Student.objects.select_related('class_name'), id=student_id, user=request.user)
     class_obj = student.class_name
 
     term = request.GET.get('term', request.user.active_term or "First Term")
@@ -1402,8 +1459,8 @@ def report_card_view(request, student_id=None):
     context['class_obj'] = class_obj
 
     # ---- Navigation: all students in the same class ----
-    all_students = Student.objects.filter(class_name=class_obj, user=request.user).order_by('name')
-    student_ids = list(all_students.values_list('id', flat=True))
+    all_students = list(Student.objects.filter(class_name=class_obj, user=request.user).order_by('name'))
+    student_ids = [other.id for other in all_students]
     current_index = student_ids.index(student.id) if student.id in student_ids else -1
 
     prev_id = student_ids[current_index - 1] if current_index > 0 else None
@@ -1429,7 +1486,70 @@ def report_card_view(request, student_id=None):
     return render(request, 'report-card.html', context)
 
 
+@query_budget(9)
+@login_require
+def class_report_cards_view(request, class_id):
+    """
+    Every report card in a class as one printable document, one card per
+    page. Positions, scores and TermReports are loaded once for the class,
+    and the cards are streamed out as they're rendered so a class of 60+
+    doesn't have to be built in memory before the first byte goes out.
+    """
+    class_obj = get_object_or_404(Class, id=class_id, user=request.user)
+    term = request.GET.get('term') or request.user.active_term or "First Term"
+    session = request.GET.get('session') or class_obj.session
+    students = list(Student.objects.filter(class_name=class_obj, user=request.user).order_by('name'))
+
+    # Render the page chrome once and split it around the cards.
+    marker = "<!--report-cards-->"
+    page = render(request, 'report-card-class.html', {
+        'class_obj': class_obj,
+        'term': term,
+        'session': session,
+        'total_students': len(students),
+        'cards': mark_safe(marker),
+    }).content.decode()
+    head, tail = page.split(marker, 1)
+    card_template = get_template('report-card-body.html')
+
+    def stream():
+        yield head
+        for context in ReportCardService.iter_class_report_cards(class_obj, term, session, students):
+            context['school'] = request.user.school
+            yield '<div class="report-card-page">'
+            yield card_template.render(context, request)
+            yield '</div>'
+        yield tail
 
+    HistoryService.log_user_activity(
+        request.user,
+        f"Class Report Cards: {class_obj} ({term} {session})",
+        reverse('report-card-class-print', args=[class_id])
+    )
+    return StreamingHttpResponse(stream(), content_type='text/html; charset=utf-8')
+
+
+
+@query_budget(6)
+@login_require
+def class_analytics_view(request, id):
+    """Per-subject and per-record score statistics for a class/term (analytics.py)."""
+    class_obj = get_object_or_404(Class, id=id, user=request.user)
+    term = request.GET.get('term') or request.user.active_term or "First Term"
+    analytics = ClassAnalytics.load(class_obj, term)
+
+    context = {
+        'class_obj': class_obj,
+        'term': term,
+        'student_count': len(analytics.student_ids),
+        'pass_mark': PASS_MARK,
+        'overall': describe(analytics.overall_percentages(), 100),
+        'subject_stats': analytics.subject_stats(),
+        'record_stats': analytics.record_stats(),
+    }
+    return render(request, 'class-analytics.html', context)
+
+@query_budget(6)
 @login_require
 def class_report_view(request, id):
     """Class‑specific report:
@@ -1442,13 +1562,13 @@ def class_report_view(request, id):
     sort_order = request.GET.get('sort', 'asc')
 
     if subject_id:
-        # Generate report for a specific subject – NO user argument
         report_result = ReportService.generate_report(
             subject_id=subject_id,
             class_name=class_obj.name,
             batch=class_obj.batch,
             term=term,
             sort_order=sort_order,
+            user=request.user,
         )
 
         context = {
@@ -1473,15 +1593,29 @@ def class_report_view(request, id):
             record__isnull=False
         ).distinct().select_related('subject')
 
+        # Pre-summed totals and record counts, one grouped query each
+        score_totals = {
+            row['subject_id']: row
+            for row in SubjectTermTotal.objects.filter(
+                class_name=class_obj, subject__in=subject_teachers
+            ).values('subject_id').annotate(
+                score_sum=Sum('score_sum'), score_count=Sum('score_count')
+            ).order_by()
+        }
+        record_counts = dict(
+            Record.objects.filter(class_name=class_obj, subject__in=subject_teachers)
+            .values('subject_id').annotate(count=Count('id'))
+            .order_by().values_list('subject_id', 'count')
+        )
+
         subjects_data = []
         for st in subject_teachers:
-            records = Record.objects.filter(subject=st, class_name=class_obj)
-            student_records = StudentRecord.objects.filter(record__in=records)
-            avg_score = student_records.aggregate(Avg('score'))['score__avg']
+            totals = score_totals.get(st.id)
+            avg_score = totals['score_sum'] / totals['score_count'] if totals and totals['score_count'] else None
             subjects_data.append({
                 'subject_teacher': st,
                 'subject': st.subject,
-                'record_count': records.count(),
+                'record_count': record_counts.get(st.id, 0),
                 'avg_score': avg_score or 0,
             })
 
@@ -1551,9 +1685,15 @@ def bulk_record_create_view(request, st_id):
     }
     return render(request, 'bulk-record-form.html', context)
     
+# Saving: the user, the subject teacher, scores, students and records,
+# then the same single upsert and per-group refresh as
+# bulk_score_entry_view.
+@query_budget(21)
 @login_require
 def bulk_multi_record_score_view(request, st_id):
-    subject_teacher = get_object_or_404(SubjectTeacher, id=st_id, user=request.user)
+    subject_teacher = get_object_or_404(
+        SubjectTeacher.objects.select_related('class_name', 'subject'), id=st_id, user=request.user
+    )
     class_obj = subject_teacher.class_name
     term = request.user.active_term or "First Term"
     mode = request.GET.get('mode', 'table')  # 'table' or 'single'
@@ -1568,34 +1708,36 @@ def bulk_multi_record_score_view(request, st_id):
 
     students = Student.objects.filter(class_name=class_obj).order_by('name')
 
+    # Build existing scores map
+    existing = dict(
+        ((student_id, record_id), score)
+        for student_id, record_id, score in StudentRecord.objects.filter(record__in=records)
+        .values_list('student_id', 'record_id', 'score')
+    )
+
     if request.method == "POST":
-        # Save scores (same as before)
+        # Diff the posted grid against what's stored: only cells whose
+        # value actually changed are written, all in one upsert. Bad cells
+        # are reported back individually and never block the good ones.
+        changes, errors = {}, []
         for student in students:
             for rec in records:
-                key = f"score_{student.id}_{rec.id}"
-                raw = request.POST.get(key, '').strip()
+                raw = request.POST.get(f"score_{student.id}_{rec.id}", '').strip()
                 if raw == '':
                     continue
-                try:
-                    score = int(raw)
-                    if score < 0 or score > rec.total_score:
-                        raise ValueError(f"Score must be between 0 and {rec.total_score}")
-                    sr, created = StudentRecord.objects.get_or_create(
-                        student=student,
-                        record=rec,
-                        defaults={'score': score}
-                    )
-                    if not created:
-                        sr.score = score
-                        sr.save()
-                except ValueError:
-                    pass
-        return HttpResponse("Scores saved successfully.")
-
-    # Build existing scores map
-    existing = {}
-    for sr in StudentRecord.objects.filter(record__in=records):
-        existing[(sr.student.id, sr.record.id)] = sr.score
+                score, error = StudentRecordService.parse_score(rec, raw)
+                if error:
+                    errors.append({'student': student, 'record': rec, 'value': raw, 'message': error})
+                elif existing.get((student.id, rec.id)) != score:
+                    changes[(student.id, rec.id)] = score
+
+        StudentRecordService.upsert_scores(request.user, records, changes)
+        updated = sum(1 for key in changes if key in existing)
+        return render(request, 'bulk-multi-score-result.html', {
+            'created': len(changes) - updated,
+            'updated': updated,
+            'errors': errors,
+        })
 
     # Build grid rows (for table mode)
     grid_rows = []
@@ -1620,7 +1762,7 @@ def bulk_multi_record_score_view(request, st_id):
         'students': students,
         'existing_scores': existing,
         'mode': mode,
-        'total_students': students.count(),
+        'total_students': len(students),
     }
 
     if mode == 'single':
@@ -1631,14 +1773,14 @@ def bulk_multi_record_score_view(request, st_id):
             current_index = 0
 
         # Clamp index
-        if current_index >= students.count():
-            current_index = students.count() - 1
+        if current_index >= len(students):
+            current_index = len(students) - 1
         if current_index < 0:
             current_index = 0
 
         student = students[current_index] if students else None
         prev_index = current_index - 1 if current_index > 0 else None
-        next_index = current_index + 1 if current_index < students.count() - 1 else None
+        next_index = current_index + 1 if current_index < len(students) - 1 else None
 
         # Build records for this student
         student_records = []
@@ -1659,4 +1801,55 @@ def bulk_multi_record_score_view(request, st_id):
         return render(request, 'bulk-multi-score-single.html', context)
 
     # Default: render table mode
-    return render(request, 'bulk-multi-score-form.html', context)
\ No newline at end of file
+    return render(request, 'bulk-multi-score-form.html', context)
+
+
+# Importing: the user, the subject teacher with its class and subject, the
+# records, students and stored scores, then the same single upsert and
+# per-group refresh as bulk_score_entry_view. A preview stops before the
+# upsert.
+@query_budget(21)
+@login_require
+def import_scores_view(request, st_id):
+    """
+    Import a subject's scores for the active term from an .xlsx/.csv sheet.
+
+    GET  -> upload form.
+    POST -> "preview" runs a dry run and shows what would change;
+            "import" validates the same way and writes the changes in one
+            batched upsert.
+    """
+    subject_teacher = get_object_or_404(
+        SubjectTeacher.objects.select_related('class_name', 'subject'), id=st_id, user=request.user
+    )
+    term = request.POST.get('term') or request.user.active_term or "First Term"
+
+    if request.method == "POST":
+        upload = request.FILES.get('file')
+        dry_run = request.POST.get('action') != 'import'
+        context = {'subject_teacher': subject_teacher, 'term': term}
+        if not upload:
+            context['error'] = "Choose a file to import."
+        else:
+            importer = ScoreImport(subject_teacher, term, request.user)
+            try:
+                context['report'] = importer.run(iter_rows(upload, upload.name), dry_run=dry_run)
+            except ValidationError as e:
+                context['error'] = '; '.join(e.messages)
+            else:
+                if not dry_run:
+                    HistoryService.log_user_activity(
+                        request.user,
+                        f"Imported scores — {subject_teacher} {term}",
+                        request.path
+                    )
+        return render(request, 'import-scores-result.html', context)
+
+    return render(request, 'import-scores.html', {
+        'subject_teacher': subject_teacher,
+        'class_obj': subject_teacher.class_name,
+        'term': term,
+        'records': Record.objects.filter(
+            subject=subject_teacher, class_name=subject_teacher.class_name, title=term, logic__isnull=True
+        ).order_by('record_type', 'record_number'),
+    })